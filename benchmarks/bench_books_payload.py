@@ -0,0 +1,193 @@
+"""
+Benchmark: dung lượng tải về và bộ nhớ mỗi cuốn sách của books_service.
+
+So sánh:
+  - Payload đầy đủ của Google Books vs payload chỉ có VOLUME_FIELDS
+  - 1 cuốn sách lưu dạng dict (cách cũ) vs Book (__slots__)
+
+Chạy:
+    python -m benchmarks.bench_books_payload           # dùng dữ liệu mẫu, không cần mạng
+    python -m benchmarks.bench_books_payload --live    # gọi Google Books thật
+"""
+import argparse
+import json
+import sys
+import tracemalloc
+
+from services import http_client
+from services.books_service import GOOGLE_BOOKS_URL, VOLUME_FIELDS, Book
+
+N_BOOKS = 1000
+
+# Một volume mẫu có cấu trúc giống hệt kết quả đầy đủ của Google Books
+SAMPLE_VOLUME = {
+    "kind": "books#volume",
+    "id": "zyTCAlFPjgYC",
+    "etag": "f0zKg75Mx/I",
+    "selfLink": "https://www.googleapis.com/books/v1/volumes/zyTCAlFPjgYC",
+    "volumeInfo": {
+        "title": "The Google Story",
+        "authors": ["David A. Vise", "Mark Malseed"],
+        "publisher": "Random House Digital, Inc.",
+        "publishedDate": "2005-11-15",
+        "description": "Here is the story behind one of the most remarkable Internet successes of our time. " * 6,
+        "industryIdentifiers": [
+            {"type": "ISBN_10", "identifier": "055380457X"},
+            {"type": "ISBN_13", "identifier": "9780553804577"},
+        ],
+        "readingModes": {"text": False, "image": False},
+        "pageCount": 207,
+        "printType": "BOOK",
+        "categories": ["Browsers (Computer programs)"],
+        "averageRating": 3.5,
+        "ratingsCount": 136,
+        "maturityRating": "NOT_MATURE",
+        "allowAnonLogging": False,
+        "contentVersion": "1.1.0.0.preview.2",
+        "panelizationSummary": {"containsEpubBubbles": False, "containsImageBubbles": False},
+        "imageLinks": {
+            "smallThumbnail": "http://books.google.com/books/content?id=zyTCAlFPjgYC&printsec=frontcover&img=1&zoom=5&source=gbs_api",
+            "thumbnail": "http://books.google.com/books/content?id=zyTCAlFPjgYC&printsec=frontcover&img=1&zoom=1&source=gbs_api",
+        },
+        "language": "en",
+        "previewLink": "http://books.google.com/books?id=zyTCAlFPjgYC&printsec=frontcover&dq=google&hl=&cd=1&source=gbs_api",
+        "infoLink": "http://books.google.com/books?id=zyTCAlFPjgYC&dq=google&hl=&source=gbs_api",
+        "canonicalVolumeLink": "https://books.google.com/books/about/The_Google_Story.html?hl=&id=zyTCAlFPjgYC",
+    },
+    "saleInfo": {
+        "country": "US",
+        "saleability": "FOR_SALE",
+        "isEbook": True,
+        "listPrice": {"amount": 11.99, "currencyCode": "USD"},
+        "retailPrice": {"amount": 11.99, "currencyCode": "USD"},
+        "buyLink": "https://play.google.com/store/books/details?id=zyTCAlFPjgYC&rdid=book-zyTCAlFPjgYC&rdot=1&source=gbs_api",
+        "offers": [{
+            "finskyOfferType": 1,
+            "listPrice": {"amountInMicros": 11990000, "currencyCode": "USD"},
+            "retailPrice": {"amountInMicros": 11990000, "currencyCode": "USD"},
+        }],
+    },
+    "accessInfo": {
+        "country": "US",
+        "viewability": "PARTIAL",
+        "embeddable": True,
+        "publicDomain": False,
+        "textToSpeechPermission": "ALLOWED_FOR_ACCESSIBILITY",
+        "epub": {"isAvailable": True, "acsTokenLink": "http://books.google.com/books/download/The_Google_Story-sample-epub.acsm?id=zyTCAlFPjgYC&format=epub&output=acs4_fulfillment_token&dl_type=sample&source=gbs_api"},
+        "pdf": {"isAvailable": True, "acsTokenLink": "http://books.google.com/books/download/The_Google_Story-sample-pdf.acsm?id=zyTCAlFPjgYC&format=pdf&output=acs4_fulfillment_token&dl_type=sample&source=gbs_api"},
+        "webReaderLink": "http://play.google.com/books/reader?id=zyTCAlFPjgYC&hl=&source=gbs_api",
+        "accessViewStatus": "SAMPLE",
+        "quoteSharingAllowed": False,
+    },
+    "searchInfo": {"textSnippet": "Here is the story behind one of the most remarkable Internet successes of our time."},
+}
+
+
+def _parse_mask(mask):
+    """Chuyển chuỗi fields kiểu 'items(id,volumeInfo(title))' thành dict lồng nhau."""
+    pos = 0
+
+    def parse_list():
+        nonlocal pos
+        spec = {}
+        while pos < len(mask) and mask[pos] != ")":
+            start = pos
+            while pos < len(mask) and mask[pos] not in ",()":
+                pos += 1
+            name = mask[start:pos]
+            child = None
+            if pos < len(mask) and mask[pos] == "(":
+                pos += 1
+                child = parse_list()
+                pos += 1  # bỏ ")"
+            spec[name] = child
+            if pos < len(mask) and mask[pos] == ",":
+                pos += 1
+        return spec
+
+    return parse_list()
+
+
+def _project(value, spec):
+    """Giữ lại đúng các trường trong spec (mô phỏng partial response)."""
+    if spec is None:
+        return value
+    if isinstance(value, list):
+        return [_project(v, spec) for v in value]
+    return {k: _project(value[k], child) for k, child in spec.items() if k in value}
+
+
+def _legacy_dict(book):
+    """Cách lưu cũ: 1 dict 12 key cho mỗi cuốn sách."""
+    return {
+        "id": book.id,
+        "title": book.title,
+        "authors": book.authors,
+        "publisher": book.publisher,
+        "published_date": book.published_date,
+        "description": book.description,
+        "page_count": book.page_count,
+        "categories": book.categories,
+        "average_rating": book.average_rating,
+        "thumbnail": book.thumbnail,
+        "preview_link": book.preview_link,
+        "info_link": book.info_link,
+    }
+
+
+def _measure_bytes_offline(n):
+    full = {"kind": "books#volumes", "totalItems": 1000, "items": [SAMPLE_VOLUME] * n}
+    partial = _project(full, _parse_mask(VOLUME_FIELDS))
+    return len(json.dumps(full).encode()), len(json.dumps(partial).encode())
+
+
+def _measure_bytes_live(query, n):
+    session = http_client.get_session()
+    params = {"q": query, "maxResults": n}
+    full = session.get(GOOGLE_BOOKS_URL, params=params, timeout=10)
+    partial = session.get(GOOGLE_BOOKS_URL, params={**params, "fields": VOLUME_FIELDS}, timeout=10)
+    return len(full.content), len(partial.content)
+
+
+def _measure_memory(factory, n):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory(i) for i in range(n)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "lineno"))
+    del objects
+    return total / n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="gọi Google Books thật thay vì dữ liệu mẫu")
+    parser.add_argument("--query", default="subject:fiction")
+    parser.add_argument("--results", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    if args.live:
+        full_bytes, partial_bytes = _measure_bytes_live(args.query, args.results)
+    else:
+        full_bytes, partial_bytes = _measure_bytes_offline(args.results)
+    print(f"Bytes over wire ({args.results} volumes, {'live' if args.live else 'fixture'}):")
+    print(f"  full payload    : {full_bytes:>9,} B")
+    print(f"  fields=...      : {partial_bytes:>9,} B  ({100 * (1 - partial_bytes / full_bytes):.1f}% smaller)")
+
+    # Mỗi object có chuỗi riêng (như dữ liệu thật), không dùng chung 1 object
+    def make_book(i):
+        volume = json.loads(json.dumps(SAMPLE_VOLUME))
+        volume["id"] = f"{volume['id']}{i}"
+        return Book.from_volume(volume)
+
+    dict_size = _measure_memory(lambda i: _legacy_dict(make_book(i)), N_BOOKS)
+    book_size = _measure_memory(make_book, N_BOOKS)
+    print(f"Memory per book ({N_BOOKS} samples, tracemalloc, includes field values):")
+    print(f"  dict (legacy)   : {dict_size:>9,.0f} B")
+    print(f"  Book (__slots__): {book_size:>9,.0f} B  ({100 * (1 - book_size / dict_size):.1f}% smaller)")
+    print(f"  container only  : dict {sys.getsizeof(_legacy_dict(make_book(0)))} B vs Book {sys.getsizeof(make_book(0))} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: số byte server gửi xuống trình duyệt (websocket delta) ở mỗi lần
+chạy script main.py.
+
+Chạy app bằng streamlit.testing (AppTest) và cộng kích thước các ForwardMsg
+mà script tạo ra trong từng lần chạy:
+  - open app:   lần chạy đầu tiên của phiên (có overlay)
+  - rerun:      chạy lại không đổi gì (ví dụ sau khi bấm 1 nút bất kỳ)
+  - open page:  chuyển trang ở sidebar
+
+Chạy (từ thư mục gốc của repo):
+    python -m benchmarks.bench_rerun_payload
+    python -m benchmarks.bench_rerun_payload --top 5
+    python -m benchmarks.bench_rerun_payload --lite     # mở app với ?lite=1
+"""
+import argparse
+import os
+
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.testing.v1 import AppTest
+
+_messages = []   # (kích thước byte, mô tả ngắn) của từng ForwardMsg trong lần chạy hiện tại
+
+
+def _describe(msg):
+    """Mô tả ngắn 1 ForwardMsg: loại element và vài ký tự đầu của nội dung."""
+    kind = msg.WhichOneof("type")
+    if kind != "delta":
+        return kind
+    delta = msg.delta
+    if delta.WhichOneof("type") != "new_element":
+        return f"delta.{delta.WhichOneof('type')}"
+    element = delta.new_element
+    name = element.WhichOneof("type")
+    body = getattr(getattr(element, name), "body", "")
+    preview = " ".join(str(body).split())[:40]
+    return f"{name}: {preview}" if preview else name
+
+
+def _install_counter():
+    enqueue = ForwardMsgQueue.enqueue
+
+    def enqueue_and_count(self, msg):
+        _messages.append((msg.ByteSize(), _describe(msg)))
+        return enqueue(self, msg)
+
+    ForwardMsgQueue.enqueue = enqueue_and_count
+
+
+def _measure(label, action, at, top):
+    _messages.clear()
+    action(at)
+    if at.exception:
+        print(f"{label:<12} (error: {at.exception[0].value})")
+        return
+    total = sum(size for size, _ in _messages)
+    print(f"{label:<12} {total / 1024:>9.1f} KB  {len(_messages):>5} msgs")
+    for size, description in sorted(_messages, reverse=True)[:top]:
+        print(f"{'':<12} {size / 1024:>9.1f} KB  {description}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default="main.py")
+    parser.add_argument("--top", type=int, default=3, help="In ra N message lớn nhất của mỗi lần chạy")
+    parser.add_argument("--lite", action="store_true", help="Mở app ở chế độ lite (?lite=1)")
+    args = parser.parse_args(argv)
+
+    _install_counter()
+    at = AppTest.from_file(os.path.abspath(args.script), default_timeout=60)
+    if args.lite:
+        at.query_params["lite"] = "1"
+
+    print(f"{'run':<12} {'payload':>12}  {'count':>5}")
+    _measure("open app", lambda at: at.run(), at, args.top)
+    _measure("rerun", lambda at: at.run(), at, args.top)
+    _measure("open page", lambda at: at.sidebar.radio[0].set_value("📜 History").run(), at, args.top)
+
+
+if __name__ == "__main__":
+    main()
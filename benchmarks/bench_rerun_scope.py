@@ -0,0 +1,197 @@
+"""
+Benchmark: mỗi thao tác của người dùng làm chạy lại bao nhiêu lần toàn bộ
+script main.py và gọi ra ngoài (Jikan, Gemini) bao nhiêu lần.
+
+Chạy app bằng streamlit.testing (AppTest), API ngoài được thay bằng dữ liệu
+mẫu có đếm số lần gọi, nên không cần mạng hay API key.
+  - full runs: số lần cả script chạy lại (kèm overlay, CSS, ảnh nền, logo)
+  - upstream: số lời gọi Jikan / Gemini phát sinh
+
+Chạy:
+    python -m benchmarks.bench_rerun_scope
+    # So sánh với phiên bản trước khi tách fragment:
+    git show <commit>:main.py > main_before.py
+    python -m benchmarks.bench_rerun_scope --script main_before.py
+"""
+import argparse
+import os
+from collections import Counter
+
+from streamlit.runtime.fragment import MemoryFragmentStorage
+from streamlit.runtime.scriptrunner import RerunData
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import local_script_runner
+
+import styles_css
+from services import gemini_service, jikan_async, jikan_service
+
+CHARACTERS = [
+    {
+        "mal_id": 1000 + i,
+        "name": f"Character {i}",
+        "name_kanji": "キャラ",
+        "nicknames": [],
+        "favorites": 500 - i,
+        "about": "A brave hero of the village.",
+        "images": {"jpg": {"image_url": f"https://example.com/{i}.jpg"}},
+    }
+    for i in range(10)
+]
+
+counts = Counter()
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModel:
+    def generate_content(self, contents, stream=False, **kwargs):
+        counts["gemini"] += 1
+        chunks = [_Chunk("Hồ sơ "), _Chunk("nhân vật.")]
+        return iter(chunks) if stream else chunks[0]
+
+
+def _install_fakes():
+    def search_characters(name, limit):
+        counts["jikan"] += 1
+        return CHARACTERS[:limit]
+
+    def get_character_details(mal_id, wait=0):
+        counts["jikan"] += 1
+        return next((c for c in CHARACTERS if c["mal_id"] == mal_id), None)
+
+    original_background = styles_css.set_background_image
+
+    def set_background_image(*args, **kwargs):
+        counts["full_runs"] += 1
+        return original_background(*args, **kwargs)
+
+    jikan_service._search_characters = search_characters
+    jikan_async.get_character_details = get_character_details
+    jikan_async.prefetch_character_details = lambda mal_ids: None
+    gemini_service._models[gemini_service.GEMINI_MODEL] = _FakeModel()
+    gemini_service._analysis_cache.get = lambda key: None   # luôn tính là chưa có trong cache
+    styles_css.set_background_image = set_background_image
+
+
+# ===== Chạy lại theo fragment =====
+# AppTest luôn chạy lại cả script. Trình duyệt thì khác: bấm widget nằm trong
+# 1 fragment sẽ gửi kèm fragment id và server chỉ chạy lại fragment đó.
+# Ở đây ghi lại id của từng fragment khi nó được đăng ký, rồi gửi kèm id đó
+# cho lần chạy kế tiếp giống như trình duyệt.
+_fragment_ids = {}     # tên hàm fragment -> fragment id (lần đăng ký gần nhất)
+_fragment_queue = []   # fragment cần chạy lại ở lần chạy kế tiếp (rỗng = cả script)
+
+
+def _install_fragment_reruns():
+    register = MemoryFragmentStorage.register
+
+    def register_and_record(self, key, fragment, **kwargs):
+        for cell in fragment.__closure__ or ():
+            func = cell.cell_contents
+            if callable(func) and getattr(func, "__module__", None) == "__main__":
+                _fragment_ids[func.__name__] = key
+        return register(self, key, fragment, **kwargs)
+
+    MemoryFragmentStorage.register = register_and_record
+    local_script_runner.RerunData = lambda **kwargs: RerunData(**kwargs, fragment_id_queue=list(_fragment_queue))
+
+
+def _button(at, key=None, label=None):
+    for button in at.button:
+        if (key and button.key and button.key.startswith(key)) or (label and button.label == label):
+            return button
+    raise LookupError(key or label)
+
+
+def _click(key=None, label=None, fragment=None):
+    """Bấm nút; nếu nút nằm trong `fragment` (và script có fragment đó) thì chỉ chạy lại fragment."""
+    def action(at):
+        button = _button(at, key=key, label=label)
+        _fragment_queue[:] = [_fragment_ids[fragment]] if fragment in _fragment_ids else []
+        try:
+            button.click().run()
+        finally:
+            _fragment_queue.clear()
+    return action
+
+
+def _search(at):
+    at.text_input[0].input("character")
+    _button(at, label="🔍 Search").click()
+    at.run()
+
+
+def _open_page(label):
+    return lambda at: at.sidebar.radio[0].set_value(label).run()
+
+
+def _set_state(**values):
+    def action(at):
+        for name, value in values.items():
+            at.session_state[name] = value
+    return action
+
+
+FAVORITE = {"id": 1000, "name": "Character 0", "image": "https://example.com/0.jpg", "favorites": 500}
+HISTORY = [{"timestamp": "2026-01-01 00:00:00", "type": "character_text", "query": "character", "result": "Character 0"}]
+
+
+def _scenarios():
+    """
+    Mỗi kịch bản: (tên, các bước chuẩn bị, thao tác được đo).
+    Bước chuẩn bị chạy cả script và không được tính.
+    """
+    return [
+        ("open app", [], lambda at: at.run()),
+        ("search 'character'", [lambda at: at.run()], _search),
+        ("select a character", [lambda at: at.run(), _search],
+         _click(key="select_char_1000", fragment="character_browser")),
+        ("add to favorites", [lambda at: at.run(), _search, _click(key="select_char_1000")],
+         _click(key="fav_char_1000", fragment="favorite_button")),
+        ("choose another", [lambda at: at.run(), _search, _click(key="select_char_1000")],
+         _click(label="⬅️ Choose Another Character", fragment="character_browser")),
+        ("open Favorites page", [lambda at: at.run()], _open_page("❤️ Favorites")),
+        ("remove favorite", [_set_state(favorites={"characters": [dict(FAVORITE)]}), lambda at: at.run(), _open_page("❤️ Favorites")],
+         _click(key="remove_fav_1000", fragment="favorites_grid")),
+        ("open History page", [lambda at: at.run()], _open_page("📜 History")),
+        ("clear history", [_set_state(search_history=list(HISTORY)), lambda at: at.run(), _open_page("📜 History")],
+         _click(label="🗑️ Clear History", fragment="history_list")),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default="main.py")
+    args = parser.parse_args(argv)
+
+    _install_fakes()
+    _install_fragment_reruns()
+    script = os.path.abspath(args.script)
+
+    print(f"{'action':<22} {'full runs':>9} {'jikan':>6} {'gemini':>7}")
+    totals = Counter()
+    for name, setup, action in _scenarios():
+        at = AppTest.from_file(script, default_timeout=60)
+        try:
+            for step in setup:
+                step(at)
+            before = Counter(counts)
+            action(at)
+        except LookupError as e:
+            print(f"{name:<22} (skipped: widget {e} not found)")
+            continue
+        if at.exception:
+            print(f"{name:<22} (error: {at.exception[0].value})")
+            continue
+        delta = Counter(counts)
+        delta.subtract(before)
+        totals.update(delta)
+        print(f"{name:<22} {delta['full_runs']:>9} {delta['jikan']:>6} {delta['gemini']:>7}")
+    print(f"{'total':<22} {totals['full_runs']:>9} {totals['jikan']:>6} {totals['gemini']:>7}")
+
+
+if __name__ == "__main__":
+    main()
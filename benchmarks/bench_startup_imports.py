@@ -0,0 +1,65 @@
+"""
+Benchmark: thời gian import lúc khởi động của gemini_service.
+
+Mỗi lần đo chạy trong 1 process Python mới (cache import trống), so sánh:
+  - import services.gemini_service (SDK Gemini và dotenv chỉ import khi dùng AI)
+  - phần trước đây bị trả ngay lúc khởi động: google.generativeai + dotenv
+  - lần gọi AI đầu tiên: get_model() (import SDK + tạo model)
+
+Chạy:
+    python -m benchmarks.bench_startup_imports
+    python -m benchmarks.bench_startup_imports --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Script chạy trong process con, in ra JSON các mốc thời gian (giây)
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+{setup}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "sdk_loaded": "google.generativeai" in sys.modules}}))
+"""
+
+CASES = {
+    "import gemini_service (lazy)": "import services.gemini_service",
+    "google.generativeai + dotenv (eager cost)": "import google.generativeai\nimport dotenv",
+    "gemini_service + get_model()": (
+        "import os\nos.environ.setdefault('GEMINI_API_KEY', 'benchmark-key')\n"
+        "import services.gemini_service as g\ng.get_model()"
+    ),
+}
+
+
+def _run_case(code, cache_dir):
+    env = {**os.environ, "ITOOK_CACHE_DIR": cache_dir, "PYTHONWARNINGS": "ignore"}
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(setup=code)],
+        capture_output=True, text=True, env=env, check=True,
+    ).stdout
+    # Streamlit có thể in cảnh báo khi chạy ngoài `streamlit run`: lấy dòng JSON cuối
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print(f"Cold import time, median of {args.runs} fresh processes:")
+        for label, code in CASES.items():
+            samples = [_run_case(code, cache_dir) for _ in range(args.runs)]
+            median_ms = statistics.median(s["seconds"] for s in samples) * 1000
+            sdk = "yes" if samples[-1]["sdk_loaded"] else "no"
+            print(f"  {label:<45} {median_ms:>8.1f} ms   (Gemini SDK loaded: {sdk})")
+
+
+if __name__ == "__main__":
+    main()
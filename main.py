@@ -1,38 +1,23 @@
 import streamlit as st
 from PIL import Image
-import requests 
 from datetime import datetime
-import json
-import re
-import os
+import itertools
+import time
 
 # Import services
-from services.genre_service import get_genre_map 
+from services.genre_service import get_genre_map, prewarm_genre_maps
 from services.jikan_service import get_character_data, get_one_character_data
-from services.gemini_service import ai_vision_detect, ai_analyze_profile
-from services.books_service import search_books_by_genre, search_books_by_keyword, get_book_genres
-
-# Import Gemini
-import google.generativeai as genai
-
-# ===== CẤU HÌNH GEMINI - HỖ TRỢ CẢ LOCAL VÀ STREAMLIT CLOUD =====
-def get_api_key():
-    """Lấy API key từ Streamlit secrets hoặc .env"""
-    try:
-        # Thử lấy từ Streamlit secrets trước (cho Streamlit Cloud)
-        if hasattr(st, 'secrets') and "GEMINI_API_KEY" in st.secrets:
-            return st.secrets["GEMINI_API_KEY"]
-    except:
-        pass
-    
-    # Nếu không có, lấy từ environment variable (cho local)
-    return os.getenv("GEMINI_API_KEY")
-
-GEMINI_API_KEY = get_api_key()
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    st.error("⚠️ Không tìm thấy GEMINI_API_KEY! Vui lòng cấu hình trong Streamlit Secrets hoặc file .env")
+from services.jikan_async import PREFETCH_TOP_N, get_character_details, prefetch_character_details
+from services.name_index import normalize_name, resolve_character, suggest_names
+from services.gemini_service import ai_vision_detect, ai_analyze_profile_stream, gemini_generate, get_gemini_breaker_state, get_gemini_limiter_stats, get_model
+from services.books_service import iter_books_by_genre, search_books_by_any_genre, get_book_genres
+from services.json_stream import iter_json_array_objects
+from services.image_proxy import get_thumbnail, get_thumbnails, prefetch_thumbnails, record_grid_paint
+from services.lite_mode import detect_lite_mode, jikan_image_url
+from services.media_service import enrich_recommendation_async, search_media_by_genres
+
+# Tải trước danh sách thể loại ở nền (chỉ chạy 1 lần mỗi process)
+prewarm_genre_maps()
 
 # ===== KHỞI TẠO SESSION STATE =====
 if 'favorites' not in st.session_state:
@@ -59,14 +44,34 @@ if 'last_search_query' not in st.session_state:
 if 'recommendations' not in st.session_state:
     st.session_state.recommendations = None
 
+if 'recommendation_contents' not in st.session_state:
+    st.session_state.recommendation_contents = []
+
 if 'current_content_type' not in st.session_state:
     st.session_state.current_content_type = "anime"
 
+if 'book_browser' not in st.session_state:
+    st.session_state.book_browser = None
+
+# Chế độ lite (?lite=1, ITOOK_LITE_MODE hoặc tự bật khi server tải nặng):
+# quyết định 1 lần lúc mở phiên để giao diện không đổi qua lại giữa chừng
+if 'lite_mode' not in st.session_state:
+    st.session_state.lite_mode = detect_lite_mode(st.query_params.get("lite"))
+
 # Link mua hàng
 PURCHASE_LINK = "https://your-store-link.com"
 
+# Số sách hiển thị thêm mỗi lần bấm "Load more"
+BOOKS_PER_LOAD = 10
+
+# Chế độ kết hợp nhiều thể loại ở trang Discover Media
+MATCH_ALL_GENRES = "All genres"
+MATCH_ANY_GENRE = "Any genre"
+
 # ===== LOADING ANIMATION =====
-st.markdown("""
+# Chỉ hiện ở lần chạy đầu tiên của mỗi phiên (không hiện ở chế độ lite);
+# các lần chạy lại không gửi lại overlay
+LOADING_OVERLAY_HTML = """
 <style>
     .loading-overlay {
         position: fixed;
@@ -141,50 +146,6 @@ st.markdown("""
             filter: blur(0px);
         }
     }
-    
-    [data-testid="column"] {
-        padding: 0 15px !important;
-    }
-    
-    [data-testid="stImage"] {
-        margin-bottom: 15px !important;
-    }
-    
-    .purchase-button {
-        position: fixed;
-        bottom: 30px;
-        right: 30px;
-        z-index: 9998;
-        animation: pulse 2s infinite;
-    }
-    
-    @keyframes pulse {
-        0%, 100% {
-            transform: scale(1);
-        }
-        50% {
-            transform: scale(1.05);
-        }
-    }
-    
-    .purchase-button a {
-        display: inline-block;
-        padding: 15px 30px;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white !important;
-        text-decoration: none;
-        border-radius: 50px;
-        font-size: 1.1rem;
-        font-weight: bold;
-        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.4);
-        transition: all 0.3s ease;
-    }
-    
-    .purchase-button a:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 8px 25px rgba(102, 126, 234, 0.6);
-        background: linear-gradient(135deg, #764ba2 0%, #667eea 100%);
-    }
 </style>
 
 <div class="loading-overlay">
@@ -206,7 +167,11 @@ st.markdown("""
         if (progress >= 100) clearInterval(interval);
     }, 40);
 </script>
-""", unsafe_allow_html=True)
+"""
+
+if not st.session_state.lite_mode and not st.session_state.get('intro_shown'):
+    st.markdown(LOADING_OVERLAY_HTML, unsafe_allow_html=True)
+    st.session_state.intro_shown = True
 
 # ===== NÚT MUA HÀNG =====
 st.markdown(f"""
@@ -218,12 +183,21 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # ===== CẤU HÌNH TRANG =====
-chitoge_icon = Image.open("itooklogo.jpg")
-st.set_page_config(page_title="ITook Library", page_icon=chitoge_icon, layout="wide")
+from styles_css import LOGO_FILE, set_background_image, add_corner_gif
+from services.static_assets import publish_favicon
+
+
+@st.cache_resource(show_spinner=False)
+def get_page_icon():
+    """Favicon 64px build sẵn vào static/ (1 lần mỗi process), lỗi thì dùng logo gốc."""
+    return publish_favicon(LOGO_FILE) or LOGO_FILE
+
 
-from styles_css import set_background_image, add_corner_gif
-set_background_image("utsuro.webp")
-add_corner_gif()
+st.set_page_config(page_title="ITook Library", page_icon=get_page_icon(), layout="wide")
+
+set_background_image("utsuro.webp", lite=st.session_state.lite_mode)
+if not st.session_state.lite_mode:
+    add_corner_gif()
 
 # ===== HELPER FUNCTIONS =====
 def add_to_favorites(item_type, item_data):
@@ -253,14 +227,37 @@ def add_to_history(search_type, query, result=None):
     if len(st.session_state.search_history) > 50:
         st.session_state.search_history = st.session_state.search_history[:50]
 
-def get_ai_recommendations(age, interests, mood, reading_style, content_type):
-    """Lấy gợi ý từ AI dựa trên thông tin người dùng"""
-    
-    if not GEMINI_API_KEY:
-        st.error("Không thể sử dụng AI Recommend - thiếu API key!")
-        return None
-    
-    prompt = f"""
+def search_characters(query):
+    """Tìm nhân vật theo tên và lưu kết quả vào session (dùng cho form và nút gợi ý)"""
+    results = get_character_data(query)
+    st.session_state.last_search_query = query
+    if results:
+        # Tải trước chi tiết các ứng viên đầu lưới trong lúc người dùng đang chọn
+        prefetch_character_details([char['mal_id'] for char in results[:PREFETCH_TOP_N]])
+        # Tải song song mọi ảnh của lưới và ảnh lớn của các ứng viên đầu lưới
+        prefetch_thumbnails([jikan_image_url(char['images'], st.session_state.lite_mode) for char in results])
+        prefetch_thumbnails([char['images']['jpg']['image_url'] for char in results[:PREFETCH_TOP_N]], "large")
+        st.session_state.grid_started_at = time.perf_counter()
+        st.session_state.search_results = results
+        st.session_state.show_character_list = True
+        st.session_state.selected_character = None
+    else:
+        st.session_state.show_character_list = False
+    return results
+
+def load_more_books(count=BOOKS_PER_LOAD):
+    """Lấy thêm sách từ generator đang duyệt (không tải lại các trang trước)"""
+    browser = st.session_state.book_browser
+    if not browser or browser['exhausted']:
+        return
+    more = list(itertools.islice(browser['iterator'], count))
+    browser['books'].extend(more)
+    if len(more) < count:
+        browser['exhausted'] = True
+
+def build_recommendation_prompt(age, interests, mood, reading_style, content_type):
+    """Tạo prompt gợi ý dựa trên thông tin người dùng"""
+    return f"""
 Bạn là chuyên gia tư vấn sách và anime. Dựa trên thông tin sau:
 - Độ tuổi: {age}
 - Sở thích: {interests}
@@ -279,41 +276,351 @@ Hãy đề xuất 5 {content_type} phù hợp. Trả về ĐÚNG format JSON nà
 
 CHỈ trả về JSON array, không giải thích gì thêm.
 """
+
+# Gợi ý tĩnh dùng khi Gemini lỗi hoặc đang bị ngắt (circuit breaker mở)
+FALLBACK_RECOMMENDATIONS = {
+    "anime": [
+        {"title": "Fullmetal Alchemist: Brotherhood", "reason": "Một trong những anime được đánh giá cao nhất mọi thời đại, hợp với hầu hết người xem.", "genre": "Action, Adventure, Fantasy", "search_keyword": "Fullmetal Alchemist Brotherhood"},
+        {"title": "Steins;Gate", "reason": "Câu chuyện du hành thời gian chặt chẽ, càng xem càng cuốn.", "genre": "Sci-Fi, Thriller", "search_keyword": "Steins;Gate"},
+        {"title": "Spirited Away", "reason": "Phim điện ảnh kinh điển của Ghibli, nhẹ nhàng mà sâu sắc.", "genre": "Fantasy, Adventure", "search_keyword": "Sen to Chihiro no Kamikakushi"},
+        {"title": "Haikyuu!!", "reason": "Thể thao sôi động, nhân vật dễ mến và rất truyền cảm hứng.", "genre": "Sports, Comedy", "search_keyword": "Haikyuu!!"},
+        {"title": "Violet Evergarden", "reason": "Hình ảnh đẹp và cảm xúc, phù hợp khi muốn xem điều gì đó nhẹ nhàng.", "genre": "Drama, Fantasy", "search_keyword": "Violet Evergarden"},
+    ],
+    "manga": [
+        {"title": "One Piece", "reason": "Hành trình phiêu lưu dài hơi với thế giới rộng lớn và tình bạn đáng nhớ.", "genre": "Action, Adventure", "search_keyword": "One Piece"},
+        {"title": "Vagabond", "reason": "Nét vẽ tuyệt đẹp và câu chuyện trưởng thành đầy chiêm nghiệm.", "genre": "Action, Drama", "search_keyword": "Vagabond"},
+        {"title": "Monster", "reason": "Trinh thám tâm lý hồi hộp, khó đoán đến tận cuối.", "genre": "Mystery, Thriller", "search_keyword": "Monster"},
+        {"title": "Yotsuba&!", "reason": "Hài hước, ấm áp, đọc lúc nào cũng thấy vui.", "genre": "Comedy, Slice of Life", "search_keyword": "Yotsuba to!"},
+        {"title": "Berserk", "reason": "Dark fantasy kinh điển với thế giới và nhân vật rất ấn tượng.", "genre": "Dark Fantasy", "search_keyword": "Berserk"},
+    ],
+    "books": [
+        {"title": "The Little Prince", "reason": "Ngắn gọn, giàu ý nghĩa, hợp với mọi lứa tuổi.", "genre": "Fiction", "search_keyword": "The Little Prince Saint-Exupery"},
+        {"title": "Sapiens", "reason": "Góc nhìn thú vị về lịch sử loài người, dễ đọc và gợi nhiều suy nghĩ.", "genre": "Non-Fiction, History", "search_keyword": "Sapiens Yuval Noah Harari"},
+        {"title": "The Hobbit", "reason": "Chuyến phiêu lưu kỳ ảo nhẹ nhàng, cửa ngõ vào thế giới Tolkien.", "genre": "Fantasy", "search_keyword": "The Hobbit Tolkien"},
+        {"title": "Atomic Habits", "reason": "Lời khuyên thực tế để xây dựng thói quen tốt.", "genre": "Self-Help", "search_keyword": "Atomic Habits James Clear"},
+        {"title": "The Name of the Wind", "reason": "Tiểu thuyết giả tưởng giàu cảm xúc với lối kể chuyện cuốn hút.", "genre": "Fantasy", "search_keyword": "The Name of the Wind Rothfuss"},
+    ],
+}
+
+# JSON mode của Gemini: câu trả lời luôn là array đúng cấu trúc này
+RECOMMENDATION_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "reason": {"type": "string"},
+            "genre": {"type": "string"},
+            "search_keyword": {"type": "string"}
+        },
+        "required": ["title", "reason", "genre", "search_keyword"]
+    }
+}
+RECOMMENDATION_CONFIG = {"response_mime_type": "application/json", "response_schema": RECOMMENDATION_SCHEMA}
+
+def stream_ai_recommendations(age, interests, mood, reading_style, content_type):
+    """Lấy gợi ý từ AI dựa trên thông tin người dùng, yield từng gợi ý (dict) ngay khi AI viết xong gợi ý đó"""
+    if not get_model():
+        st.error("Không thể sử dụng AI Recommend - thiếu API key!")
+        return
+    
+    prompt = build_recommendation_prompt(age, interests, mood, reading_style, content_type)
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        response_text = response.text
+        response = gemini_generate(prompt, stream=True, generation_config=RECOMMENDATION_CONFIG)
+        yield from iter_json_array_objects(chunk.text for chunk in response)
+    except Exception as e:
+        # Trang gợi ý sẽ dùng FALLBACK_RECOMMENDATIONS
+        print(f"AI Error: {e}")
+
+def render_recommendation_card(idx, rec, content, content_type):
+    """Hiển thị 1 thẻ gợi ý (content = None nếu chưa/không tìm được thông tin)"""
+    st.markdown(f"### {idx + 1}. {rec['title']}")
+    
+    col1, col2 = st.columns([1, 2])
+    
+    with col1:
+        if content:
+            if content_type in ["anime", "manga"]:
+                img_url = jikan_image_url(content.get('images'), st.session_state.lite_mode)
+                if img_url:
+                    st.image(get_thumbnail(img_url, "card"), use_container_width=True)
+                st.write(f"⭐ **Score:** {content.get('score', 'N/A')}")
+                if content_type == "anime":
+                    st.write(f"📺 **Episodes:** {content.get('episodes', 'N/A')}")
+                else:
+                    st.write(f"📖 **Chapters:** {content.get('chapters', 'N/A')}")
+            else:
+                if content.thumbnail:
+                    st.image(get_thumbnail(content.cover_url(st.session_state.lite_mode), "card"), use_container_width=True)
+                st.write(f"✏️ **Author:** {', '.join(content.authors)}")
+                if content.average_rating != 'N/A':
+                    st.write(f"⭐ **Rating:** {content.average_rating}")
+    
+    with col2:
+        st.markdown(f"**🎭 Genre:** {rec.get('genre', 'N/A')}")
+        st.markdown("**💡 Why perfect for you:**")
+        st.info(rec.get('reason', ''))
         
-        # Tìm JSON trong response
-        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if json_match:
-            recommendations = json.loads(json_match.group())
-            return recommendations
+        if content:
+            if content_type in ["anime", "manga"]:
+                synopsis = content.get('synopsis', 'No description')
+                if synopsis and len(synopsis) > 300:
+                    synopsis = synopsis[:300] + "..."
+                st.markdown("**📄 Synopsis:**")
+                st.write(synopsis)
+                st.markdown(f"[🔗 View on MyAnimeList]({content.get('url', '#')})")
+            else:
+                description = content.description
+                if len(description) > 300:
+                    description = description[:300] + "..."
+                st.markdown("**📄 Description:**")
+                st.write(description)
+                st.markdown(f"[🔗 Preview Book]({content.preview_link})")
+    
+    st.markdown("---")
+
+def render_ai_report(info):
+    """Hiển thị báo cáo AI, stream từng đoạn ngay khi Gemini viết xong"""
+    report = st.empty()
+    with report.container():
+        ai_text = st.write_stream(ai_analyze_profile_stream(info))
+    report.success(ai_text, icon="📄")
+    return ai_text
+
+# ===== FRAGMENTS =====
+# Bấm nút bên trong 1 fragment chỉ chạy lại fragment đó, không chạy lại cả
+# script (overlay, CSS, ảnh nền, logo và các đoạn gọi mạng của trang)
+
+@st.fragment
+def favorite_button(info, key):
+    """Nút thêm nhân vật vào favorites"""
+    if st.button("❤️ Add to Favorites", key=key, use_container_width=True):
+        success = add_to_favorites('characters', {
+            'id': info['mal_id'],
+            'name': info['name'],
+            'image': info['images']['jpg']['image_url'],
+            'thumbnail': jikan_image_url(info['images'], lite=True),
+            'favorites': info['favorites']
+        })
+        if success:
+            st.success("✅ Added to favorites!")
         else:
-            return None
-    except Exception as e:
-        st.error(f"AI Error: {e}")
-        return None
+            st.warning("⚠️ Already in favorites!")
 
-def search_content_by_keyword(keyword, content_type):
-    """Tìm kiếm anime/manga/books theo keyword"""
-    if content_type in ["anime", "manga"]:
-        url = f"https://api.jikan.moe/v4/{content_type}?q={keyword}&limit=1"
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get('data', [])
-                if results:
-                    return results[0]
-        except:
-            pass
-    else:  # books
-        books = search_books_by_keyword(keyword, max_results=1)
-        if books:
-            return books[0]
-    return None
+def render_character_card(info, favorite_key):
+    """Thẻ nhân vật: ảnh, số favorites, nút yêu thích và báo cáo AI"""
+    st.subheader(f"📋 Profile: {info['name']}")
+    
+    col_a, col_b = st.columns([1, 2])
+    
+    with col_a:
+        st.image(get_thumbnail(info['images']['jpg']['image_url'], "large"), use_container_width=True)
+        st.metric("Favorites", info['favorites'])
+        favorite_button(info, favorite_key)
+    
+    with col_b:
+        st.write(f"**Japanese name:** {info.get('name_kanji', 'N/A')}")
+        st.markdown("### 📄 AI Analysis Report")
+        render_ai_report(info)
+
+def select_character(char):
+    """Chọn 1 nhân vật trong lưới kết quả (dùng bản chi tiết nếu đã tải trước)"""
+    selected = get_character_details(char['mal_id']) or char
+    prefetch_thumbnails([selected['images']['jpg']['image_url']], "large")
+    st.session_state.selected_character = selected
+    add_to_history('character_text', st.session_state.last_search_query, selected['name'])
+
+def clear_selected_character():
+    st.session_state.selected_character = None
+
+@st.fragment
+def character_browser():
+    """Gợi ý tên, lưới kết quả và thẻ nhân vật đã chọn của trang tìm kiếm"""
+    # Gợi ý tên từ chỉ mục cục bộ (không gọi mạng)
+    if st.session_state.last_search_query and not st.session_state.selected_character:
+        query_key = normalize_name(st.session_state.last_search_query)
+        suggestions = [
+            record for record in suggest_names(st.session_state.last_search_query, limit=6)
+            if normalize_name(record['name']) != query_key
+        ][:5]
+        if suggestions:
+            st.caption("💡 Did you mean:")
+            suggestion_cols = st.columns(len(suggestions))
+            for col, record in zip(suggestion_cols, suggestions):
+                col.button(
+                    record['name'],
+                    key=f"suggest_{record['mal_id']}",
+                    on_click=search_characters,
+                    args=(record['name'],),
+                    use_container_width=True
+                )
+    
+    if st.session_state.selected_character:
+        info = st.session_state.selected_character
+        
+        st.button("⬅️ Choose Another Character", on_click=clear_selected_character, use_container_width=True)
+        
+        st.markdown("---")
+        render_character_card(info, f"fav_char_{info['mal_id']}_main")
+    
+    elif st.session_state.show_character_list and st.session_state.search_results:
+        st.markdown("---")
+        st.markdown("**📋 Multiple results found. Choose your character to analyze:**")
+        
+        results = st.session_state.search_results
+        thumbnails = get_thumbnails([jikan_image_url(char['images'], st.session_state.lite_mode) for char in results])
+        started = st.session_state.pop('grid_started_at', None)
+        if started is not None:
+            # Chỉ đo lần vẽ đầu tiên sau khi có kết quả tìm kiếm
+            record_grid_paint(time.perf_counter() - started, thumbnails)
+        
+        cols = st.columns(5, gap="large")
+        for idx, char in enumerate(results):
+            with cols[idx % 5]:
+                st.image(thumbnails[idx], use_container_width=True)
+                
+                st.button(
+                    f"{char['name']}", 
+                    key=f"select_char_{char['mal_id']}_{idx}",
+                    on_click=select_character,
+                    args=(char,),
+                    use_container_width=True
+                )
+
+@st.fragment
+def recommendation_cards():
+    """Các thẻ gợi ý AI đã lưu trong session"""
+    st.markdown("---")
+    st.success(f"### 🎯 Perfect Matches For You!")
+    
+    contents = st.session_state.recommendation_contents
+    for idx, rec in enumerate(st.session_state.recommendations):
+        content = contents[idx] if idx < len(contents) else None
+        with st.container():
+            render_recommendation_card(idx, rec, content, st.session_state.current_content_type)
+
+@st.fragment
+def book_results():
+    """Danh sách sách đang duyệt và nút Load more"""
+    browser = st.session_state.book_browser
+    if not browser:
+        return
+    books = browser['books']
+    if not books:
+        st.warning("No books found")
+        return
+    
+    st.success(f"✅ Found {len(books)} books!")
+    
+    covers = get_thumbnails([book.cover_url(st.session_state.lite_mode) for book in books])
+    for book, cover in zip(books, covers):
+        with st.expander(f"📖 {book.title}"):
+            col1, col2 = st.columns([1, 3])
+            
+            with col1:
+                if cover:
+                    st.image(cover, use_container_width=True)
+            
+            with col2:
+                st.write(f"**Author:** {', '.join(book.authors)}")
+                st.write(f"**Publisher:** {book.publisher}")
+                st.write(f"**Published:** {book.published_date}")
+                
+                if book.average_rating != 'N/A':
+                    st.write(f"**Rating:** {book.average_rating} ⭐")
+                
+                description = book.description
+                if len(description) > 300:
+                    description = description[:300] + "..."
+                st.write(f"**Description:** {description}")
+                
+                if book.preview_link:
+                    st.markdown(f"[🔗 Preview]({book.preview_link})")
+    
+    if not browser['exhausted']:
+        st.button("⬇️ Load more", on_click=load_more_books, use_container_width=True)
+
+def remove_from_favorites(char_id):
+    st.session_state.favorites['characters'] = [
+        char for char in st.session_state.favorites['characters'] if char.get('id') != char_id
+    ]
+
+@st.fragment
+def favorites_grid():
+    """Lưới nhân vật yêu thích (xóa 1 nhân vật chỉ vẽ lại lưới này)"""
+    fav_chars = st.session_state.favorites.get('characters', [])
+
+    if not fav_chars:
+        st.info("You haven't added any characters to your favorites yet. Go find your waifu!")
+    else:
+        st.success(f"You have {len(fav_chars)} favorite characters!")
+
+        lite = st.session_state.lite_mode
+        images = get_thumbnails([(lite and char.get('thumbnail')) or char['image'] for char in fav_chars])
+        
+        cols = st.columns(4, gap="large")
+        for idx, char in enumerate(fav_chars):
+            with cols[idx % 4]:
+                st.image(images[idx], use_container_width=True, caption=char['name'])
+                st.write(f"**{char['name']}**")
+                st.write(f"⭐ {char['favorites']} Favorites")
+                
+                st.button(
+                    "🗑️ Remove",
+                    key=f"remove_fav_{char['id']}",
+                    on_click=remove_from_favorites,
+                    args=(char['id'],),
+                    use_container_width=True
+                )
+    
+    st.markdown("---")
+    st.markdown(f"**Total Favorites:** {len(fav_chars)}")
+
+def clear_history():
+    st.session_state.search_history = []
+
+@st.fragment
+def history_list():
+    """Danh sách lịch sử tìm kiếm"""
+    history = st.session_state.search_history
+
+    if not history:
+        st.info("No search history yet.")
+        return
+    
+    st.markdown(f"**Total entries:** {len(history)}")
+    
+    st.button("🗑️ Clear History", type="secondary", on_click=clear_history)
+
+    st.markdown("---")
+
+    for entry in history:
+        with st.expander(f"[{entry['timestamp']}] - **{entry['type'].upper().replace('_', ' ')}**"):
+            st.write(f"**Query:** `{entry['query']}`")
+            if entry['result']:
+                st.write(f"**Result:** {entry['result']}")
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+@st.fragment(run_every=5)
+def diagnostics_panel():
+    """Bảng theo dõi cho người vận hành (mở bằng ?debug=1): circuit breaker và hàng đợi Gemini"""
+    breaker = get_gemini_breaker_state()
+    limiter = get_gemini_limiter_stats()
+    wait = limiter['wait']
+    with st.expander("🩺 Diagnostics"):
+        st.markdown("**Gemini breaker**")
+        state = {"closed": "🟢 closed", "half_open": "🟡 half-open", "open": "🔴 open"}[breaker['state']]
+        st.write(f"State: {state} · Consecutive failures: {breaker['consecutive_failures']}")
+        if breaker['state'] == "open":
+            st.write(f"Retry in: {breaker['retry_in']}s · Rejected: {breaker['rejected']}")
+        st.markdown("**Gemini queue**")
+        st.write(f"Running: {limiter['active']}/{limiter['max_concurrent']} · Queued: {limiter['queued']}")
+        st.write(f"Rejected: {limiter['rejected']} · Timed out: {limiter['timed_out']}")
+        st.write(f"Wait p50 / p95 / max: {_format_seconds(wait['p50'])} / "
+                 f"{_format_seconds(wait['p95'])} / {_format_seconds(wait['max'])}")
 
 # ===== SIDEBAR MENU =====
 with st.sidebar:
@@ -355,6 +662,9 @@ with st.sidebar:
     st.markdown("---")
     st.info("**A-I-T Model - Tứ Đại Bổ Ách**")
 
+    if st.query_params.get("debug") == "1":
+        diagnostics_panel()
+
 # ===== MAIN CONTENT =====
 st.title("🎌 ITOOK LIBRARY - Find Your Characters & Books 🌸")
 st.markdown("---")
@@ -373,71 +683,10 @@ if st.session_state.current_page == "Search Character":
         submit_button = st.form_submit_button("🔍 Search", use_container_width=True)
     
     if submit_button and search_query:
-        results = get_character_data(search_query)
-        if results:
-            st.session_state.search_results = results
-            st.session_state.show_character_list = True
-            st.session_state.selected_character = None
-            st.session_state.last_search_query = search_query
-        else:
+        if not search_characters(search_query):
             st.warning("No character found!")
-            st.session_state.show_character_list = False
     
-    if st.session_state.selected_character:
-        info = st.session_state.selected_character
-        
-        if st.button("⬅️ Choose Another Character", use_container_width=True):
-            st.session_state.selected_character = None
-            st.rerun()
-        
-        st.markdown("---")
-        
-        with st.spinner(f"Loading the profile of {info['name']}..."):
-            ai_text = ai_analyze_profile(info)
-            add_to_history('character_text', st.session_state.last_search_query, info['name'])
-            
-            st.subheader(f"📋 Profile: {info['name']}")
-            
-            col_a, col_b = st.columns([1, 2])
-            
-            with col_a:
-                st.image(info['images']['jpg']['image_url'], use_container_width=True)
-                st.metric("Favorites", info['favorites'])
-                
-                if st.button("❤️ Add to Favorites", key=f"fav_char_{info['mal_id']}_main", use_container_width=True):
-                    success = add_to_favorites('characters', {
-                        'id': info['mal_id'],
-                        'name': info['name'],
-                        'image': info['images']['jpg']['image_url'],
-                        'favorites': info['favorites']
-                    })
-                    if success:
-                        st.success("✅ Added to favorites!")
-                    else:
-                        st.warning("⚠️ Already in favorites!")
-            
-            with col_b:
-                st.write(f"**Japanese name:** {info.get('name_kanji', 'N/A')}")
-                st.markdown("### 📄 AI Analysis Report")
-                st.success(ai_text, icon="📄")
-    
-    elif st.session_state.show_character_list and st.session_state.search_results:
-        st.markdown("---")
-        st.markdown("**📋 Multiple results found. Choose your character to analyze:**")
-        
-        cols = st.columns(5, gap="large")
-        for idx, char in enumerate(st.session_state.search_results):
-            with cols[idx % 5]:
-                img_url = char['images']['jpg']['image_url']
-                st.image(img_url, use_container_width=True)
-                
-                if st.button(
-                    f"{char['name']}", 
-                    key=f"select_char_{char['mal_id']}_{idx}",
-                    use_container_width=True
-                ):
-                    st.session_state.selected_character = char
-                    st.rerun()
+    character_browser()
 
 # ========================================
 # PAGE 2: UPLOAD IMAGE
@@ -459,36 +708,17 @@ elif st.session_state.current_page == "Upload Image":
                 st.success(f"AI detected: **{detected_name}**")
                 
                 with st.spinner(f"Searching for {detected_name}..."):
-                    info = get_one_character_data(detected_name)
+                    # Tra chỉ mục cục bộ trước: tên AI trả về thường khác cách viết trên Jikan
+                    known = resolve_character(detected_name)
+                    info = known and get_character_details(known['mal_id'])
+                    if not info:
+                        info = get_one_character_data(known['name'] if known else detected_name)
                 
                 if info:
-                    ai_text = ai_analyze_profile(info)
                     add_to_history('character_image', 'Image Upload', detected_name)
                     
                     st.markdown("---")
-                    st.subheader(f"📋 Profile: {info['name']}")
-                    
-                    col1, col2 = st.columns([1, 2])
-                    with col1:
-                        st.image(info['images']['jpg']['image_url'], use_container_width=True)
-                        st.metric("Favorites", info['favorites'])
-                        
-                        if st.button("❤️ Add to Favorites", key=f"fav_char_img_{info['mal_id']}", use_container_width=True):
-                            success = add_to_favorites('characters', {
-                                'id': info['mal_id'],
-                                'name': info['name'],
-                                'image': info['images']['jpg']['image_url'],
-                                'favorites': info['favorites']
-                            })
-                            if success:
-                                st.success("✅ Added to favorites!")
-                            else:
-                                st.warning("⚠️ Already in favorites!")
-                    
-                    with col2:
-                        st.write(f"**Japanese name:** {info.get('name_kanji', 'N/A')}")
-                        st.markdown("### 📄 AI Analysis Report")
-                        st.success(ai_text, icon="📄")
+                    render_character_card(info, f"fav_char_img_{info['mal_id']}")
                 else:
                     st.warning(f"Cannot find detailed data for '{detected_name}'")
             else:
@@ -537,72 +767,64 @@ elif st.session_state.current_page == "AI Recommend":
         
         submit = st.form_submit_button("✨ Get AI Recommendations", use_container_width=True)
     
+    rendered_live = False
     if submit:
         if not interests:
             st.warning("Please tell me about your interests!")
         else:
-            with st.spinner("🤖 AI is analyzing your profile..."):
-                recommendations = get_ai_recommendations(age, interests, mood, reading_style, content_type)
-                
-                if recommendations:
-                    st.session_state.recommendations = recommendations
-                    st.session_state.current_content_type = content_type
-                    add_to_history('ai_recommend', f"{content_type} for {age}yo", f"{len(recommendations)} items")
-                else:
-                    st.error("Sorry, couldn't generate recommendations. Try again!")
-    
-    # Hiển thị recommendations
-    if st.session_state.recommendations:
-        st.markdown("---")
-        st.success(f"### 🎯 Perfect Matches For You!")
-        
-        for idx, rec in enumerate(st.session_state.recommendations):
-            with st.container():
-                st.markdown(f"### {idx + 1}. {rec['title']}")
-                
-                col1, col2 = st.columns([1, 2])
-                
-                with col1:
-                    content = search_content_by_keyword(rec['search_keyword'], st.session_state.current_content_type)
-                    if content:
-                        if st.session_state.current_content_type in ["anime", "manga"]:
-                            img_url = content.get('images', {}).get('jpg', {}).get('image_url')
-                            if img_url:
-                                st.image(img_url, use_container_width=True)
-                            st.write(f"⭐ **Score:** {content.get('score', 'N/A')}")
-                            if st.session_state.current_content_type == "anime":
-                                st.write(f"📺 **Episodes:** {content.get('episodes', 'N/A')}")
-                            else:
-                                st.write(f"📖 **Chapters:** {content.get('chapters', 'N/A')}")
-                        else:
-                            if content.get('thumbnail'):
-                                st.image(content['thumbnail'], use_container_width=True)
-                            st.write(f"✏️ **Author:** {', '.join(content.get('authors', ['N/A']))}")
-                            if content.get('average_rating') != 'N/A':
-                                st.write(f"⭐ **Rating:** {content['average_rating']}")
-                
-                with col2:
-                    st.markdown(f"**🎭 Genre:** {rec['genre']}")
-                    st.markdown("**💡 Why perfect for you:**")
-                    st.info(rec['reason'])
-                    
-                    if content:
-                        if st.session_state.current_content_type in ["anime", "manga"]:
-                            synopsis = content.get('synopsis', 'No description')
-                            if synopsis and len(synopsis) > 300:
-                                synopsis = synopsis[:300] + "..."
-                            st.markdown("**📄 Synopsis:**")
-                            st.write(synopsis)
-                            st.markdown(f"[🔗 View on MyAnimeList]({content.get('url', '#')})")
-                        else:
-                            description = content.get('description', 'No description')
-                            if len(description) > 300:
-                                description = description[:300] + "..."
-                            st.markdown("**📄 Description:**")
-                            st.write(description)
-                            st.markdown(f"[🔗 Preview Book]({content.get('preview_link', '#')})")
-                
-                st.markdown("---")
+            # Mỗi gợi ý được hiện thành thẻ ngay khi AI viết xong, đồng thời bắt đầu
+            # tìm thông tin của nó ở nền trong lúc AI viết tiếp các gợi ý sau
+            status = st.empty()
+            status.caption("🤖 AI is analyzing your profile...")
+            header = st.empty()
+            recommendations, futures, slots, contents = [], [], [], []
+            filled = set()
+
+            def fill_finished_cards():
+                for idx, future in enumerate(futures):
+                    if idx not in filled and future.done():
+                        filled.add(idx)
+                        contents[idx] = future.result()
+                        with slots[idx].container():
+                            render_recommendation_card(idx, recommendations[idx], contents[idx], content_type)
+
+            def show_card(rec):
+                if not recommendations:
+                    with header.container():
+                        st.markdown("---")
+                        st.success(f"### 🎯 Perfect Matches For You!")
+                recommendations.append(rec)
+                futures.append(enrich_recommendation_async(rec, content_type))
+                contents.append(None)
+                slots.append(st.empty())
+                with slots[-1].container():
+                    render_recommendation_card(len(recommendations) - 1, rec, None, content_type)
+                fill_finished_cards()
+
+            for rec in stream_ai_recommendations(age, interests, mood, reading_style, content_type):
+                if rec.get('title'):
+                    show_card(rec)
+
+            if not recommendations:
+                st.info("🤖 AI is unavailable right now, here are some popular picks instead.")
+                for rec in FALLBACK_RECOMMENDATIONS[content_type]:
+                    show_card(rec)
+
+            status.caption("🔎 Fetching details...")
+            for future in futures:
+                future.result()
+            fill_finished_cards()
+            status.empty()
+
+            st.session_state.recommendations = recommendations
+            st.session_state.recommendation_contents = contents
+            st.session_state.current_content_type = content_type
+            add_to_history('ai_recommend', f"{content_type} for {age}yo", f"{len(recommendations)} items")
+            rendered_live = True
+    
+    # Hiển thị recommendations (các lần rerun sau)
+    if st.session_state.recommendations and not rendered_live:
+        recommendation_cards()
 
 # ========================================
 # PAGE 4: DISCOVER MEDIA
@@ -629,12 +851,12 @@ elif st.session_state.current_page == "Discover Media":
             selected_genre_ids = [genre_options[name] for name in selected_genre_names]
             order_by = st.selectbox("📅 Sort by:", options=["Newest", "Oldest", "Most Popular"])
             
+            match_mode = st.radio("🔗 Match:", [MATCH_ALL_GENRES, MATCH_ANY_GENRE], horizontal=True)
+            
             if st.button(f"🔍 Search {content_type.capitalize()}"):
                 if not selected_genre_ids:
                     st.warning("Choose at least one genre!")
                 else:
-                    genre_params = ",".join(map(str, selected_genre_ids))
-                    
                     if order_by == "Newest":
                         order_param, sort_param = "start_date", "desc"
                     elif order_by == "Oldest":
@@ -642,57 +864,57 @@ elif st.session_state.current_page == "Discover Media":
                     else:
                         order_param, sort_param = "score", "desc"
                     
-                    url = f"https://api.jikan.moe/v4/{content_type}?genres={genre_params}&order_by={order_param}&sort={sort_param}&limit=10"
                     add_to_history(f'{content_type}_genre', ', '.join(selected_genre_names))
                     
                     try:
-                        response = requests.get(url)
-                        if response.status_code == 200:
-                            data = response.json()
-                            results = data.get('data', [])
+                        with st.spinner(f"Searching {content_type}..."):
+                            results = search_media_by_genres(
+                                content_type, selected_genre_ids, order_param, sort_param,
+                                limit=10, match_any=(match_mode == MATCH_ANY_GENRE)
+                            )
+                        
+                        if results:
+                            st.success(f"✅ Found {len(results)} results!")
                             
-                            if results:
-                                st.success(f"✅ Found {len(results)} results!")
-                                
-                                for item in results:
-                                    with st.expander(f"📺 {item.get('title', 'N/A')}"):
-                                        col1, col2 = st.columns([1, 3])
+                            images = get_thumbnails([
+                                jikan_image_url(item.get('images'), st.session_state.lite_mode) for item in results
+                            ])
+                            for item, img_url in zip(results, images):
+                                with st.expander(f"📺 {item.get('title', 'N/A')}"):
+                                    col1, col2 = st.columns([1, 3])
+                                    
+                                    with col1:
+                                        if img_url:
+                                            st.image(img_url, use_container_width=True)
+                                    
+                                    with col2:
+                                        st.write(f"**Japanese:** {item.get('title_japanese', 'N/A')}")
+                                        st.write(f"**Score:** {item.get('score', 'N/A')} ⭐")
+                                        
+                                        aired = item.get('aired', {}) if content_type == "anime" else item.get('published', {})
+                                        if aired:
+                                            from_date = aired.get('from', 'N/A')
+                                            if from_date and from_date != 'N/A':
+                                                year = from_date.split('-')[0]
+                                                st.write(f"**Year:** {year}")
+                                        
+                                        if content_type == "anime":
+                                            st.write(f"**Episodes:** {item.get('episodes', 'N/A')}")
+                                        else:
+                                            st.write(f"**Chapters:** {item.get('chapters', 'N/A')}")
                                         
-                                        with col1:
-                                            img_url = item.get('images', {}).get('jpg', {}).get('image_url')
-                                            if img_url:
-                                                st.image(img_url, use_container_width=True)
+                                        genres = item.get('genres', [])
+                                        if genres:
+                                            genre_list = [g['name'] for g in genres]
+                                            st.write(f"**Genres:** {', '.join(genre_list)}")
                                         
-                                        with col2:
-                                            st.write(f"**Japanese:** {item.get('title_japanese', 'N/A')}")
-                                            st.write(f"**Score:** {item.get('score', 'N/A')} ⭐")
-                                            
-                                            aired = item.get('aired', {}) if content_type == "anime" else item.get('published', {})
-                                            if aired:
-                                                from_date = aired.get('from', 'N/A')
-                                                if from_date and from_date != 'N/A':
-                                                    year = from_date.split('-')[0]
-                                                    st.write(f"**Year:** {year}")
-                                            
-                                            if content_type == "anime":
-                                                st.write(f"**Episodes:** {item.get('episodes', 'N/A')}")
-                                            else:
-                                                st.write(f"**Chapters:** {item.get('chapters', 'N/A')}")
-                                            
-                                            genres = item.get('genres', [])
-                                            if genres:
-                                                genre_list = [g['name'] for g in genres]
-                                                st.write(f"**Genres:** {', '.join(genre_list)}")
-                                            
-                                            synopsis = item.get('synopsis', 'No description')
-                                            if synopsis and len(synopsis) > 200:
-                                                synopsis = synopsis[:200] + "..."
-                                            st.write(f"**Summary:** {synopsis}")
-                                            st.markdown(f"[🔗 View]({item.get('url', '#')})")
-                            else:
-                                st.warning("No results found")
+                                        synopsis = item.get('synopsis', 'No description')
+                                        if synopsis and len(synopsis) > 200:
+                                            synopsis = synopsis[:200] + "..."
+                                        st.write(f"**Summary:** {synopsis}")
+                                        st.markdown(f"[🔗 View]({item.get('url', '#')})")
                         else:
-                            st.error(f"API Error: {response.status_code}")
+                            st.warning("No results found")
                     except Exception as e:
                         st.error(f"Error: {e}")
     
@@ -706,6 +928,7 @@ elif st.session_state.current_page == "Discover Media":
             st.info("📌 Vietnamese books may have limited results")
         
         selected_book_genres = st.multiselect("📚 Choose book genres:", options=list(book_genres.keys()))
+        book_match_mode = st.radio("🔗 Match:", [MATCH_ALL_GENRES, MATCH_ANY_GENRE], horizontal=True, key="book_match_mode")
         
         if st.button("🔍 Search Books"):
             if not selected_book_genres:
@@ -713,39 +936,27 @@ elif st.session_state.current_page == "Discover Media":
             else:
                 genre_queries = [book_genres[g] for g in selected_book_genres]
                 
+                # Đóng generator của lần tìm trước để ngừng tải trang nền
+                if st.session_state.book_browser:
+                    st.session_state.book_browser['iterator'].close()
+                if book_match_mode == MATCH_ANY_GENRE and len(genre_queries) > 1:
+                    # Chế độ OR: mỗi thể loại 1 truy vấn song song, gộp hạng 1 lần
+                    with st.spinner("Searching books..."):
+                        fused = search_books_by_any_genre(genre_queries, max_results=BOOKS_PER_LOAD * 3, language=lang_code)
+                    book_iterator = (book for book in fused)
+                else:
+                    book_iterator = iter_books_by_genre(genre_queries, language=lang_code)
+                st.session_state.book_browser = {
+                    'iterator': book_iterator,
+                    'books': [],
+                    'exhausted': False
+                }
                 with st.spinner("Searching books..."):
-                    books = search_books_by_genre(genre_queries, max_results=10, language=lang_code)
+                    load_more_books()
                 
                 add_to_history('books_genre', ', '.join(selected_book_genres))
-                
-                if books:
-                    st.success(f"✅ Found {len(books)} books!")
-                    
-                    for book in books:
-                        with st.expander(f"📖 {book['title']}"):
-                            col1, col2 = st.columns([1, 3])
-                            
-                            with col1:
-                                if book['thumbnail']:
-                                    st.image(book['thumbnail'], use_container_width=True)
-                            
-                            with col2:
-                                st.write(f"**Author:** {', '.join(book['authors'])}")
-                                st.write(f"**Publisher:** {book['publisher']}")
-                                st.write(f"**Published:** {book['published_date']}")
-                                
-                                if book['average_rating'] != 'N/A':
-                                    st.write(f"**Rating:** {book['average_rating']} ⭐")
-                                
-                                description = book['description']
-                                if len(description) > 300:
-                                    description = description[:300] + "..."
-                                st.write(f"**Description:** {description}")
-                                
-                                if book['preview_link']:
-                                    st.markdown(f"[🔗 Preview]({book['preview_link']})")
-                else:
-                    st.warning("No books found")
+        
+        book_results()
 
 # ========================================
 # PAGE 5: FAVORITES
@@ -754,31 +965,7 @@ elif st.session_state.current_page == "Favorites":
     st.header("❤️ Your Favorite Characters")
     st.markdown("---")
 
-    fav_chars = st.session_state.favorites.get('characters', [])
-
-    if not fav_chars:
-        st.info("You haven't added any characters to your favorites yet. Go find your waifu!")
-    else:
-        st.success(f"You have {len(fav_chars)} favorite characters!")
-        
-        def remove_from_favorites(char_id):
-            st.session_state.favorites['characters'] = [
-                char for char in st.session_state.favorites['characters'] if char.get('id') != char_id
-            ]
-
-        cols = st.columns(4, gap="large")
-        for idx, char in enumerate(fav_chars):
-            with cols[idx % 4]:
-                st.image(char['image'], use_container_width=True, caption=char['name'])
-                st.write(f"**{char['name']}**")
-                st.write(f"⭐ {char['favorites']} Favorites")
-                
-                if st.button("🗑️ Remove", key=f"remove_fav_{char['id']}", use_container_width=True):
-                    remove_from_favorites(char['id'])
-                    st.rerun()
-    
-    st.markdown("---")
-    st.markdown(f"**Total Favorites:** {len(fav_chars)}")
+    favorites_grid()
 
 # ========================================
 # PAGE 6: HISTORY
@@ -787,21 +974,4 @@ elif st.session_state.current_page == "History":
     st.header("📜 Search History")
     st.markdown("---")
 
-    history = st.session_state.search_history
-
-    if not history:
-        st.info("No search history yet.")
-    else:
-        st.markdown(f"**Total entries:** {len(history)}")
-        
-        if st.button("🗑️ Clear History", type="secondary"):
-            st.session_state.search_history = []
-            st.rerun()
-
-        st.markdown("---")
-
-        for entry in history:
-            with st.expander(f"[{entry['timestamp']}] - **{entry['type'].upper().replace('_', ' ')}**"):
-                st.write(f"**Query:** `{entry['query']}`")
-                if entry['result']:
-                    st.write(f"**Result:** {entry['result']}")
+    history_list()
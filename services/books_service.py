@@ -1,126 +1,242 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 
-def search_books_by_genre(genres, max_results=10, language="en"):
+from services import http_client
+from services.fanout import gather_with_deadline, reciprocal_rank_fusion
+
+GOOGLE_BOOKS_URL = "https://www.googleapis.com/books/v1/volumes"
+BOOKS_PAGE_SIZE = 40   # Google Books giới hạn maxResults tối đa 40
+GENRE_QUERY_DEADLINE = 6  # giây chờ tối đa cho cả nhóm truy vấn theo từng thể loại
+
+# Thread nền cho các truy vấn chạy song song (tải trước trang kế tiếp,
+# tìm theo từng thể loại)
+_page_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="books-page")
+
+# Chỉ yêu cầu đúng các trường app dùng (partial response của Google API)
+# để giảm dung lượng tải về
+VOLUME_FIELDS = (
+    "items(id,volumeInfo(title,authors,publisher,publishedDate,description,"
+    "pageCount,categories,averageRating,imageLinks(thumbnail,smallThumbnail),"
+    "previewLink,infoLink,industryIdentifiers))"
+)
+
+
+@dataclass(slots=True)
+class Book:
+    """Thông tin gọn của 1 cuốn sách (dùng __slots__ để tốn ít bộ nhớ)."""
+    id: str
+    title: str = "N/A"
+    authors: list = field(default_factory=lambda: ["Unknown"])
+    publisher: str = "N/A"
+    published_date: str = "N/A"
+    description: str = "No description available"
+    page_count: object = "N/A"
+    categories: list = field(default_factory=lambda: ["N/A"])
+    average_rating: object = "N/A"
+    thumbnail: str = None
+    small_thumbnail: str = None
+    preview_link: str = "#"
+    info_link: str = "#"
+    isbn: str = None
+
+    @classmethod
+    def from_volume(cls, item):
+        """Tạo Book từ 1 phần tử trong 'items' của Google Books API."""
+        volume_info = item.get("volumeInfo", {})
+
+        # Lấy thumbnail (ưu tiên lớn hơn)
+        image_links = volume_info.get("imageLinks", {})
+        thumbnail = image_links.get("thumbnail") or image_links.get("smallThumbnail")
+        small_thumbnail = image_links.get("smallThumbnail") or thumbnail
+
+        # Ưu tiên ISBN-13, không có thì dùng ISBN-10
+        identifiers = {i.get("type"): i.get("identifier") for i in volume_info.get("industryIdentifiers", [])}
+        isbn = identifiers.get("ISBN_13") or identifiers.get("ISBN_10")
+
+        return cls(
+            id=item.get("id"),
+            title=volume_info.get("title", "N/A"),
+            authors=volume_info.get("authors", ["Unknown"]),
+            publisher=volume_info.get("publisher", "N/A"),
+            published_date=volume_info.get("publishedDate", "N/A"),
+            description=volume_info.get("description", "No description available"),
+            page_count=volume_info.get("pageCount", "N/A"),
+            categories=volume_info.get("categories", ["N/A"]),
+            average_rating=volume_info.get("averageRating", "N/A"),
+            thumbnail=thumbnail,
+            small_thumbnail=small_thumbnail,
+            preview_link=volume_info.get("previewLink", "#"),
+            info_link=volume_info.get("infoLink", "#"),
+            isbn=isbn,
+        )
+
+    def cover_url(self, lite=False):
+        """Ảnh bìa; chế độ lite dùng ảnh nhỏ (smallThumbnail)."""
+        return (self.small_thumbnail or self.thumbnail) if lite else self.thumbnail
+
+    @property
+    def dedupe_key(self):
+        """Cùng ISBN (khác id/ấn bản trên Google) vẫn coi là 1 cuốn."""
+        return self.isbn or self.id
+
+
+def _search_volumes(params):
     """
-    Tìm kiếm sách theo thể loại từ Google Books API.
-    
-    Args:
-        genres: List các thể loại (ví dụ: ["fiction", "mystery"])
-        max_results: Số lượng kết quả tối đa (mặc định 10)
-        language: Ngôn ngữ sách ("en" = English, "vi" = Vietnamese)
-    
-    Returns:
-        List các dict chứa thông tin sách
+    Gọi Google Books API và parse thành list Book.
+    Ném exception nếu lỗi kết nối; trả về None nếu API trả mã lỗi.
     """
+    response = http_client.get(GOOGLE_BOOKS_URL, params={**params, "fields": VOLUME_FIELDS})
+    if response.status_code != 200:
+        print(f"Google Books API Error: {response.status_code}")
+        return None
+    items = response.json().get("items", [])
+    return [Book.from_volume(item) for item in items]
+
+
+def _genre_params(genres, language):
     # Nối các thể loại thành query string
     genre_query = "+".join([f"subject:{g}" for g in genres])
-    
-    url = f"https://www.googleapis.com/books/v1/volumes"
+
     params = {
         "q": genre_query,
-        "maxResults": max_results,
         "orderBy": "relevance",
         "printType": "books"
     }
-    
+
     # Chỉ thêm langRestrict nếu là tiếng Anh
     # Với tiếng Việt, để trống để tìm rộng hơn
     if language == "en":
         params["langRestrict"] = "en"
-    
+    return params
+
+
+def _keyword_params(keyword, max_results, language):
+    params = {
+        "q": keyword,
+        "maxResults": max_results,
+        "orderBy": "relevance"
+    }
+
+    if language == "en":
+        params["langRestrict"] = "en"
+    return params
+
+
+def search_books_by_genre(genres, max_results=10, language="en"):
+    """
+    Tìm kiếm sách theo thể loại từ Google Books API.
+
+    Args:
+        genres: List các thể loại (ví dụ: ["fiction", "mystery"])
+        max_results: Số lượng kết quả tối đa (mặc định 10)
+        language: Ngôn ngữ sách ("en" = English, "vi" = Vietnamese)
+
+    Returns:
+        List các Book
+    """
+    params = _genre_params(genres, language)
+    params["maxResults"] = max_results
+
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            items = data.get("items", [])
-            
-            # Parse dữ liệu thành format dễ dùng
-            books = []
-            for item in items:
-                volume_info = item.get("volumeInfo", {})
-                
-                # Lấy thumbnail (ưu tiên lớn hơn)
-                image_links = volume_info.get("imageLinks", {})
-                thumbnail = image_links.get("thumbnail") or image_links.get("smallThumbnail")
-                
-                book = {
-                    "id": item.get("id"),
-                    "title": volume_info.get("title", "N/A"),
-                    "authors": volume_info.get("authors", ["Unknown"]),
-                    "publisher": volume_info.get("publisher", "N/A"),
-                    "published_date": volume_info.get("publishedDate", "N/A"),
-                    "description": volume_info.get("description", "No description available"),
-                    "page_count": volume_info.get("pageCount", "N/A"),
-                    "categories": volume_info.get("categories", ["N/A"]),
-                    "average_rating": volume_info.get("averageRating", "N/A"),
-                    "thumbnail": thumbnail,
-                    "preview_link": volume_info.get("previewLink", "#"),
-                    "info_link": volume_info.get("infoLink", "#")
-                }
-                books.append(book)
-            
-            return books
-        else:
-            print(f"Google Books API Error: {response.status_code}")
-            return []
+        return _search_volumes(params) or []
     except Exception as e:
         print(f"Error connecting to Google Books: {e}")
         return []
 
 
+def search_books_by_any_genre(genres, max_results=10, language="en", deadline=GENRE_QUERY_DEADLINE):
+    """
+    Tìm sách thuộc BẤT KỲ thể loại nào (OR), thay vì phải thuộc tất cả (AND).
+    Mỗi thể loại là 1 truy vấn riêng chạy song song; kết quả được loại trùng
+    theo id/ISBN và gộp hạng bằng Reciprocal Rank Fusion.
+
+    Args:
+        genres: List các thể loại
+        max_results: Số lượng kết quả tối đa sau khi gộp
+        language: Ngôn ngữ sách ("en" hoặc "vi")
+        deadline: Số giây tối đa chờ; thể loại nào chậm hơn thì bỏ qua
+
+    Returns:
+        List các Book
+    """
+    if len(genres) <= 1:
+        return search_books_by_genre(genres, max_results=max_results, language=language)
+
+    ranked_lists, errors = gather_with_deadline(
+        _page_executor,
+        search_books_by_genre,
+        [([genre], max_results, language) for genre in genres],
+        deadline,
+    )
+    for error in errors:
+        print(f"Error connecting to Google Books: {error}")
+    fused = reciprocal_rank_fusion(ranked_lists, key=lambda book: book.dedupe_key)
+    return fused[:max_results]
+
+
+def iter_books_by_genre(genres, language="en", page_size=BOOKS_PAGE_SIZE):
+    """
+    Generator duyệt lần lượt các trang kết quả (startIndex) theo thể loại.
+    - Chỉ tải trang khi cần; trong lúc trang hiện tại đang được dùng
+      thì trang kế tiếp được tải trước ở nền.
+    - Người dùng ngừng lấy (close generator) thì dừng luôn, không tải thêm.
+
+    Args:
+        genres: List các thể loại
+        language: Ngôn ngữ sách ("en" hoặc "vi")
+        page_size: Số sách mỗi trang (tối đa 40)
+
+    Yields:
+        Book
+    """
+    params = _genre_params(genres, language)
+    params["maxResults"] = min(page_size, BOOKS_PAGE_SIZE)
+
+    def fetch(start_index):
+        return _search_volumes({**params, "startIndex": start_index})
+
+    start_index = 0
+    seen_ids = set()
+    future = _page_executor.submit(fetch, start_index)
+    try:
+        while future is not None:
+            try:
+                books = future.result()
+            except Exception as e:
+                print(f"Error connecting to Google Books: {e}")
+                books = None
+            if not books:
+                future = None
+                return
+
+            start_index += len(books)
+            future = _page_executor.submit(fetch, start_index)
+
+            for book in books:
+                # Google đôi khi trả trùng sách giữa các trang
+                if book.dedupe_key in seen_ids:
+                    continue
+                seen_ids.add(book.dedupe_key)
+                yield book
+    finally:
+        if future is not None:
+            future.cancel()
+
+
 def search_books_by_keyword(keyword, max_results=10, language="en"):
     """
     Tìm kiếm sách theo từ khóa (tên sách, tác giả, chủ đề).
-    
+
     Args:
         keyword: Từ khóa tìm kiếm
         max_results: Số lượng kết quả
         language: Ngôn ngữ sách ("en" = English, "vi" = Vietnamese)
-    
+
     Returns:
-        List các dict chứa thông tin sách
+        List các Book
     """
-    url = f"https://www.googleapis.com/books/v1/volumes"
-    params = {
-        "q": keyword,
-        "maxResults": max_results,
-        "orderBy": "relevance"
-    }
-    
-    if language == "en":
-        params["langRestrict"] = "en"
-    
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            items = data.get("items", [])
-            
-            books = []
-            for item in items:
-                volume_info = item.get("volumeInfo", {})
-                image_links = volume_info.get("imageLinks", {})
-                thumbnail = image_links.get("thumbnail") or image_links.get("smallThumbnail")
-                
-                book = {
-                    "id": item.get("id"),
-                    "title": volume_info.get("title", "N/A"),
-                    "authors": volume_info.get("authors", ["Unknown"]),
-                    "publisher": volume_info.get("publisher", "N/A"),
-                    "published_date": volume_info.get("publishedDate", "N/A"),
-                    "description": volume_info.get("description", "No description available"),
-                    "page_count": volume_info.get("pageCount", "N/A"),
-                    "categories": volume_info.get("categories", ["N/A"]),
-                    "average_rating": volume_info.get("averageRating", "N/A"),
-                    "thumbnail": thumbnail,
-                    "preview_link": volume_info.get("previewLink", "#"),
-                    "info_link": volume_info.get("infoLink", "#")
-                }
-                books.append(book)
-            
-            return books
-        else:
-            return []
+        return _search_volumes(_keyword_params(keyword, max_results, language)) or []
     except Exception as e:
         print(f"Error: {e}")
         return []
@@ -153,4 +269,4 @@ BOOK_GENRES = {
 
 def get_book_genres():
     """Trả về dict các thể loại sách"""
-    return BOOK_GENRES
\ No newline at end of file
+    return BOOK_GENRES
@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Thư mục chứa các file cache trên đĩa (có thể đổi bằng biến môi trường)
+CACHE_DIR = os.getenv("ITOOK_CACHE_DIR", ".cache")
+
+
+def cache_path(filename):
+    """Trả về đường dẫn file trong CACHE_DIR (tự tạo thư mục nếu chưa có)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, filename)
+
+
+class SQLiteCache:
+    """
+    Cache key -> value (JSON) lưu trên đĩa bằng SQLite.
+    - Mỗi entry hết hạn sau `ttl` giây.
+    - Khi vượt `max_entries` thì xóa các entry lâu không dùng nhất (LRU).
+      Số entry được đếm dần trong bộ nhớ, không COUNT(*) ở mỗi lần set.
+    - Lần dùng gần nhất chỉ được ghi lại khi đã cũ hơn `access_write_interval`
+      giây, để cache hit không phải UPDATE + commit mỗi lần.
+    - Đếm hit/miss để theo dõi hiệu quả.
+    Dữ liệu vẫn còn sau khi restart process.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_entries=5000, access_write_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.access_write_interval = access_write_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        """Trả về value đã cache hoặc None nếu không có / đã hết hạn."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created, accessed FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._count -= 1
+                self.misses += 1
+                return None
+            if now - row[2] >= self.access_write_interval:
+                self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Lưu value (phải serialize được sang JSON) rồi dọn bớt nếu vượt giới hạn."""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            if not exists:
+                self._count += 1
+            if self._count > self.max_entries:
+                deleted = self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                    (self._count - self.max_entries,),
+                ).rowcount
+                self._count -= deleted
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._count -= self._conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self._count = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def stats(self):
+        """Thống kê hit/miss và số entry hiện có."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+        }
+
+
+class MemoryTTLCache:
+    """
+    Cache trong bộ nhớ (dùng chung cho mọi session của process)
+    với TTL và giới hạn số entry theo LRU.
+    """
+
+    def __init__(self, ttl=3600, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Trả về value đã cache hoặc None nếu không có / đã hết hạn."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or now - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+        }
+
+
+class TieredCache:
+    """
+    Cache 2 tầng: bộ nhớ (nhanh) rồi tới đĩa (tùy chọn, còn sau restart).
+    Entry tìm thấy trên đĩa sẽ được nạp lại lên bộ nhớ.
+    """
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
@@ -0,0 +1,147 @@
+"""
+Nhập hàng loạt danh mục nhân vật nổi tiếng từ Jikan vào chỉ mục tên cục bộ
+(services.name_index), để app không phải hỏi Jikan cho mọi lần tra tên khi
+vừa khởi động.
+
+- Duyệt /characters?order_by=favorites&sort=desc theo từng trang.
+- Đi qua http_client nên dùng chung rate limiter của Jikan (3 req/s, 60 req/phút).
+- Sau mỗi trang lưu checkpoint; chạy lại sẽ tiếp tục từ trang kế tiếp.
+
+Chạy:
+    python -m services.catalog_import --pages 200        # 200 trang x 25 nhân vật
+    python -m services.catalog_import --restart          # bỏ checkpoint, làm lại từ đầu
+    python -m services.catalog_import --base-url http://127.0.0.1:8765/v4
+"""
+import argparse
+import sys
+import time
+
+from services import http_client
+from services.cache_service import SQLiteCache, cache_path
+from services.name_index import get_name_index
+
+JIKAN_BASE_URL = "https://api.jikan.moe/v4"
+CATALOG_PAGE_SIZE = 25          # Jikan giới hạn limit tối đa 25
+CATALOG_MAX_PAGES = 400         # ~10.000 nhân vật nổi tiếng nhất
+CATALOG_PAGE_RETRIES = 3        # số lần thử lại 1 trang khi lỗi mạng / 5xx
+CATALOG_RETRY_DELAY = 2.0       # giây, nhân đôi sau mỗi lần thử
+# Thứ hạng favorites thay đổi dần: checkpoint cũ hơn 1 tuần thì làm lại từ đầu
+CHECKPOINT_TTL = 7 * 24 * 3600  # giây
+
+_checkpoints = None
+
+
+def _get_checkpoints():
+    global _checkpoints
+    if _checkpoints is None:
+        _checkpoints = SQLiteCache(cache_path("catalog_import.sqlite3"), ttl=CHECKPOINT_TTL, max_entries=100)
+    return _checkpoints
+
+
+def _checkpoint_key(base_url):
+    return f"characters:favorites:{base_url.rstrip('/')}"
+
+
+def _fetch_page(base_url, page, page_size):
+    """
+    Lấy 1 trang nhân vật (sắp theo favorites giảm dần).
+    Trả về (data, has_next_page, last_visible_page); ném exception nếu lỗi.
+    """
+    response = http_client.get(
+        f"{base_url.rstrip('/')}/characters",
+        params={"order_by": "favorites", "sort": "desc", "page": page, "limit": page_size},
+        # Job chạy 1 lần: không cần (và không nên) làm đầy cache HTTP
+        cache=False,
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Jikan API Error: {response.status_code}")
+    body = response.json()
+    pagination = body.get("pagination") or {}
+    return body.get("data") or [], bool(pagination.get("has_next_page")), pagination.get("last_visible_page")
+
+
+def _fetch_page_with_retry(base_url, page, page_size, retries, retry_delay):
+    delay = retry_delay
+    for attempt in range(retries + 1):
+        try:
+            return _fetch_page(base_url, page, page_size)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            print(f"Lỗi tải trang {page} ({e}), thử lại sau {delay:.0f}s...")
+            time.sleep(delay)
+            delay *= 2
+
+
+def import_catalog(base_url=JIKAN_BASE_URL, max_pages=CATALOG_MAX_PAGES, page_size=CATALOG_PAGE_SIZE,
+                   restart=False, index=None, checkpoints=None,
+                   retries=CATALOG_PAGE_RETRIES, retry_delay=CATALOG_RETRY_DELAY):
+    """
+    Nhập danh mục nhân vật vào chỉ mục tên, có checkpoint để chạy tiếp.
+
+    Args:
+        base_url: Gốc API Jikan (đổi được để chạy với server giả lập)
+        max_pages: Dừng sau trang thứ max_pages (tính từ trang 1)
+        page_size: Số nhân vật mỗi trang (tối đa 25)
+        restart: True = bỏ checkpoint cũ, nhập lại từ trang 1
+        index: NameIndex đích (mặc định chỉ mục dùng chung của app)
+        checkpoints: Nơi lưu checkpoint (mặc định catalog_import.sqlite3)
+        retries, retry_delay: Thử lại mỗi trang khi lỗi mạng / API
+
+    Returns:
+        dict checkpoint cuối: next_page, imported, done
+        (trang lỗi hết số lần thử thì ném exception, checkpoint giữ nguyên)
+    """
+    # So với None: chỉ mục / cache rỗng có len() == 0 nên bị coi là False
+    index = index if index is not None else get_name_index()
+    checkpoints = checkpoints if checkpoints is not None else _get_checkpoints()
+    key = _checkpoint_key(base_url)
+
+    state = None if restart else checkpoints.get(key)
+    if state is None:
+        state = {"next_page": 1, "imported": 0, "done": False}
+    elif state.get("done"):
+        print(f"Đã nhập xong trước đó ({state['imported']} nhân vật). Dùng --restart để làm lại.")
+        return state
+
+    while state["next_page"] <= max_pages:
+        page = state["next_page"]
+        data, has_next, last_page = _fetch_page_with_retry(base_url, page, page_size, retries, retry_delay)
+        index.add_many(data)
+
+        state = {
+            "next_page": page + 1,
+            "imported": state["imported"] + len(data),
+            "done": not has_next or not data,
+        }
+        checkpoints.set(key, state)
+        print(f"Trang {page}/{last_page or '?'}: +{len(data)} nhân vật (tổng {state['imported']})")
+        if state["done"]:
+            break
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=JIKAN_BASE_URL)
+    parser.add_argument("--pages", type=int, default=CATALOG_MAX_PAGES, help="số trang tối đa (25 nhân vật/trang)")
+    parser.add_argument("--page-size", type=int, default=CATALOG_PAGE_SIZE)
+    parser.add_argument("--restart", action="store_true", help="bỏ checkpoint, nhập lại từ trang 1")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        state = import_catalog(args.base_url, max_pages=args.pages, page_size=args.page_size, restart=args.restart)
+    except KeyboardInterrupt:
+        print("\nĐã dừng. Chạy lại lệnh để tiếp tục từ checkpoint.")
+        return 1
+    except Exception as e:
+        print(f"Lỗi nhập danh mục: {e}. Chạy lại lệnh để tiếp tục từ checkpoint.")
+        return 1
+    print(f"Xong: {state['imported']} nhân vật, {len(get_name_index())} trong chỉ mục "
+          f"({time.perf_counter() - started:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import heapq
+import itertools
+import threading
+import time
+
+from services.metrics import WindowStats
+
+# Số nhỏ hơn = được ưu tiên hơn
+PRIORITY_INTERACTIVE = 0   # người dùng đang chờ trên màn hình
+
+
+class AdmissionError(RuntimeError):
+    """Hàng đợi đã đầy hoặc chờ quá lâu: từ chối ngay thay vì dồn thêm tải."""
+
+
+class PriorityLimiter:
+    """
+    Giới hạn số lời gọi chạy đồng thời cho cả process, hàng đợi có ưu tiên.
+    - Tối đa `max_concurrent` lời gọi chạy cùng lúc.
+    - Khi hết chỗ, lời gọi xếp hàng theo `priority` (số nhỏ được phục vụ
+      trước), cùng mức ưu tiên thì đến trước phục vụ trước.
+    - Hàng đợi dài quá `max_queue` thì từ chối (AdmissionError).
+    - Ghi lại thời gian chờ trong hàng đợi để ước lượng quota cần có.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = []   # heap (priority, seq, event)
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_stats = WindowStats()
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Chờ tới lượt chạy. Phải gọi release() khi xong.
+
+        Returns:
+            Số giây đã chờ trong hàng đợi.
+            Ném AdmissionError nếu hàng đợi đầy hoặc chờ quá `timeout` giây.
+        """
+        started = time.monotonic()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                self.wait_stats.add(0.0)
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionError(f"{self.name}: hàng đợi đầy ({len(self._waiters)} yêu cầu)")
+            waiter = (priority, next(self._seq), threading.Event())
+            heapq.heappush(self._waiters, waiter)
+
+        if not waiter[2].wait(timeout):
+            with self._lock:
+                if not waiter[2].is_set():
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    self.timed_out += 1
+                    raise AdmissionError(f"{self.name}: chờ quá {timeout:.0f}s trong hàng đợi")
+            # Được trao lượt đúng lúc vừa hết giờ: vẫn dùng lượt đó
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.admitted += 1
+        self.wait_stats.add(waited)
+        return waited
+
+    def release(self):
+        """Trả lượt; lượt được trao thẳng cho người ưu tiên nhất đang chờ."""
+        with self._lock:
+            if self._waiters:
+                _, _, event = heapq.heappop(self._waiters)
+                event.set()   # _active giữ nguyên: lượt chuyển sang người chờ
+            else:
+                self._active -= 1
+
+    def stats(self):
+        """Số lời gọi đang chạy / đang chờ, số bị từ chối và thời gian chờ (giây)."""
+        with self._lock:
+            snapshot = {
+                "name": self.name,
+                "max_concurrent": self.max_concurrent,
+                "active": self._active,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+        snapshot["wait"] = self.wait_stats.snapshot()
+        return snapshot
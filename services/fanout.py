@@ -0,0 +1,56 @@
+from concurrent.futures import wait
+
+# Hằng số k chuẩn của Reciprocal Rank Fusion (Cormack et al., 2009)
+RRF_K = 60
+
+
+def gather_with_deadline(executor, fn, args_list, deadline):
+    """
+    Chạy fn(*args) cho mỗi args trong args_list song song trên executor,
+    chỉ chờ tối đa `deadline` giây cho cả nhóm.
+
+    Returns:
+        (results, errors): results là list kết quả của các lời gọi xong kịp
+        và không lỗi (giữ đúng thứ tự args_list); errors là list exception.
+        Lời gọi quá hạn bị bỏ qua (và hủy nếu chưa bắt đầu chạy).
+    """
+    futures = [executor.submit(fn, *args) for args in args_list]
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+
+    results, errors = [], []
+    for future in futures:
+        if future not in done:
+            continue
+        error = future.exception()
+        if error is None:
+            results.append(future.result())
+        else:
+            errors.append(error)
+    return results, errors
+
+
+def reciprocal_rank_fusion(ranked_lists, key, k=RRF_K):
+    """
+    Gộp nhiều danh sách đã xếp hạng thành 1 danh sách (Reciprocal Rank Fusion).
+    Mỗi item được cộng điểm 1 / (k + hạng) ở mỗi danh sách chứa nó,
+    item trùng key chỉ giữ lại bản xuất hiện đầu tiên.
+
+    Args:
+        ranked_lists: List các list item, mỗi list đã xếp hạng tốt -> kém
+        key: Hàm trả về khóa định danh (để loại trùng) của item
+        k: Hằng số làm mượt của RRF
+
+    Returns:
+        List item đã loại trùng, sắp theo điểm RRF giảm dần
+    """
+    scores = {}
+    items = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    # sorted ổn định: điểm bằng nhau thì giữ thứ tự xuất hiện đầu tiên
+    return sorted(items.values(), key=lambda item: -scores[key(item)])
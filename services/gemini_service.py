@@ -1,11 +1,60 @@
-import google.generativeai as genai
+import hashlib
 import os
+import threading
+import time
 import streamlit as st # IMPORT STREAMLIT
-from dotenv import load_dotenv
+from services.cache_service import MemoryTTLCache, SQLiteCache, TieredCache, cache_path
+from services.dispatcher import PRIORITY_INTERACTIVE, PriorityLimiter
+from services.image_service import PerceptualHashIndex, dhash, prepare_image
+from services.prompt_budget import PROFILE_BIO_TOKEN_BUDGET, estimate_tokens, trim_bio
+from services.resilience import CircuitBreaker, call_with_retry, is_retryable
+from services.singleflight import single_flight
+
+# Tăng số này mỗi khi đổi prompt phân tích để không dùng lại kết quả cũ
+PROMPT_VERSION = 2
+
+# Cache kết quả phân tích: mỗi nhân vật chỉ gọi Gemini 1 lần trong TTL
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", 7 * 24 * 3600))  # giây
+ANALYSIS_DISK_CACHE = os.getenv("ANALYSIS_DISK_CACHE", "1") == "1"
+
+_analysis_cache = TieredCache(
+    MemoryTTLCache(ttl=ANALYSIS_CACHE_TTL, max_entries=500),
+    SQLiteCache(cache_path("analysis.sqlite3"), ttl=ANALYSIS_CACHE_TTL, max_entries=20000)
+    if ANALYSIS_DISK_CACHE else None,
+)
+
+# Mỗi lần gọi Gemini có timeout riêng, cả chuỗi thử lại không quá GEMINI_DEADLINE
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))    # giây / lần gọi
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", 60))  # giây cho mọi lần thử
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 2))
+
+# Gemini lỗi liên tiếp thì ngừng gọi một lúc, mọi session nhận ngay bản dự phòng
+gemini_breaker = CircuitBreaker(
+    "Gemini",
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5)),
+    reset_timeout=int(os.getenv("GEMINI_BREAKER_RESET", 30)),
+)
+
+# Giới hạn số lời gọi Gemini chạy cùng lúc cho cả process (để không vượt quota)
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", 4))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", 16))
+
+gemini_limiter = PriorityLimiter("Gemini", max_concurrent=GEMINI_MAX_CONCURRENT, max_queue=GEMINI_MAX_QUEUE)
+
+# Ảnh gần giống ảnh đã nhận diện trước đó thì dùng lại tên, không gọi Gemini
+_vision_index = PerceptualHashIndex(cache_path("vision_phash.sqlite3"))
 
 # Code API function
-@st.cache_resource #@st.cache_resource để đảm bảo Key chỉ được gọi 1 lần duy nhất
-def initialize_gemini():
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Registry model dùng chung cho cả process: tên model -> GenerativeModel (None nếu lỗi cấu hình)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_api_key():
+    """ Lấy API key từ Streamlit secrets hoặc .env. Trả về None nếu chưa cấu hình. """
+    from dotenv import load_dotenv
     load_dotenv()
     try:
         api_key = st.secrets.get("GEMINI_API_KEY")
@@ -16,58 +65,327 @@ def initialize_gemini():
         api_key = os.getenv("GEMINI_API_KEY")
     
     if not api_key or api_key.startswith("DÁN_KEY"):
-        st.error("LỖI CẤU HÌNH: Vui lòng dán API Key vào file .env")
-        return None
-    
-    try:
-        # Thêm .strip() để xóa hết khoảng trắng thừa
-        cleaned_key = api_key.strip()
-        genai.configure(api_key=cleaned_key)
-        return genai.GenerativeModel('gemini-2.5-flash')
-    except Exception as e:
-        # Nếu lỗi API
-        st.error(f"LỖI CẤU HÌNH: Key API không hợp lệ. Hãy tạo Key mới.")
-        print(f"LỖI CẤU HÌNH CHI TIẾT: {e}")
         return None
+    # Thêm .strip() để xóa hết khoảng trắng thừa
+    return api_key.strip()
+
+
+def get_model(name=GEMINI_MODEL):
+    """
+    Trả về GenerativeModel dùng chung (tạo ở lần gọi đầu tiên).
+    SDK google.generativeai chỉ được import khi thật sự cần gọi AI,
+    nên các trang không dùng AI không phải trả thời gian import nó.
+
+    Returns:
+        GenerativeModel hoặc None nếu thiếu / sai API key
+    """
+    with _models_lock:
+        if name in _models:
+            return _models[name]
+
+        model = None
+        api_key = get_api_key()
+        if not api_key:
+            st.error("LỖI CẤU HÌNH: Vui lòng dán API Key vào file .env")
+        else:
+            try:
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                model = genai.GenerativeModel(name)
+            except Exception as e:
+                # Nếu lỗi API
+                st.error(f"LỖI CẤU HÌNH: Key API không hợp lệ. Hãy tạo Key mới.")
+                print(f"LỖI CẤU HÌNH CHI TIẾT: {e}")
+        _models[name] = model
+        return model
 
-model = initialize_gemini()
+
+class _LimiterSlotStream:
+    """
+    Iterator bọc stream của Gemini, giữ lượt của gemini_limiter cho tới khi
+    stream chạy hết, lỗi, bị close() hoặc bị bỏ (kể cả khi chưa đọc chunk nào).
+    Lượt chỉ được trả 1 lần.
+    """
+
+    def __init__(self, response):
+        self._response = iter(response)
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._response)
+        except BaseException:   # StopIteration hoặc lỗi giữa stream
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        gemini_limiter.release()
+
+    def __del__(self):
+        self.close()
+
+
+def gemini_generate(contents, stream=False, priority=PRIORITY_INTERACTIVE,
+                    timeout=GEMINI_TIMEOUT, deadline=GEMINI_DEADLINE, generation_config=None):
+    """
+    model.generate_content có timeout, thử lại khi lỗi tạm thời và đi qua circuit breaker.
+    Mỗi lần gọi phải xếp hàng ở gemini_limiter; thời gian chờ tính vào timeout.
+    Với stream=True, chỉ phần mở kết nối + chunk đầu được thử lại.
+
+    Args:
+        contents: Prompt (hoặc list prompt + ảnh)
+        stream: True = trả về iterator các chunk
+        priority: Mức ưu tiên trong hàng đợi (mặc định PRIORITY_INTERACTIVE)
+        generation_config: Cấu hình sinh của Gemini (ví dụ JSON mode + response_schema)
+
+    Returns:
+        GenerateContentResponse (hoặc iterator chunk nếu stream).
+        Ném CircuitOpenError nếu Gemini đang bị ngắt, AdmissionError nếu hàng đợi đầy.
+    """
+    def attempt(attempt_timeout):
+        waited = gemini_limiter.acquire(priority, timeout=attempt_timeout)
+        if waited > 0:
+            print(f"[gemini] chờ hàng đợi {waited:.2f}s ({gemini_limiter.stats()['queued']} yêu cầu còn chờ)")
+        try:
+            response = get_model().generate_content(
+                contents, stream=stream, generation_config=generation_config,
+                request_options={"timeout": max(1.0, attempt_timeout - waited)},
+            )
+        except BaseException:
+            gemini_limiter.release()
+            raise
+        if stream:
+            return _LimiterSlotStream(response)
+        gemini_limiter.release()
+        return response
+
+    return call_with_retry(
+        attempt,
+        breaker=gemini_breaker,
+        deadline=deadline,
+        timeout=timeout,
+        retries=GEMINI_MAX_RETRIES,
+    )
+
+
+def get_gemini_limiter_stats():
+    """ Số lời gọi Gemini đang chạy / xếp hàng / bị từ chối và thời gian chờ hàng đợi. """
+    return gemini_limiter.stats()
+
+
+def get_gemini_breaker_state():
+    """ Trạng thái circuit breaker của Gemini (closed / open / half_open). """
+    return gemini_breaker.snapshot()
 
 
 # Code Computer Vision:
+VISION_PROMPT = "Look at this anime character. Tell me ONLY their full canonical name. If not sure, return 'Unknown'."
+
+
+# Nhiều người upload cùng một ảnh cùng lúc chỉ tạo 1 lời gọi Gemini
+@single_flight(lambda image_hash, image_data: f"vision:{image_hash:016x}")
+def _detect_name(image_hash, image_data):
+    response = gemini_generate([VISION_PROMPT, prepare_image(image_data)])
+    name = response.text.strip()
+    if name and name != "Unknown":
+        _vision_index.add(image_hash, name)
+    return name
+
+
+def get_vision_index_stats():
+    """ Thống kê hit/miss của bảng tra ảnh đã nhận diện. """
+    return _vision_index.stats()
+
+
 def ai_vision_detect(image_data):
     """ Nhìn ảnh và đoán tên nhân vật. """
-    if not model:
+    if not get_model():
         return "ERROR: Key chưa được cấu hình."
         
-    prompt = "Look at this anime character. Tell me ONLY their full canonical name. If not sure, return 'Unknown'."
     try:
-        response = model.generate_content([prompt, image_data])
-        return response.text.strip()
+        image_hash = dhash(image_data)
+        known_name = _vision_index.lookup(image_hash)
+        if known_name:
+            return known_name
+        return _detect_name(image_hash, image_data)
     except Exception as e:
         return "Unknown"
 # Code Texting:
-def ai_analyze_profile(char_info):
-    """ Phân tích thông tin và viết báo cáo. """
-    if not model:
-        return "ERROR: Key chưa được cấu hình."
-    if not isinstance(char_info, dict):
-        return "Lỗi Dữ liệu: Jikan không trả về hồ sơ hợp lệ cho nhân vật này. Vui lòng thử tên khác."
-        
-    # Lấy thông tin an toàn (Nếu không có key 'about' thì dùng chuỗi rỗng)
-    # Dùng .get(key, default) để không bị lỗi nếu key không tồn tại
-    about_text = char_info.get('about', 'Không có tiểu sử chi tiết.')
-    name_text = char_info.get('name', 'Nhân vật này')
+def _profile_key(char_info):
+    """ Key theo nội dung: mal_id + hash của tiểu sử + phiên bản prompt + ngân sách token. """
+    about_hash = hashlib.sha256(str(char_info.get('about') or '').encode("utf-8")).hexdigest()[:16]
+    char_id = char_info.get('mal_id') or char_info.get('name')
+    return f"profile:{char_id}:{about_hash}:v{PROMPT_VERSION}:b{PROFILE_BIO_TOKEN_BUDGET}"
+
+
+def _build_profile_prompt(char_info):
+    """
+    Tạo prompt phân tích hồ sơ nhân vật.
+    Tiểu sử được rút gọn theo PROFILE_BIO_TOKEN_BUDGET.
+
+    Returns:
+        (prompt, số token tiết kiệm được so với dùng nguyên tiểu sử)
+    """
+    # Tiểu sử có thể thiếu hoặc là None: không để lọt chữ "None" vào prompt
+    about_text, original_tokens, kept_tokens = trim_bio(char_info.get('about'))
+    if not about_text:
+        about_text = 'Không có tiểu sử chi tiết.'
+    name_text = char_info.get('name') or 'Nhân vật này'
     prompt = f"""
-    Dựa vào thông tin tiếng Anh: "{char_info['about']}".
-    Hãy đóng vai một Otaku chuyên nghiệp, viết hồ sơ phân tích nhân vật {char_info['name']} bằng tiếng Việt:
+    Dựa vào thông tin tiếng Anh: "{about_text}".
+    Hãy đóng vai một Otaku chuyên nghiệp, viết hồ sơ phân tích nhân vật {name_text} bằng tiếng Việt:
     
     1. **Tiểu sử vắn tắt**: (Kể lại quá khứ hoặc xuất thân một cách lôi cuốn).
     2. **Phim tham gia**: (Giới thiệu bộ Anime gốc và vai trò của nhân vật trong đó).
     3. **Sức mạnh & Kỹ năng**: (Phân tích điểm mạnh, chiêu thức đặc biệt).
     4. **Đánh giá cá nhân**: (Tại sao nhân vật này lại được yêu thích/hoặc bị ghét).
     """
+    return prompt, max(0, original_tokens - kept_tokens)
+
+
+def _log_profile_call(char_info, prompt, saved_tokens, started):
+    """ Ghi lại kích thước prompt, số token đã cắt bớt và thời gian gọi Gemini. """
+    print(
+        f"[gemini] profile '{char_info.get('name')}': prompt ~{estimate_tokens(prompt)} tokens "
+        f"(bỏ bớt ~{saved_tokens} tokens tiểu sử), {time.perf_counter() - started:.2f}s"
+    )
+
+
+def _fallback_profile(char_info):
+    """ Bản tóm tắt tĩnh từ tiểu sử gốc khi không gọi được Gemini (không lưu cache). """
+    about_text, _, _ = trim_bio(char_info.get('about'), budget=200)
+    name_text = char_info.get('name') or 'Nhân vật này'
+    return (
+        f"⚠️ AI đang tạm thời không phản hồi, dưới đây là tóm tắt từ MyAnimeList.\n\n"
+        f"**{name_text}**\n\n{about_text or 'Không có tiểu sử chi tiết.'}"
+    )
+
+
+class _ProfileBroadcast:
+    """
+    1 stream Gemini, nhiều người đọc: mỗi người đọc nhận lại các đoạn đã có
+    từ đầu rồi theo kịp các đoạn mới khi chúng tới.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self._cond = threading.Condition()
+
+    def publish(self, text):
+        with self._cond:
+            self.parts.append(text)
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    def read(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.parts) and not self.done:
+                    self._cond.wait()
+                if index >= len(self.parts):
+                    return
+                new_parts = self.parts[index:]
+                index = len(self.parts)
+            yield from new_parts
+
+
+# Nhân vật đang được sinh hồ sơ (profile key -> _ProfileBroadcast):
+# nhiều session mở cùng một nhân vật cùng lúc chỉ tạo 1 stream Gemini
+_profile_streams = {}
+_profile_streams_lock = threading.Lock()
+
+
+def _run_profile_stream(key, char_info, broadcast):
+    """
+    Chạy ở thread nền: gọi Gemini, phát từng đoạn cho mọi người đang đọc và
+    lưu cả bài vào cache khi xong. Không phụ thuộc session nào còn mở trang.
+    """
     try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Xin lỗi, AI đang bị lỗi kết nối/timeout: {e}"
+        prompt, saved_tokens = _build_profile_prompt(char_info)
+        started = time.perf_counter()
+        try:
+            response = gemini_generate(prompt, stream=True)
+        except Exception as e:
+            print(f"Lỗi Gemini: {e}")
+            broadcast.publish(_fallback_profile(char_info))
+            return
+
+        parts = []
+        try:
+            for chunk in response:
+                parts.append(chunk.text)
+                broadcast.publish(chunk.text)
+        except Exception as e:
+            # Đứt giữa chừng: không thử lại (đã hiện 1 phần), nhưng vẫn tính vào breaker
+            if is_retryable(e):
+                gemini_breaker.record_failure()
+            broadcast.publish(f"\n\nXin lỗi, AI đang bị lỗi kết nối/timeout: {e}")
+            return
+        _log_profile_call(char_info, prompt, saved_tokens, started)
+        # Chỉ lưu khi stream hoàn tất
+        _analysis_cache.set(key, "".join(parts))
+    finally:
+        # Lưu cache xong mới gỡ: người đến sau hoặc thấy stream này, hoặc thấy cache
+        with _profile_streams_lock:
+            _profile_streams.pop(key, None)
+        broadcast.finish()
+
+
+def get_analysis_cache_stats():
+    """ Thống kê hit/miss của cache phân tích. """
+    return _analysis_cache.stats()
+
+
+def ai_analyze_profile_stream(char_info):
+    """
+    Phân tích thông tin nhân vật và viết báo cáo. Trả về generator, yield
+    từng đoạn text ngay khi Gemini viết xong (dùng với st.write_stream).
+    Nhiều session mở cùng một nhân vật chưa có trong cache cùng đọc chung
+    1 stream Gemini. Khi stream chạy hết, toàn bộ bài được lưu vào cache để
+    lần sau (hoặc người xem khác) nhận ngay kết quả, không phải sinh lại.
+    """
+    if not get_model():
+        yield "ERROR: Key chưa được cấu hình."
+        return
+    if not isinstance(char_info, dict):
+        yield "Lỗi Dữ liệu: Jikan không trả về hồ sơ hợp lệ cho nhân vật này. Vui lòng thử tên khác."
+        return
+
+    key = _profile_key(char_info)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Trong lock chỉ đọc cache và đăng ký / nhập vào broadcast; yield sau khi
+    # nhả lock (generator dừng ở yield sẽ giữ lock, chặn mọi session khác)
+    with _profile_streams_lock:
+        broadcast = _profile_streams.get(key)
+        if broadcast is None:
+            # Stream trước có thể vừa xong (đã lưu cache) giữa 2 lần kiểm tra
+            cached = _analysis_cache.get(key)
+            if cached is None:
+                broadcast = _ProfileBroadcast()
+                _profile_streams[key] = broadcast
+                threading.Thread(
+                    target=_run_profile_stream, args=(key, char_info, broadcast),
+                    name="profile-stream", daemon=True,
+                ).start()
+    if broadcast is None:
+        yield cached
+        return
+    yield from broadcast.read()
@@ -1,78 +1,181 @@
-import requests
+import os
+import threading
+import time
+
+from services import http_client
+from services.cache_service import SQLiteCache, cache_path
+
+GENRE_CONTENT_TYPES = ("anime", "manga")
+
+# Danh sách thể loại gần như không đổi nên giữ lâu
+GENRE_CACHE_TTL = int(os.getenv("GENRE_CACHE_TTL", 7 * 24 * 3600))  # giây
+# Lỗi thì chờ một lúc mới thử lại (tăng dần), tránh dồn request khi Jikan sập
+GENRE_RETRY_BACKOFF = 30          # giây
+GENRE_RETRY_BACKOFF_MAX = 15 * 60  # giây
+
+
+def _fetch_genre_map(content_type):
+    """Gọi Jikan lấy danh sách thể loại. Ném exception nếu lỗi."""
+    # URL thay đổi theo content_type
+    url = f"https://api.jikan.moe/v4/genres/{content_type}"
+    response = http_client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"Lỗi API genres {content_type}: {response.status_code}")
+    genres = response.json()["data"]
+    # Tạo mapping
+    return {g["mal_id"]: g["name"] for g in genres}
+
+
+class GenreCache:
+    """
+    Cache ánh xạ ID -> Tên thể loại, thread-safe, có TTL.
+    - Hết hạn thì tải lại; tải lỗi thì vẫn trả bản cũ (nếu có)
+      và chờ backoff mới thử lại.
+    - Lưu xuống đĩa để restart không phải tải lại.
+    """
+
+    def __init__(self, fetch=_fetch_genre_map, ttl=GENRE_CACHE_TTL, disk=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self._maps = {}       # content_type -> (genre_map, fetched_at)
+        self._retry_at = {}   # content_type -> thời điểm được thử lại
+        self._failures = {}   # content_type -> số lần lỗi liên tiếp
+
+    def _fetch_lock(self, content_type):
+        with self._lock:
+            return self._fetch_locks.setdefault(content_type, threading.Lock())
+
+    def _load_from_disk(self, content_type):
+        if self.disk is None:
+            return None
+        entry = self.disk.get(f"genres:{content_type}")
+        if entry is None:
+            return None
+        # JSON không giữ được key kiểu int nên lưu dạng list [id, name]
+        return {mal_id: name for mal_id, name in entry["genres"]}, entry["fetched_at"]
+
+    def _save_to_disk(self, content_type, genre_map, fetched_at):
+        if self.disk is not None:
+            self.disk.set(f"genres:{content_type}", {
+                "genres": list(genre_map.items()),
+                "fetched_at": fetched_at,
+            })
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() - entry[1] < self.ttl
+
+    def get(self, content_type):
+        """
+        Trả về {mal_id: name}. Nếu không tải được và không có bản cũ thì trả {}.
+        """
+        with self._lock:
+            entry = self._maps.get(content_type)
+        if self._fresh(entry):
+            return entry[0]
+
+        # Mỗi loại chỉ 1 luồng được tải, các luồng khác chờ rồi dùng chung kết quả
+        with self._fetch_lock(content_type):
+            with self._lock:
+                entry = self._maps.get(content_type)
+            if entry is None:
+                entry = self._load_from_disk(content_type)
+                if entry is not None:
+                    with self._lock:
+                        self._maps[content_type] = entry
+            if self._fresh(entry):
+                return entry[0]
+
+            stale = entry[0] if entry else {}
+            if time.time() < self._retry_at.get(content_type, 0):
+                return stale
+
+            try:
+                genre_map = self.fetch(content_type)
+            except Exception as e:
+                failures = self._failures.get(content_type, 0) + 1
+                self._failures[content_type] = failures
+                backoff = min(GENRE_RETRY_BACKOFF * 2 ** (failures - 1), GENRE_RETRY_BACKOFF_MAX)
+                self._retry_at[content_type] = time.time() + backoff
+                print(f"Lỗi kết nối genres {content_type}: {e} (thử lại sau {backoff}s)")
+                return stale
+
+            fetched_at = time.time()
+            with self._lock:
+                self._maps[content_type] = (genre_map, fetched_at)
+            self._failures.pop(content_type, None)
+            self._retry_at.pop(content_type, None)
+            self._save_to_disk(content_type, genre_map, fetched_at)
+            return genre_map
+
+    def prewarm(self, content_types=GENRE_CONTENT_TYPES):
+        """Tải trước các loại thể loại trong thread nền."""
+        def run():
+            for content_type in content_types:
+                self.get(content_type)
+
+        thread = threading.Thread(target=run, name="genre-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+
+_genre_cache = GenreCache(
+    disk=SQLiteCache(cache_path("genres.sqlite3"), ttl=30 * 24 * 3600, max_entries=10),
+)
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+
+def prewarm_genre_maps():
+    """
+    Tải trước thể loại anime và manga ở nền, chỉ chạy 1 lần mỗi process.
+    Gọi lúc khởi động để trang Discover Media không phải chờ.
+    """
+    global _prewarm_started
+    with _prewarm_lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    _genre_cache.prewarm()
 
-# Cache để tránh gọi API nhiều lần
-_anime_genre_cache = None
-_manga_genre_cache = None
 
 def get_genre_map(content_type="anime"):
     """
     Lấy ánh xạ ID -> Tên thể loại từ Jikan API.
     Sử dụng cache để tối ưu performance.
-    
+
     Args:
         content_type: "anime" hoặc "manga"
-    
+
     Returns:
         dict: {mal_id: name} hoặc {} nếu lỗi
     """
-    global _anime_genre_cache, _manga_genre_cache
-    
-    # Kiểm tra cache theo loại
-    if content_type == "anime":
-        if _anime_genre_cache is not None:
-            return _anime_genre_cache
-    elif content_type == "manga":
-        if _manga_genre_cache is not None:
-            return _manga_genre_cache
-    
-    # URL thay đổi theo content_type
-    url = f"https://api.jikan.moe/v4/genres/{content_type}"
-    
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            genres = data["data"]
-            
-            # Tạo mapping
-            genre_map = {g["mal_id"]: g["name"] for g in genres}
-            
-            # Lưu vào cache tương ứng
-            if content_type == "anime":
-                _anime_genre_cache = genre_map
-            elif content_type == "manga":
-                _manga_genre_cache = genre_map
-            
-            return genre_map
-        else:
-            print(f"Lỗi API genres {content_type}: {response.status_code}")
-            return {}
-    except Exception as e:
-        print(f"Lỗi kết nối genres {content_type}: {e}")
-        return {}
+    return _genre_cache.get(content_type)
 
 
 def get_genre_names(genre_ids, content_type="anime"):
     """
     Chuyển đổi list ID thành list tên thể loại.
-    
+
     Args:
         genre_ids: List các dict có key 'mal_id', ví dụ: [{'mal_id': 1}, {'mal_id': 2}]
         content_type: "anime" hoặc "manga"
-    
+
     Returns:
         list: Danh sách tên thể loại
     """
     genre_map = get_genre_map(content_type)
-    
+
     if not genre_map:
         return ["N/A"]
-    
+
     # Trích xuất tên từ IDs
     names = []
     for item in genre_ids:
         genre_id = item.get('mal_id')
         if genre_id in genre_map:
             names.append(genre_map[genre_id])
-    
-    return names if names else ["N/A"]
\ No newline at end of file
+
+    return names if names else ["N/A"]
@@ -0,0 +1,332 @@
+import base64
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from services.cache_service import SQLiteCache, cache_path
+
+# Giới hạn công bố của Jikan API v4: 3 request/giây và 60 request/phút
+JIKAN_HOST = "api.jikan.moe"
+JIKAN_PER_SECOND = 3
+JIKAN_PER_MINUTE = 60
+
+DEFAULT_TIMEOUT = 10   # giây
+POOL_SIZE = 20         # số kết nối keep-alive tối đa cho mỗi host
+MAX_429_RETRIES = 2    # số lần thử lại khi vẫn bị Jikan trả 429
+
+# Cache HTTP: trong HTTP_CACHE_TTL giây dùng luôn bản đã lưu (nếu server
+# không gửi Cache-Control: max-age); hết hạn nhưng còn trong cửa sổ
+# stale-while-revalidate thì vẫn trả bản cũ ngay và kiểm tra lại ở nền
+# bằng If-None-Match / If-Modified-Since.
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", 10 * 60))                       # giây
+HTTP_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_STALE_WHILE_REVALIDATE", 24 * 3600))  # giây
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 20000))
+
+
+class SlidingWindowLimit:
+    """
+    Tối đa `limit` request trong mọi khoảng `window` giây liên tiếp
+    (sliding window log: nhớ thời điểm gửi của `limit` request gần nhất).
+    Khác token bucket, không có "burst + nạp lại" vượt quá giới hạn trong 1 cửa sổ.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._sent = deque(maxlen=limit)   # thời điểm gửi (đã hẹn) của các request gần nhất
+
+    def next_slot(self, now):
+        """Thời điểm sớm nhất (>= now) được gửi request kế tiếp."""
+        if len(self._sent) < self.limit:
+            return now
+        return max(now, self._sent[0] + self.window)
+
+    def commit(self, slot):
+        """Ghi nhận 1 request sẽ được gửi lúc `slot`."""
+        self._sent.append(slot)
+
+    def free(self, now):
+        """Số request còn được gửi ngay lúc `now` mà không phải chờ."""
+        return self.limit - sum(1 for sent in self._sent if sent > now - self.window)
+
+
+class RateLimiter:
+    """
+    Kết hợp nhiều giới hạn (ví dụ: theo giây + theo phút), thread-safe.
+    Mỗi request được hẹn 1 thời điểm gửi thỏa mọi giới hạn; thời điểm đó được
+    ghi vào tất cả giới hạn, nên các lời gọi vượt giới hạn xếp hàng theo thứ tự
+    thay vì bị từ chối.
+    """
+
+    def __init__(self, *limits, clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Giữ chỗ ở mọi giới hạn, trả về số giây phải chờ trước khi được gửi."""
+        with self._lock:
+            now = self.clock()
+            slot = max(limit.next_slot(now) for limit in self.limits)
+            for limit in self.limits:
+                limit.commit(slot)
+        return slot - now
+
+    def try_reserve(self, headroom=0.0):
+        """
+        Giữ chỗ gửi ngay nếu mọi giới hạn còn trống hơn `headroom` (tỉ lệ
+        0..1 của giới hạn để dành cho request khác), không thì không giữ chỗ.
+        Dùng cho việc chạy nền: không bao giờ xếp hàng trước request của người dùng.
+
+        Returns:
+            True nếu đã giữ chỗ (gửi được ngay)
+        """
+        with self._lock:
+            now = self.clock()
+            if any(limit.free(now) <= headroom * limit.limit for limit in self.limits):
+                return False
+            for limit in self.limits:
+                limit.commit(now)
+            return True
+
+    def free(self):
+        """Số request còn được gửi ngay mà không phải chờ (theo giới hạn chặt nhất)."""
+        with self._lock:
+            now = self.clock()
+            return min(limit.free(now) for limit in self.limits)
+
+    def acquire(self):
+        """Chặn luồng hiện tại cho tới khi được phép gửi request."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Dùng chung cho toàn bộ process (mọi session Streamlit)
+jikan_limiter = RateLimiter(
+    SlidingWindowLimit(JIKAN_PER_SECOND, 1.0),
+    SlidingWindowLimit(JIKAN_PER_MINUTE, 60.0),
+)
+
+_RATE_LIMITERS = {
+    JIKAN_HOST: jikan_limiter,
+}
+
+
+def _create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": "ITookLibrary/1.0"})
+    return session
+
+
+_session = _create_session()
+
+
+def get_session():
+    """Trả về Session keep-alive dùng chung của process."""
+    return _session
+
+
+def _retry_after_seconds(response, default=1.0):
+    try:
+        return float(response.headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _send(url, params=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Gửi GET thật (qua rate limiter nếu host có giới hạn)."""
+    limiter = _RATE_LIMITERS.get(urlparse(url).hostname)
+
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        response = _session.get(url, params=params, timeout=timeout, **kwargs)
+        if response.status_code != 429 or not limiter or attempt >= MAX_429_RETRIES:
+            return response
+        attempt += 1
+        time.sleep(_retry_after_seconds(response))
+
+
+# ===== CACHE HTTP (ETag / Last-Modified) =====
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+_CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+
+
+class HttpCache:
+    """
+    Lưu body + validator (ETag, Last-Modified) của các response 200.
+    Dữ liệu nằm trong SQLite nên còn sau khi restart.
+    """
+
+    def __init__(self, store, default_ttl=HTTP_CACHE_TTL, stale_while_revalidate=HTTP_STALE_WHILE_REVALIDATE):
+        self.store = store
+        self.default_ttl = default_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.counters = {"fresh": 0, "stale": 0, "revalidated": 0, "miss": 0}
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="http-revalidate")
+
+    @staticmethod
+    def key(url, params):
+        query = urlencode(sorted((params or {}).items()), doseq=True)
+        return f"GET {url}?{query}"
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _freshness(self, headers):
+        match = _MAX_AGE_RE.search(headers.get("Cache-Control") or "")
+        if match and "no-cache" not in headers.get("Cache-Control", ""):
+            return int(match.group(1))
+        return self.default_ttl
+
+    def save(self, key, response):
+        headers = {name: response.headers[name] for name in _CACHED_HEADERS if name in response.headers}
+        self.store.set(key, {
+            "url": response.url,
+            "headers": headers,
+            "body": base64.b64encode(response.content).decode("ascii"),
+            "stored_at": time.time(),
+            "fresh_for": self._freshness(headers),
+        })
+
+    def touch(self, key, entry, response):
+        """Server trả 304: body không đổi, chỉ gia hạn (và cập nhật validator)."""
+        headers = dict(entry["headers"])
+        for name in _CACHED_HEADERS:
+            if name in response.headers:
+                headers[name] = response.headers[name]
+        entry = {**entry, "headers": headers, "stored_at": time.time(), "fresh_for": self._freshness(headers)}
+        self.store.set(key, entry)
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    @staticmethod
+    def to_response(entry):
+        """Dựng lại requests.Response từ entry đã lưu."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+    def revalidate(self, key, url, params, timeout, entry, **kwargs):
+        """Gửi request có điều kiện; trả về Response mới hoặc dựng từ cache nếu 304."""
+        headers = {**kwargs.pop("headers", {}), **self.conditional_headers(entry)}
+        try:
+            response = _send(url, params=params, timeout=timeout, headers=headers, **kwargs)
+        except requests.RequestException:
+            # Mất kết nối: dùng tạm bản cũ nếu có
+            if entry is None:
+                raise
+            return self.to_response(entry)
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            return self.to_response(self.touch(key, entry, response))
+        if response.status_code == 200:
+            self.save(key, response)
+        elif entry is not None and response.status_code >= 500:
+            # Server lỗi: dùng tạm bản cũ còn hơn báo lỗi cho người dùng
+            return self.to_response(entry)
+        return response
+
+    def revalidate_in_background(self, key, url, params, timeout, entry, **kwargs):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def run():
+            try:
+                self.revalidate(key, url, params, timeout, entry, **kwargs)
+            except Exception as e:
+                print(f"Lỗi làm mới cache {url}: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._executor.submit(run)
+
+    def get(self, url, params=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        key = self.key(url, params)
+        entry = self.store.get(key)
+        if entry is not None:
+            age = time.time() - entry["stored_at"]
+            if age < entry["fresh_for"]:
+                self._count("fresh")
+                return self.to_response(entry)
+            if age < entry["fresh_for"] + self.stale_while_revalidate:
+                self._count("stale")
+                self.revalidate_in_background(key, url, params, timeout, entry, **kwargs)
+                return self.to_response(entry)
+        else:
+            self._count("miss")
+        return self.revalidate(key, url, params, timeout, entry, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+_http_cache = HttpCache(
+    SQLiteCache(
+        cache_path("http.sqlite3"),
+        # Giữ entry lâu hơn hạn dùng để còn validator cho request có điều kiện
+        ttl=30 * 24 * 3600,
+        max_entries=HTTP_CACHE_MAX_ENTRIES,
+    )
+)
+
+
+def get_http_cache_stats():
+    """Số lần dùng cache: fresh, stale (trả cũ + làm mới nền), revalidated (304), miss."""
+    return _http_cache.stats()
+
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, cache=True, **kwargs):
+    """
+    Gửi GET qua Session dùng chung, có timeout mặc định.
+    Với host có rate limit (Jikan) thì chờ tới lượt trước khi gửi,
+    và tự thử lại nếu vẫn bị 429.
+    Response 200 được lưu cache kèm ETag/Last-Modified; khi hết hạn sẽ
+    hỏi lại server bằng request có điều kiện và dùng lại body nếu nhận 304.
+
+    Args:
+        url: Địa chỉ cần gọi
+        params: Query params (dict)
+        timeout: Timeout tính bằng giây (mặc định DEFAULT_TIMEOUT)
+        cache: False để luôn gọi thẳng server, bỏ qua cache HTTP
+
+    Returns:
+        requests.Response
+    """
+    if not cache:
+        return _send(url, params=params, timeout=timeout, **kwargs)
+    return _http_cache.get(url, params=params, timeout=timeout, **kwargs)
@@ -0,0 +1,353 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image
+
+from services import http_client
+from services.cache_service import CACHE_DIR, MemoryTTLCache, cache_path
+from services.metrics import WindowStats
+from services.singleflight import SingleFlight
+
+# Thư mục chứa ảnh đã thu nhỏ và giới hạn dung lượng (xóa ảnh lâu không dùng khi vượt)
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images")
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", 200))
+
+# Số ảnh tải về cùng lúc tối đa (không dồn hàng chục kết nối vào CDN của MAL/Google)
+IMAGE_DOWNLOAD_CONCURRENCY = int(os.getenv("IMAGE_DOWNLOAD_CONCURRENCY", 6))
+IMAGE_DOWNLOAD_TIMEOUT = 8       # giây cho mỗi lần tải ảnh gốc
+# Giây giao diện chờ ảnh chưa có trong cache; mặc định 0 = dùng ngay URL gốc, ảnh tải ở nền cho lần sau
+IMAGE_WAIT_TIMEOUT = float(os.getenv("IMAGE_WAIT_TIMEOUT", 0))
+# Chỉ ghi lại thời điểm dùng ảnh (cho LRU) khi lần ghi trước đã cũ hơn chừng này giây
+IMAGE_ACCESS_WRITE_INTERVAL = 60
+IMAGE_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Các kích thước tạo sẵn: tên -> chiều ngang tối đa (px)
+IMAGE_VARIANTS = {
+    "grid": 240,    # lưới kết quả, favorites, ảnh bìa trong expander
+    "card": 480,    # thẻ gợi ý
+    "large": 900,   # ảnh nhân vật đang xem
+}
+IMAGE_WEBP_QUALITY = 80
+# Bản gốc đã chuẩn hóa (nguồn để tạo các kích thước trên khi cần)
+IMAGE_SOURCE_VARIANT = "source"
+IMAGE_SOURCE_QUALITY = 90
+# Ảnh tải lỗi (404, không phải ảnh...) được nhớ trong thời gian này, không tải lại liên tục
+IMAGE_FAILURE_TTL = int(os.getenv("IMAGE_FAILURE_TTL", 5 * 60))   # giây
+
+
+class DiskImageCache:
+    """
+    Cache ảnh WebP trên đĩa, giới hạn theo tổng dung lượng.
+    - Mỗi ảnh là 1 file trong `directory`.
+    - Bảng SQLite ghi kích thước và lần dùng gần nhất của từng file;
+      vượt `max_bytes` thì xóa các file lâu không dùng nhất (LRU).
+    - Lần dùng gần nhất chỉ được ghi lại khi đã cũ hơn `access_write_interval`
+      giây, để mỗi lần vẽ lưới không phải UPDATE + commit cho từng ảnh.
+    """
+
+    def __init__(self, directory, index_path, max_bytes, access_write_interval=IMAGE_ACCESS_WRITE_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.access_write_interval = access_write_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_accessed ON images(accessed)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.webp")
+
+    def get(self, key, record=True):
+        """Trả về đường dẫn file đã cache hoặc None (record=False: không tính hit/miss)."""
+        path = self.path_for(key)
+        with self._lock:
+            row = self._conn.execute("SELECT size, accessed FROM images WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(path):
+                if row is not None:
+                    # File bị xóa ngoài ý muốn: bỏ luôn dòng trong bảng
+                    self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._total -= row[0]
+                self.misses += record
+                return None
+            now = time.time()
+            if now - row[1] >= self.access_write_interval:
+                self._conn.execute("UPDATE images SET accessed = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += record
+        return path
+
+    def put(self, key, data):
+        """Ghi ảnh vào cache rồi dọn bớt nếu vượt dung lượng. Trả về đường dẫn file."""
+        path = self.path_for(key)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)   # ghi xong mới đổi tên: không ai đọc được file dở
+
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM images WHERE key = ?", (key,)).fetchone()
+            self._total += len(data) - (row[0] if row else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (key, size, accessed) VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+        return path
+
+    def _evict(self):
+        """Xóa file lâu không dùng nhất cho tới khi dưới max_bytes (gọi khi đang giữ lock)."""
+        if self._total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM images ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            self._total -= size
+            self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "files": len(self),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+_image_cache = DiskImageCache(IMAGE_CACHE_DIR, cache_path("images.sqlite3"), IMAGE_CACHE_MAX_MB * 1024 * 1024)
+_executor = ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_CONCURRENCY, thread_name_prefix="image-proxy")
+_flight = SingleFlight()
+_failed_downloads = MemoryTTLCache(ttl=IMAGE_FAILURE_TTL, max_entries=2000)
+
+_counters_lock = threading.Lock()
+_counters = {"downloads": 0, "failed": 0, "variants": 0, "source_bytes": 0, "stored_bytes": 0, "partial_grids": 0}
+
+# Ảnh đang tải (cache key -> Future) để prefetch và lúc vẽ lưới dùng chung 1 việc
+_pending_lock = threading.Lock()
+_pending = {}
+
+# Thời gian từ lúc có kết quả tìm kiếm tới lúc mọi ảnh của lưới sẵn sàng (giây)
+_grid_paint_stats = WindowStats()
+
+
+def _count(**values):
+    with _counters_lock:
+        for name, value in values.items():
+            _counters[name] += value
+
+
+def _cache_key(url, variant):
+    return f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:24]}.{variant}"
+
+
+def _encode_variant(image, max_width, quality=IMAGE_WEBP_QUALITY):
+    """Thu nhỏ ảnh về tối đa `max_width` px chiều ngang (không phóng to) và nén WebP."""
+    if image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _download_source(url):
+    """
+    Tải ảnh gốc 1 lần và lưu 1 bản gốc đã chuẩn hóa (WebP, rộng tối đa bằng
+    kích thước lớn nhất) để tạo các kích thước khác khi cần.
+
+    Returns:
+        Đường dẫn file bản gốc, hoặc None nếu lỗi (URL bị nhớ lỗi trong IMAGE_FAILURE_TTL giây)
+    """
+    try:
+        response = http_client.get(url, cache=False, timeout=IMAGE_DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        data = response.content
+        if len(data) > IMAGE_MAX_SOURCE_BYTES:
+            raise ValueError(f"ảnh quá lớn ({len(data)} bytes)")
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.mode or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    except Exception as e:
+        print(f"Không tải được ảnh {url}: {e}")
+        _failed_downloads.set(url, True)
+        _count(failed=1)
+        return None
+
+    encoded = _encode_variant(image, max(IMAGE_VARIANTS.values()), IMAGE_SOURCE_QUALITY)
+    path = _image_cache.put(_cache_key(url, IMAGE_SOURCE_VARIANT), encoded)
+    _count(downloads=1, source_bytes=len(data), stored_bytes=len(encoded))
+    return path
+
+
+def _open_source(url):
+    """Mở bản gốc đã lưu của `url` (tải về nếu chưa có). Trả về Image hoặc None."""
+    path = _image_cache.get(_cache_key(url, IMAGE_SOURCE_VARIANT), record=False)
+    if path is None:
+        if _failed_downloads.get(url) is not None:
+            return None   # vừa lỗi gần đây: không tải lại ngay
+        path = _flight.do(url, _download_source, url)
+        if path is None:
+            return None
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return image.copy()
+    except OSError as e:   # file vừa bị dọn khỏi cache
+        print(f"Không đọc được ảnh đã lưu {path}: {e}")
+        return None
+
+
+def _make_variant(url, variant):
+    """Tạo (chỉ) kích thước `variant` từ bản gốc đã lưu. Trả về đường dẫn file hoặc None."""
+    key = _cache_key(url, variant)
+    path = _image_cache.get(key, record=False)
+    if path:
+        return path
+    image = _open_source(url)
+    if image is None:
+        return None
+    encoded = _encode_variant(image, IMAGE_VARIANTS[variant])
+    _count(variants=1, stored_bytes=len(encoded))
+    return _image_cache.put(key, encoded)
+
+
+def _load(url, variant):
+    """Lấy ảnh từ cache, chưa có thì tạo (các lời gọi trùng ảnh chỉ tải / nén 1 lần)."""
+    # Kiểm tra lại: có thể 1 lời gọi khác vừa tạo xong trong lúc chờ tới lượt
+    path = _image_cache.get(_cache_key(url, variant), record=False)
+    if path:
+        return path
+    return _flight.do(_cache_key(url, variant), _make_variant, url, variant)
+
+
+def _is_remote(url):
+    return isinstance(url, str) and url.startswith(("http://", "https://"))
+
+
+def _submit(url, variant):
+    """Đưa ảnh vào hàng đợi tải (hoặc trả về Future đang tải sẵn cho ảnh đó)."""
+    key = _cache_key(url, variant)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _executor.submit(_load, url, variant)
+            _pending[key] = future
+            future.add_done_callback(lambda _: _forget(key))
+        return future
+
+
+def _forget(key):
+    with _pending_lock:
+        _pending.pop(key, None)
+
+
+def prefetch_thumbnails(urls, variant="grid"):
+    """
+    Bắt đầu tải nền các ảnh chưa có trong cache (song song, tối đa
+    IMAGE_DOWNLOAD_CONCURRENCY ảnh cùng lúc). Hàm trả về ngay, không chờ.
+    """
+    for url in urls:
+        if (_is_remote(url) and _image_cache.get(_cache_key(url, variant), record=False) is None
+                and _failed_downloads.get(url) is None):
+            _submit(url, variant)
+
+
+def get_thumbnails(urls, variant="grid", timeout=IMAGE_WAIT_TIMEOUT):
+    """
+    Đổi danh sách URL ảnh thành đường dẫn file WebP đã thu nhỏ trên máy,
+    dùng thẳng cho st.image. Các ảnh chưa có trong cache được tải song song
+    ở nền (tối đa IMAGE_DOWNLOAD_CONCURRENCY ảnh cùng lúc).
+
+    Ảnh nào chưa có trong cache (hoặc lỗi) thì giữ URL gốc để trình duyệt tự
+    tải như bình thường, không chặn lần chạy script; lần vẽ sau sẽ dùng bản đã thu nhỏ.
+
+    Args:
+        urls: List URL (None / URL không phải http giữ nguyên)
+        variant: Tên kích thước trong IMAGE_VARIANTS
+        timeout: Số giây tối đa chờ ảnh chưa có trong cache (0 = không chờ)
+
+    Returns:
+        List cùng độ dài với `urls`
+    """
+    results = list(urls)
+    pending = {}
+    for idx, url in enumerate(results):
+        if not _is_remote(url) or _failed_downloads.get(url) is not None:
+            continue   # ảnh vừa tải lỗi: dùng luôn URL gốc
+        path = _image_cache.get(_cache_key(url, variant))
+        if path:
+            results[idx] = path
+        else:
+            pending[idx] = _submit(url, variant)
+
+    if pending and timeout > 0:
+        wait(pending.values(), timeout=timeout)
+        for idx, future in pending.items():
+            if future.done() and future.exception() is None and future.result():
+                results[idx] = future.result()
+    return results
+
+
+def record_grid_paint(seconds, thumbnails):
+    """
+    Ghi lại thời gian từ lúc có kết quả tới lúc cả lưới ảnh sẵn sàng.
+
+    Args:
+        seconds: Thời gian đã đo
+        thumbnails: Kết quả get_thumbnails của lưới (còn URL gốc = ảnh chưa tải xong)
+    """
+    _grid_paint_stats.add(seconds)
+    if any(_is_remote(path) for path in thumbnails):
+        _count(partial_grids=1)
+
+
+def get_thumbnail(url, variant="grid", timeout=IMAGE_WAIT_TIMEOUT):
+    """1 ảnh: đường dẫn file đã thu nhỏ, hoặc URL gốc nếu chưa có / lỗi."""
+    return get_thumbnails([url], variant, timeout)[0]
+
+
+def get_image_proxy_stats():
+    """Số lần tải, dung lượng ảnh gốc / ảnh đã thu nhỏ, thống kê cache đĩa và thời gian vẽ lưới."""
+    with _counters_lock:
+        snapshot = dict(_counters)
+    with _pending_lock:
+        snapshot["pending"] = len(_pending)
+    snapshot["cache"] = _image_cache.stats()
+    snapshot["grid_paint"] = _grid_paint_stats.snapshot()
+    return snapshot
@@ -0,0 +1,154 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+# Kích thước tối đa (cạnh dài, pixel) của ảnh trước khi gửi cho Gemini
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", 1024))
+VISION_JPEG_QUALITY = 85
+
+# 2 ảnh có dHash lệch nhau tối đa chừng này bit được coi là "gần giống nhau"
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", 6))
+# Số hash giữ lại tối đa (bộ nhớ + SQLite); vượt thì bỏ hash lâu không dùng nhất
+PHASH_MAX_ENTRIES = int(os.getenv("PHASH_MAX_ENTRIES", 5000))
+
+
+def prepare_image(image, max_side=VISION_MAX_SIDE, quality=VISION_JPEG_QUALITY):
+    """
+    Thu nhỏ ảnh về cạnh dài tối đa `max_side` và nén lại thành JPEG.
+
+    Args:
+        image: Ảnh PIL (ảnh upload có thể là ảnh điện thoại nhiều megapixel)
+        max_side: Cạnh dài tối đa sau khi thu nhỏ
+        quality: Chất lượng JPEG
+
+    Returns:
+        dict {"mime_type": "image/jpeg", "data": bytes} gửi thẳng cho Gemini được
+    """
+    img = image.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+
+
+def dhash(image, hash_size=8):
+    """
+    Tính difference hash (dHash) 64-bit của ảnh.
+    Ảnh gần giống nhau (resize, nén lại, chụp màn hình lại) cho hash gần nhau.
+
+    Returns:
+        int: Giá trị hash
+    """
+    img = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class PerceptualHashIndex:
+    """
+    Bảng tra dHash -> tên nhân vật đã nhận diện, lưu trên SQLite.
+    Toàn bộ hash được giữ trong bộ nhớ để tra cứu nhanh,
+    ghi xuống đĩa để còn dùng được sau khi restart.
+    Khi vượt `max_entries` thì xóa các hash lâu không dùng nhất (LRU).
+    """
+
+    def __init__(self, path, max_distance=PHASH_MAX_DISTANCE, max_entries=PHASH_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS phash (hash TEXT PRIMARY KEY, name TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        # File tạo từ bản cũ chưa có cột accessed: thêm vào, coi lần dùng gần nhất là lúc tạo
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(phash)")}
+        if "accessed" not in columns:
+            self._conn.execute("ALTER TABLE phash ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE phash SET accessed = created")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_phash_accessed ON phash(accessed)")
+        self._conn.commit()
+        # SQLite INTEGER là số có dấu 64-bit nên lưu hash dạng hex
+        # OrderedDict theo thứ tự dùng: đầu = lâu không dùng nhất
+        self._entries = OrderedDict(
+            (int(h, 16), name) for h, name in self._conn.execute("SELECT hash, name FROM phash ORDER BY accessed ASC")
+        )
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+
+    def lookup(self, image_hash):
+        """Trả về tên của ảnh gần giống nhất (trong ngưỡng) hoặc None."""
+        with self._lock:
+            best_hash, best_name, best_distance = None, None, self.max_distance + 1
+            for known_hash, name in self._entries.items():
+                distance = hamming_distance(image_hash, known_hash)
+                if distance < best_distance:
+                    best_hash, best_name, best_distance = known_hash, name, distance
+                    if distance == 0:
+                        break
+            if best_name is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_hash)
+            self._conn.execute(
+                "UPDATE phash SET accessed = ? WHERE hash = ?", (time.time(), format(best_hash, "016x"))
+            )
+            self._conn.commit()
+            return best_name
+
+    def add(self, image_hash, name):
+        now = time.time()
+        with self._lock:
+            self._entries[image_hash] = name
+            self._entries.move_to_end(image_hash)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO phash (hash, name, created, accessed) VALUES (?, ?, ?, ?)",
+                (format(image_hash, "016x"), name, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Bỏ các hash lâu không dùng nhất cho tới khi còn max_entries (gọi khi đang giữ lock)."""
+        stale = []
+        while len(self._entries) > self.max_entries:
+            old_hash, _ = self._entries.popitem(last=False)
+            stale.append((format(old_hash, "016x"),))
+        if stale:
+            self._conn.executemany("DELETE FROM phash WHERE hash = ?", stale)
+            self.evictions += len(stale)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import threading
+
+import httpx
+
+from services import http_client
+from services.cache_service import SQLiteCache, cache_path
+from services.name_index import remember_characters
+
+JIKAN_BASE_URL = "https://api.jikan.moe/v4"
+PREFETCH_TOP_N = 5   # số ứng viên đầu lưới được tải chi tiết trước
+# Prefetch chỉ dùng phần ngân sách Jikan còn dư: luôn để dành 1/3 mỗi giới hạn
+# (1 request/giây, 20 request/phút) cho thao tác của người dùng
+PREFETCH_HEADROOM = 1 / 3
+PREFETCH_POLL_INTERVAL = 0.25   # giây giữa 2 lần xem còn ngân sách chưa
+PREFETCH_MAX_WAIT = 5.0         # giây; chờ lâu hơn thì bỏ prefetch id đó
+
+JIKAN_DETAIL_CACHE_TTL = int(os.getenv("JIKAN_DETAIL_CACHE_TTL", 24 * 3600))  # giây
+
+_detail_cache = SQLiteCache(
+    cache_path("jikan_character_full.sqlite3"),
+    ttl=JIKAN_DETAIL_CACHE_TTL,
+    max_entries=5000,
+)
+
+
+class AsyncJikanClient:
+    """
+    Client Jikan bất đồng bộ (httpx) dùng chung rate limiter với http_client,
+    nên tổng số request của cả process vẫn nằm trong giới hạn của Jikan.
+    background=True: chỉ gửi khi limiter còn dư hơn PREFETCH_HEADROOM, không
+    xếp hàng trước request của người dùng và không thử lại khi bị 429.
+
+    Dùng:
+        async with AsyncJikanClient() as client:
+            data = await client.get_character_full(17)
+    """
+
+    def __init__(self, base_url=JIKAN_BASE_URL, limiter=http_client.jikan_limiter,
+                 timeout=http_client.DEFAULT_TIMEOUT, background=False):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = limiter
+        self.timeout = timeout
+        self.background = background
+        self._client = None
+
+    async def open(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_keepalive_connections=http_client.POOL_SIZE),
+            )
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _wait_for_spare_budget(self):
+        """Chờ tới khi limiter còn dư ngân sách cho việc chạy nền (ném lỗi nếu chờ quá lâu)."""
+        waited = 0.0
+        while not self.limiter.try_reserve(PREFETCH_HEADROOM):
+            if waited >= PREFETCH_MAX_WAIT:
+                raise RuntimeError("Jikan đang bận, bỏ qua tải trước")
+            await asyncio.sleep(PREFETCH_POLL_INTERVAL)
+            waited += PREFETCH_POLL_INTERVAL
+
+    async def _get(self, path, params=None):
+        attempt = 0
+        while True:
+            # Chờ tới lượt mà không chặn event loop
+            if self.limiter and self.background:
+                await self._wait_for_spare_budget()
+            else:
+                delay = self.limiter.reserve() if self.limiter else 0
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            response = await self._client.get(f"{self.base_url}{path}", params=params)
+            if response.status_code != 429 or self.background or attempt >= http_client.MAX_429_RETRIES:
+                break
+            attempt += 1
+            await asyncio.sleep(http_client._retry_after_seconds(response))
+        if response.status_code != 200:
+            raise RuntimeError(f"Jikan API Error: {response.status_code}")
+        return response.json()
+
+    async def get_character_full(self, mal_id):
+        """Lấy /characters/{id}/full. Ném exception nếu lỗi."""
+        data = await self._get(f"/characters/{mal_id}/full")
+        return data["data"]
+
+    async def get_characters_full(self, mal_ids):
+        """
+        Lấy chi tiết nhiều nhân vật đồng thời.
+
+        Returns:
+            dict {mal_id: data}, bỏ qua các id bị lỗi
+        """
+        results = await asyncio.gather(
+            *(self.get_character_full(mal_id) for mal_id in mal_ids),
+            return_exceptions=True,
+        )
+        details = {}
+        for mal_id, result in zip(mal_ids, results):
+            if isinstance(result, Exception):
+                print(f"Lỗi tải chi tiết nhân vật {mal_id}: {result}")
+            else:
+                details[mal_id] = result
+        return details
+
+
+# ===== PREFETCH CHẠY NỀN =====
+# Một event loop riêng chạy trong thread nền, dùng chung cho mọi session
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_pending = {}   # mal_id -> concurrent.futures.Future
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="jikan-prefetch", daemon=True).start()
+        return _loop
+
+
+async def _prefetch(mal_ids):
+    global _client
+    if _client is None:
+        _client = await AsyncJikanClient(background=True).open()
+    details = await _client.get_characters_full(mal_ids)
+    for mal_id, data in details.items():
+        _detail_cache.set(f"character_full:{mal_id}", data)
+    remember_characters(details.values())
+    return details
+
+
+def _forget(mal_ids):
+    with _loop_lock:
+        for mal_id in mal_ids:
+            _pending.pop(mal_id, None)
+
+
+def prefetch_character_details(mal_ids):
+    """
+    Bắt đầu tải nền /characters/{id}/full cho các id chưa có trong cache.
+    Hàm trả về ngay, không chờ.
+    """
+    missing = []
+    for mal_id in mal_ids:
+        if _detail_cache.get(f"character_full:{mal_id}") is None:
+            missing.append(mal_id)
+    with _loop_lock:
+        missing = [mal_id for mal_id in missing if mal_id not in _pending]
+    if not missing:
+        return None
+
+    future = asyncio.run_coroutine_threadsafe(_prefetch(missing), _get_loop())
+    with _loop_lock:
+        for mal_id in missing:
+            _pending[mal_id] = future
+    future.add_done_callback(lambda _: _forget(missing))
+    return future
+
+
+def get_character_details(mal_id, wait=0):
+    """
+    Lấy chi tiết nhân vật đã được prefetch.
+
+    Args:
+        mal_id: ID nhân vật
+        wait: Số giây tối đa chờ nếu id đang được tải dở
+
+    Returns:
+        dict chi tiết hoặc None nếu chưa có
+    """
+    key = f"character_full:{mal_id}"
+    data = _detail_cache.get(key)
+    if data is not None or wait <= 0:
+        return data
+
+    with _loop_lock:
+        future = _pending.get(mal_id)
+    if future is not None:
+        try:
+            future.result(timeout=wait)
+        except Exception:
+            return None
+        data = _detail_cache.get(key)
+    return data
@@ -1,4 +1,57 @@
-import requests
+import os
+
+from services import http_client
+from services.cache_service import SQLiteCache, cache_path
+from services.name_index import remember_characters
+from services.singleflight import single_flight
+
+# Cache kết quả tìm nhân vật trên đĩa để không gọi lại Jikan cho cùng một tên
+JIKAN_CACHE_TTL = int(os.getenv("JIKAN_CACHE_TTL", 24 * 3600))  # giây
+JIKAN_CACHE_MAX_ENTRIES = int(os.getenv("JIKAN_CACHE_MAX_ENTRIES", 5000))
+
+_character_cache = SQLiteCache(
+    cache_path("jikan_characters.sqlite3"),
+    ttl=JIKAN_CACHE_TTL,
+    max_entries=JIKAN_CACHE_MAX_ENTRIES,
+)
+
+
+def _normalize_query(name):
+    """Chuẩn hóa tên để " Naruto  " và "naruto" dùng chung 1 entry cache."""
+    return " ".join(str(name).lower().split())
+
+
+def _cache_key(name, limit):
+    return f"characters:{_normalize_query(name)}:{limit}"
+
+
+# Nhiều session tìm cùng một tên cùng lúc chỉ tạo 1 request tới Jikan
+@single_flight(_cache_key)
+def _search_characters(name, limit):
+    """
+    Gọi Jikan /characters (có cache).
+    Trả về list nhân vật; ném exception nếu API lỗi (lỗi thì không lưu cache).
+    """
+    key = _cache_key(name, limit)
+    cached = _character_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url = "https://api.jikan.moe/v4/characters"
+    response = http_client.get(url, params={"q": name, "limit": limit})
+    if response.status_code == 200:
+        data = response.json()['data']
+        _character_cache.set(key, data)
+        # Ghi nhớ tên để gợi ý / tra tên mờ cục bộ lần sau
+        remember_characters(data)
+        return data
+    raise RuntimeError(f"Jikan API Error: {response.status_code}")
+
+
+def get_character_cache_stats():
+    """Thống kê hit/miss của cache nhân vật."""
+    return _character_cache.stats()
+
 
 def get_character_data(name):
     """
@@ -7,12 +60,9 @@ def get_character_data(name):
     Output: Dictionary chứa thông tin hoặc None
     """
     # Lấy 10 kết quả thay vì 1
-    url = f"https://api.jikan.moe/v4/characters?q={name}&limit=10"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            # trả 1 loạt kết quả
-            return response.json()['data']
+        # trả 1 loạt kết quả
+        return _search_characters(name, 10)
     except Exception as e:
         print(f"Lỗi Jikan: {e}")
     return []
@@ -22,13 +72,10 @@ def get_one_character_data(name):
     Chỉ lấy thông tin chi tiết của 1 nhân vật duy nhất.
     Trả về Dictionary (Từ điển) duy nhất.
     """
-    url = f"https://api.jikan.moe/v4/characters?q={name}&limit=1"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()['data']
-            if data:
-                return data[0] # <<--- Lấy đúng phần tử [0]
+        data = _search_characters(name, 1)
+        if data:
+            return data[0] # <<--- Lấy đúng phần tử [0]
     except Exception as e:
         print(f"Lỗi kết nối Jikan: {e}")
     return None
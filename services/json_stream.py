@@ -0,0 +1,64 @@
+import json
+
+
+def iter_json_array_objects(chunks):
+    """
+    Parse dần một JSON array các object từ các đoạn text (ví dụ stream của Gemini),
+    yield từng object ngay khi dấu `}` đóng của nó xuất hiện, không chờ cả array.
+
+    - Bỏ qua mọi thứ trước dấu `[` đầu tiên (ví dụ ```json).
+    - Object nào lỗi cú pháp thì bỏ qua, các object sau vẫn được đọc tiếp.
+
+    Args:
+        chunks: Iterable các chuỗi
+
+    Yields:
+        dict
+    """
+    depth = 0            # độ sâu ngoặc; 1 = đang ở trong array ngoài cùng
+    started = False
+    in_string = False
+    escaped = False
+    buffer = []
+
+    for chunk in chunks:
+        for ch in chunk:
+            if not started:
+                if ch == "[":
+                    started = True
+                    depth = 1
+                continue
+
+            if depth >= 2:
+                buffer.append(ch)
+
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+
+            if ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+                if depth == 2:
+                    buffer = [ch]
+            elif ch in "}]":
+                depth -= 1
+                if depth == 1 and buffer:
+                    text = "".join(buffer)
+                    buffer = []
+                    try:
+                        value = json.loads(text)
+                    except ValueError as e:
+                        print(f"Bỏ qua object JSON lỗi: {e}")
+                        continue
+                    if isinstance(value, dict):
+                        yield value
+                elif depth == 0:
+                    # Hết array ngoài cùng
+                    return
@@ -0,0 +1,82 @@
+"""
+Chế độ "lite" cho máy yếu và lúc server đông người:
+không overlay, không animation, không ảnh nền / sticker từ xa, lưới kết quả
+dùng ảnh thumbnail nhỏ.
+
+Bật bằng 1 trong các cách (ưu tiên từ trên xuống):
+  - query param:  ?lite=1 (bật) / ?lite=0 (tắt)
+  - biến môi trường ITOOK_LITE_MODE = on | off | auto (mặc định auto)
+  - auto: tự bật khi server đang tải nặng (nhiều phiên đang mở hoặc hàng đợi
+    Gemini đang phải xếp hàng)
+"""
+import os
+
+LITE_MODE = os.getenv("ITOOK_LITE_MODE", "auto").lower()
+LITE_AUTO_SESSIONS = int(os.getenv("LITE_AUTO_SESSIONS", "40"))
+LITE_AUTO_QUEUE = int(os.getenv("LITE_AUTO_QUEUE", "4"))
+
+_TRUE = {"1", "true", "on", "yes"}
+_FALSE = {"0", "false", "off", "no"}
+
+
+def count_active_sessions():
+    """Số phiên Streamlit đang mở trên process này (0 nếu không đọc được)."""
+    try:
+        from streamlit import runtime
+
+        if not runtime.exists():
+            return 0
+        session_mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+        if session_mgr is None:   # ví dụ khi chạy bằng streamlit.testing
+            return 0
+        return session_mgr.num_active_sessions()
+    except Exception as e:
+        print(f"Không đọc được số phiên đang mở: {e}")
+        return 0
+
+
+def is_server_busy():
+    """Server đang tải nặng: nhiều phiên đang mở hoặc lời gọi Gemini đang xếp hàng."""
+    from services.gemini_service import get_gemini_limiter_stats
+
+    if count_active_sessions() >= LITE_AUTO_SESSIONS:
+        return True
+    return get_gemini_limiter_stats()["queued"] >= LITE_AUTO_QUEUE
+
+
+def detect_lite_mode(query_value=None):
+    """
+    Quyết định có dùng chế độ lite cho phiên hiện tại không.
+
+    Args:
+        query_value: Giá trị query param `lite` (None nếu không có)
+
+    Returns:
+        bool
+    """
+    if query_value is not None:
+        value = str(query_value).lower()
+        if value in _TRUE or value == "":
+            return True
+        if value in _FALSE:
+            return False
+    if LITE_MODE in _TRUE:
+        return True
+    if LITE_MODE in _FALSE:
+        return False
+    return is_server_busy()
+
+
+def jikan_image_url(images, lite=False):
+    """
+    Lấy URL ảnh từ trường `images` của Jikan.
+    Chế độ lite ưu tiên ảnh nhỏ (small_image_url), không có thì dùng ảnh thường.
+    """
+    images = images or {}
+    jpg = images.get("jpg") or {}
+    if lite:
+        webp = images.get("webp") or {}
+        small = jpg.get("small_image_url") or webp.get("small_image_url")
+        if small:
+            return small
+    return jpg.get("image_url")
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from services import http_client
+from services.books_service import _keyword_params, _search_volumes
+from services.cache_service import MemoryTTLCache
+from services.fanout import gather_with_deadline, reciprocal_rank_fusion
+
+# Kết quả tìm thấy giữ lâu, kết quả "không tìm thấy" giữ ngắn hơn
+CONTENT_CACHE_TTL = 6 * 3600      # giây
+CONTENT_MISS_TTL = 10 * 60        # giây
+ENRICH_MAX_WORKERS = 5
+GENRE_QUERY_DEADLINE = 8          # giây chờ tối đa cho cả nhóm truy vấn theo từng thể loại
+
+_content_cache = MemoryTTLCache(ttl=CONTENT_CACHE_TTL, max_entries=2000)
+_miss_cache = MemoryTTLCache(ttl=CONTENT_MISS_TTL, max_entries=2000)
+
+_executor = ThreadPoolExecutor(max_workers=ENRICH_MAX_WORKERS, thread_name_prefix="enrich")
+
+
+def _fetch_content(keyword, content_type):
+    """Gọi API thật. Trả về item đầu tiên hoặc None; ném exception nếu lỗi mạng/API."""
+    if content_type in ["anime", "manga"]:
+        url = f"https://api.jikan.moe/v4/{content_type}"
+        response = http_client.get(url, params={"q": keyword, "limit": 1})
+        if response.status_code != 200:
+            raise RuntimeError(f"Jikan API Error: {response.status_code}")
+        results = response.json().get('data', [])
+        return results[0] if results else None
+    else:  # books
+        # Gọi thẳng _search_volumes: lỗi API phải tới except ở trên, không bị cache như "không tìm thấy"
+        books = _search_volumes(_keyword_params(keyword, 1, "en"))
+        if books is None:
+            raise RuntimeError("Google Books API Error")
+        return books[0] if books else None
+
+
+def search_content_by_keyword(keyword, content_type):
+    """
+    Tìm kiếm anime/manga/books theo keyword (có cache dùng chung cho mọi session).
+
+    Returns:
+        dict thông tin item hoặc None nếu không tìm thấy
+    """
+    key = f"{content_type}:{' '.join(str(keyword).lower().split())}"
+    cached = _content_cache.get(key)
+    if cached is not None:
+        return cached
+    if _miss_cache.get(key) is not None:
+        return None
+
+    try:
+        content = _fetch_content(keyword, content_type)
+    except Exception as e:
+        # Lỗi tạm thời thì không cache, lần sau thử lại
+        print(f"Lỗi tìm {content_type} '{keyword}': {e}")
+        return None
+
+    if content is None:
+        _miss_cache.set(key, True)
+    else:
+        _content_cache.set(key, content)
+    return content
+
+
+def enrich_recommendation_async(recommendation, content_type):
+    """
+    Bắt đầu tìm thông tin cho 1 gợi ý AI ở nền (không chờ).
+
+    Returns:
+        Future, kết quả là dict / Book hoặc None
+    """
+    keyword = recommendation.get('search_keyword') or recommendation.get('title', '')
+    return _executor.submit(search_content_by_keyword, keyword, content_type)
+
+
+def _fetch_media_by_genres(content_type, genre_ids, order_by, sort, limit):
+    """Gọi Jikan lấy anime/manga thuộc TẤT CẢ genre_ids. Ném exception nếu lỗi."""
+    url = f"https://api.jikan.moe/v4/{content_type}"
+    params = {
+        "genres": ",".join(map(str, genre_ids)),
+        "order_by": order_by,
+        "sort": sort,
+        "limit": limit
+    }
+    response = http_client.get(url, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: {response.status_code}")
+    return response.json().get('data', [])
+
+
+# Giá trị dùng để sắp xếp lại kết quả theo order_by của Jikan
+_SORT_FIELDS = {
+    "start_date": lambda item: (item.get('aired') or item.get('published') or {}).get('from'),
+}
+
+
+def _sort_by_order(items, order_by, sort):
+    """
+    Sắp xếp item theo order_by/sort như Jikan (item thiếu giá trị xếp cuối).
+    sorted ổn định nên item bằng nhau giữ nguyên thứ tự đầu vào.
+    """
+    value = _SORT_FIELDS.get(order_by, lambda item: item.get(order_by))
+    present = [item for item in items if value(item) is not None]
+    missing = [item for item in items if value(item) is None]
+    return sorted(present, key=value, reverse=(sort == "desc")) + missing
+
+
+def search_media_by_genres(content_type, genre_ids, order_by, sort, limit=10,
+                           match_any=False, deadline=GENRE_QUERY_DEADLINE):
+    """
+    Tìm anime/manga theo thể loại trên Jikan.
+
+    Args:
+        content_type: "anime" hoặc "manga"
+        genre_ids: List mal_id của thể loại
+        order_by, sort: Tham số sắp xếp của Jikan
+        limit: Số kết quả tối đa
+        match_any: False = thuộc tất cả thể loại (AND);
+                   True = thuộc bất kỳ thể loại nào (OR), mỗi thể loại 1 truy vấn
+                   song song; kết quả gộp vẫn sắp theo order_by/sort,
+                   Reciprocal Rank Fusion chỉ dùng để phân định item bằng nhau
+        deadline: (chế độ OR) số giây tối đa chờ; thể loại nào chậm hơn thì bỏ qua
+
+    Returns:
+        List item của Jikan. Ném exception nếu không truy vấn nào thành công.
+    """
+    if not match_any or len(genre_ids) <= 1:
+        return _fetch_media_by_genres(content_type, genre_ids, order_by, sort, limit)
+
+    ranked_lists, errors = gather_with_deadline(
+        _executor,
+        _fetch_media_by_genres,
+        [(content_type, [genre_id], order_by, sort, limit) for genre_id in genre_ids],
+        deadline,
+    )
+    if not ranked_lists:
+        raise errors[0] if errors else TimeoutError(f"Jikan không phản hồi trong {deadline}s")
+    for error in errors:
+        print(f"Lỗi tìm {content_type} theo thể loại: {error}")
+    fused = reciprocal_rank_fusion(ranked_lists, key=lambda item: item.get('mal_id'))
+    # Mỗi danh sách đã là top `limit` của thể loại đó theo order_by, nên top `limit`
+    # của hợp các danh sách (sắp lại theo order_by) đúng bằng top `limit` của truy vấn OR
+    return _sort_by_order(fused, order_by, sort)[:limit]
@@ -0,0 +1,40 @@
+import math
+import threading
+from collections import deque
+
+
+class WindowStats:
+    """
+    Thống kê thread-safe trên các giá trị gần nhất (cửa sổ trượt):
+    số lượng, trung bình, p50, p95, max.
+    """
+
+    def __init__(self, window=1000):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0   # tổng số giá trị từ lúc khởi động (không chỉ trong cửa sổ)
+
+    def add(self, value):
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+
+    @staticmethod
+    def _percentile(ordered, fraction):
+        index = max(0, math.ceil(fraction * len(ordered)) - 1)
+        return ordered[index]
+
+    def snapshot(self):
+        """Trả về dict thống kê (các giá trị None nếu chưa có dữ liệu)."""
+        with self._lock:
+            ordered = sorted(self._values)
+            count = self.count
+        if not ordered:
+            return {"count": count, "mean": None, "p50": None, "p95": None, "max": None}
+        return {
+            "count": count,
+            "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": round(self._percentile(ordered, 0.50), 4),
+            "p95": round(self._percentile(ordered, 0.95), 4),
+            "max": round(ordered[-1], 4),
+        }
@@ -0,0 +1,300 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from services.cache_service import cache_path
+
+# Kính ngữ tiếng Nhật hay bị dính vào tên ("Naruto-kun", "Hinata-chan")
+HONORIFICS = {"san", "kun", "chan", "sama", "senpai", "sempai", "sensei", "dono", "tan", "chin", "hime"}
+
+# Gộp các cách viết romaji khác nhau về cùng một dạng:
+# Satou/Satoo/Satō -> sato, Ryuu -> ryu, shi/si, chi/ti, tsu/tu, ...
+_ROMAJI_FOLDS = [
+    ("ou", "o"), ("oo", "o"), ("uu", "u"), ("aa", "a"), ("ii", "i"), ("ee", "e"),
+    ("shi", "si"), ("chi", "ti"), ("tsu", "tu"), ("sha", "sya"), ("shu", "syu"), ("sho", "syo"),
+    ("cha", "tya"), ("chu", "tyu"), ("cho", "tyo"), ("ji", "zi"), ("fu", "hu"),
+]
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+MIN_RESOLVE_SCORE = 0.6   # điểm Dice tối thiểu để coi là "cùng 1 nhân vật" (khi không trùng tên hoàn toàn)
+
+# Các trường dùng để dựng chỉ mục; favorites / image_url đổi thì chỉ cập nhật tại chỗ
+_INDEXED_FIELDS = ("name", "name_kanji", "nicknames")
+
+
+def normalize_name(name):
+    """
+    Chuẩn hóa tên để so khớp: bỏ dấu, chữ thường, bỏ kính ngữ,
+    gộp romaji và sắp xếp các từ (không phụ thuộc thứ tự họ/tên).
+    """
+    text = unicodedata.normalize("NFKD", str(name or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    tokens = [t for t in _NON_WORD_RE.split(text) if t and t not in HONORIFICS]
+    folded = []
+    for token in tokens:
+        for src, dst in _ROMAJI_FOLDS:
+            token = token.replace(src, dst)
+        folded.append(token)
+    return " ".join(sorted(folded))
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _compact_record(char):
+    """Rút gọn 1 bản ghi nhân vật của Jikan thành các trường cần cho tra cứu."""
+    images = char.get("images") or {}
+    image_url = (images.get("jpg") or {}).get("image_url") or char.get("image_url")
+    return {
+        "mal_id": char["mal_id"],
+        "name": char.get("name") or "",
+        "name_kanji": char.get("name_kanji"),
+        "nicknames": list(char.get("nicknames") or []),
+        "favorites": char.get("favorites") or 0,
+        "image_url": image_url,
+    }
+
+
+class NameIndex:
+    """
+    Chỉ mục tên nhân vật cục bộ (trigram + prefix) để gợi ý và tra tên mờ.
+    Bản ghi được lưu trong SQLite, chỉ mục nằm trong bộ nhớ.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS characters (
+                mal_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                name_kanji TEXT,
+                nicknames TEXT,
+                favorites INTEGER,
+                image_url TEXT
+            )
+            """
+        )
+        self._conn.commit()
+        self._records = {}     # mal_id -> record
+        self._entries = []     # (mal_id, key đã chuẩn hóa, số trigram của key); None = đã bỏ
+        self._postings = {}    # trigram -> list chỉ số trong _entries
+        self._prefixes = []    # list đã sắp xếp (token, mal_id) cho tìm theo tiền tố
+        self._indexed = {}     # mal_id -> (chỉ số trong _entries, các cặp prefix) để gỡ khi đổi tên
+        self._dead = 0         # số entry đã bỏ nhưng còn trong _postings
+        self.reload()
+
+    def reload(self):
+        """Nạp lại toàn bộ bản ghi từ SQLite và dựng lại chỉ mục."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT mal_id, name, name_kanji, nicknames, favorites, image_url FROM characters"
+            ).fetchall()
+            self._rebuild([
+                {
+                    "mal_id": mal_id,
+                    "name": name,
+                    "name_kanji": name_kanji,
+                    "nicknames": json.loads(nicknames or "[]"),
+                    "favorites": favorites or 0,
+                    "image_url": image_url,
+                }
+                for mal_id, name, name_kanji, nicknames, favorites, image_url in rows
+            ])
+
+    def _rebuild(self, records):
+        """Dựng lại toàn bộ chỉ mục trong bộ nhớ từ các bản ghi (gọi khi đang giữ lock)."""
+        self._records, self._entries, self._postings, self._indexed, self._dead = {}, [], {}, {}, 0
+        prefixes = []
+        for record in records:
+            prefixes.extend(self._index(record))
+        self._prefixes = sorted(prefixes)
+
+    def _index(self, record):
+        """Đưa 1 bản ghi vào chỉ mục trigram, trả về các cặp (token, mal_id) cho prefix."""
+        mal_id = record["mal_id"]
+        self._records[mal_id] = record
+        keys = {normalize_name(n) for n in [record["name"], record.get("name_kanji"), *record["nicknames"]] if n}
+        keys.discard("")
+        prefixes = []
+        entry_ids = []
+        for key in keys:
+            grams = _trigrams(key)
+            entry_id = len(self._entries)
+            self._entries.append((mal_id, key, len(grams)))
+            entry_ids.append(entry_id)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(entry_id)
+            prefixes.extend((token, mal_id) for token in key.split())
+        self._indexed[mal_id] = (entry_ids, prefixes)
+        return prefixes
+
+    def _unindex(self, mal_id):
+        """Gỡ các key cũ của 1 nhân vật khỏi chỉ mục (entry bị đánh dấu None, prefix bị xóa)."""
+        entry_ids, prefixes = self._indexed.pop(mal_id, ((), ()))
+        for entry_id in entry_ids:
+            self._entries[entry_id] = None
+            self._dead += 1
+        for pair in prefixes:
+            position = bisect_left(self._prefixes, pair)
+            if position < len(self._prefixes) and self._prefixes[position] == pair:
+                del self._prefixes[position]
+
+    def add_many(self, chars):
+        """Thêm/cập nhật nhiều nhân vật (dict kiểu Jikan hoặc bản ghi gọn)."""
+        records = [_compact_record(char) for char in chars if char and char.get("mal_id")]
+        with self._lock:
+            changed = []    # cần ghi xuống SQLite
+            reindex = []    # bản ghi mới hoặc đổi tên / biệt danh
+            for record in records:
+                old = self._records.get(record["mal_id"])
+                if old == record:
+                    continue   # không đổi (trường hợp thường gặp nhất)
+                changed.append(record)
+                if old is not None and all(old[f] == record[f] for f in _INDEXED_FIELDS):
+                    # Chỉ số favorites / ảnh đổi: cập nhật tại chỗ, không đụng chỉ mục
+                    old["favorites"] = record["favorites"]
+                    old["image_url"] = record["image_url"]
+                else:
+                    reindex.append(record)
+            if not changed:
+                return
+            records = changed
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO characters (mal_id, name, name_kanji, nicknames, favorites, image_url) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (r["mal_id"], r["name"], r["name_kanji"], json.dumps(r["nicknames"], ensure_ascii=False),
+                     r["favorites"], r["image_url"])
+                    for r in records
+                ],
+            )
+            self._conn.commit()
+            for record in reindex:
+                self._unindex(record["mal_id"])
+                for pair in self._index(record):
+                    insort(self._prefixes, pair)
+            # Quá nhiều entry đã bỏ nằm trong _postings: dọn lại 1 lần
+            if self._dead > 1000 and self._dead * 2 > len(self._entries):
+                self._rebuild(list(self._records.values()))
+
+    def search(self, query, limit=10):
+        """
+        Tìm mờ theo tên. Trả về list (score, record) sắp giảm dần.
+        score ~ 0..1 (độ giống trigram, cộng thêm nếu khớp tiền tố và độ nổi tiếng).
+        """
+        key = normalize_name(query)
+        if not key:
+            return []
+        with self._lock:
+            # Độ giống Dice theo trigram, lấy key giống nhất của mỗi nhân vật
+            similarity = {}
+            for (mal_id, _), value in self._dice(key).items():
+                if value > similarity.get(mal_id, 0.0):
+                    similarity[mal_id] = value
+
+            # Khớp tiền tố từ cuối cùng người dùng đang gõ dở
+            last_token = normalize_name(str(query).split()[-1]) or key.split()[-1]
+            prefix_ids = set()
+            start = bisect_left(self._prefixes, (last_token, -1))
+            for token, mal_id in self._prefixes[start:start + 200]:
+                if not token.startswith(last_token):
+                    break
+                prefix_ids.add(mal_id)
+
+            scored = []
+            for mal_id in similarity.keys() | prefix_ids:
+                record = self._records[mal_id]
+                score = similarity.get(mal_id, 0.0)
+                if mal_id in prefix_ids:
+                    score += 0.15
+                score += 0.02 * math.log10(1 + record["favorites"])
+                scored.append((score, record))
+        scored.sort(key=lambda item: -item[0])
+        return scored[:limit]
+
+    def resolve(self, name, min_score=MIN_RESOLVE_SCORE):
+        """
+        Trả về bản ghi chắc chắn là nhân vật `name`, ngược lại None.
+
+        Chặt hơn search(): không cộng điểm tiền tố / độ nổi tiếng, và mọi từ
+        trong tên phải có trong key của nhân vật. Nhờ vậy người cùng họ
+        ("Kushina Uzumaki" / "Naruto Uzumaki") không bị nhận nhầm.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        tokens = set(key.split())
+        with self._lock:
+            best, best_rank = None, None
+            for (mal_id, entry_key), value in self._dice(key).items():
+                if entry_key != key and (value < min_score or not tokens <= set(entry_key.split())):
+                    continue
+                record = self._records[mal_id]
+                # Trùng tên hoàn toàn (value = 1.0) trước, rồi tới nhân vật nổi tiếng hơn
+                rank = (value, record["favorites"])
+                if best_rank is None or rank > best_rank:
+                    best, best_rank = record, rank
+            return best
+
+    def _dice(self, key):
+        """
+        Độ giống Dice theo trigram giữa `key` và mọi key có chung trigram
+        (gọi khi đang giữ lock). Trả về dict {(mal_id, key của entry): điểm 0..1}.
+        """
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            for entry_id in self._postings.get(gram, ()):
+                shared[entry_id] += 1
+        scores = {}
+        for entry_id, count in shared.items():
+            entry = self._entries[entry_id]
+            if entry is None:
+                continue
+            mal_id, entry_key, size = entry
+            scores[(mal_id, entry_key)] = 1.0 if entry_key == key else 2.0 * count / (len(grams) + size)
+        return scores
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_name_index():
+    """Chỉ mục dùng chung cho cả process (tạo ở lần gọi đầu)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NameIndex(cache_path("character_index.sqlite3"))
+        return _index
+
+
+def remember_characters(chars):
+    """Ghi nhớ các nhân vật app vừa thấy từ Jikan."""
+    try:
+        get_name_index().add_many(chars)
+    except Exception as e:
+        print(f"Lỗi cập nhật chỉ mục tên: {e}")
+
+
+def suggest_names(query, limit=8):
+    """Gợi ý nhân vật theo tên gõ dở/viết sai. Trả về list bản ghi."""
+    return [record for _, record in get_name_index().search(query, limit=limit)]
+
+
+def resolve_character(name, min_score=MIN_RESOLVE_SCORE):
+    """Tìm nhân vật đã biết khớp với tên (ví dụ tên do AI nhận diện ảnh trả về)."""
+    return get_name_index().resolve(name, min_score=min_score)
@@ -0,0 +1,91 @@
+import math
+import os
+import re
+
+# Ngân sách token cho phần tiểu sử trong prompt phân tích nhân vật.
+# Tiểu sử MAL có thể dài vài KB; phần đầu thường đủ để AI viết hồ sơ.
+PROFILE_BIO_TOKEN_BUDGET = int(os.getenv("PROFILE_BIO_TOKEN_BUDGET", 600))
+
+# Ước lượng thô: ~4 ký tự Latin / token, chữ CJK ~1 ký tự / token
+CHARS_PER_TOKEN = 4
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿가-힯]")
+_SPOILER_TAG_RE = re.compile(r"\[spoiler\].*?(\[/spoiler\]|$)", re.IGNORECASE | re.DOTALL)
+_SPOILER_HEADING_RE = re.compile(r"^\W*spoilers?\b", re.IGNORECASE)
+# Dòng ghi nguồn của MAL, không giúp gì cho AI
+_SOURCE_LINE_RE = re.compile(r"^\s*[\(\[](source|written by)[^\n]*[\)\]]\s*$", re.IGNORECASE | re.MULTILINE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """ Ước lượng số token của text (không gọi API). """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def _paragraphs(about):
+    """ Tách tiểu sử thành các đoạn, bỏ dòng nguồn và các phần spoiler. """
+    text = _SPOILER_TAG_RE.sub("", about.replace("\r\n", "\n"))
+    text = re.sub(r"[ \t]{2,}", " ", _SOURCE_LINE_RE.sub("", text))
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Gặp tiêu đề "Spoiler(s)..." thì phần sau đó đều là spoiler
+        if _SPOILER_HEADING_RE.match(paragraph):
+            break
+        paragraphs.append(paragraph)
+    return paragraphs
+
+
+def _truncate_to_sentences(paragraph, budget):
+    """ Cắt đoạn văn theo ranh giới câu để vừa budget token. """
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(paragraph):
+        cost = estimate_tokens(sentence) + 1
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+    # Câu đầu tiên đã quá dài: cắt theo số ký tự
+    return paragraph[:budget * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + "…"
+
+
+def trim_bio(about, budget=PROFILE_BIO_TOKEN_BUDGET):
+    """
+    Rút gọn tiểu sử cho vừa ngân sách token: giữ các đoạn đầu (thường là
+    thông tin cơ bản và xuất thân), bỏ phần spoiler và dòng ghi nguồn.
+
+    Args:
+        about: Tiểu sử gốc (có thể None)
+        budget: Số token tối đa cho tiểu sử
+
+    Returns:
+        (text đã rút gọn, số token ước lượng của bản gốc, của bản rút gọn)
+    """
+    about = str(about or "").strip()
+    original_tokens = estimate_tokens(about)
+    if not about:
+        return "", 0, 0
+
+    kept = []
+    used = 0
+    for paragraph in _paragraphs(about):
+        cost = estimate_tokens(paragraph) + 1
+        if used + cost <= budget:
+            kept.append(paragraph)
+            used += cost
+            continue
+        # Đoạn không vừa: lấy phần đầu nếu còn đủ chỗ cho ít nhất 1 câu ngắn
+        if budget - used >= 40 or not kept:
+            kept.append(_truncate_to_sentences(paragraph, budget - used))
+        break
+
+    text = "\n\n".join(kept)
+    return text, original_tokens, estimate_tokens(text)
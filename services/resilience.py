@@ -0,0 +1,157 @@
+import random
+import threading
+import time
+
+from services.dispatcher import AdmissionError
+
+# Mã HTTP đáng thử lại: quá tải, lỗi tạm thời phía server, quá hạn
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {
+    "DeadlineExceeded", "ServiceUnavailable", "ResourceExhausted", "InternalServerError",
+    "GatewayTimeout", "TooManyRequests", "RetryError", "ReadTimeout", "ConnectTimeout",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuit breaker đang mở: từ chối gọi ngay, không chờ timeout."""
+
+
+def is_retryable(error):
+    """Lỗi tạm thời (mạng, quá tải, timeout) thì thử lại; lỗi request sai thì không."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return type(error).__name__ in _RETRYABLE_NAMES
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker dùng chung cho cả process.
+    - closed: gọi bình thường, đếm số lỗi liên tiếp.
+    - open: sau `failure_threshold` lỗi liên tiếp thì từ chối mọi lời gọi
+      trong `reset_timeout` giây.
+    - half_open: hết thời gian chờ thì cho 1 lời gọi thử; thành công thì
+      đóng lại, lỗi thì mở tiếp.
+    Mỗi lần đổi trạng thái đều được ghi log.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+
+    def allow(self):
+        """Trả về True nếu được phép gọi lúc này."""
+        with self._lock:
+            if self._state == "open":
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._set_state("half_open")
+                self._probing = False
+            if self._state == "half_open":
+                # Chỉ 1 lời gọi thử tại một thời điểm
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._set_state("closed")
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """
+        Lời gọi chưa tới được service (bị hàng đợi từ chối...): trả lại lượt
+        gọi thử của half_open, không đổi trạng thái và số lỗi liên tiếp.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                self._set_state("open")
+                self._opened_at = self.clock()
+
+    def _set_state(self, state):
+        """Đổi trạng thái và ghi log nếu khác trạng thái cũ (gọi khi đang giữ lock)."""
+        if state != self._state:
+            print(f"[breaker] {self.name}: {self._state} -> {state} (lỗi liên tiếp: {self._failures})")
+            self._state = state
+
+    def snapshot(self):
+        """Trạng thái hiện tại để theo dõi."""
+        with self._lock:
+            retry_in = 0.0
+            if self._state == "open":
+                retry_in = max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in": round(retry_in, 1),
+                "rejected": self.rejected,
+            }
+
+
+def call_with_retry(fn, breaker=None, deadline=30.0, timeout=None, retries=2, base_delay=0.5, max_delay=4.0):
+    """
+    Gọi fn(timeout) với thời hạn tổng, thử lại có jitter khi lỗi tạm thời
+    và đi qua circuit breaker.
+
+    Args:
+        fn: Hàm nhận timeout (giây) cho lần gọi đó
+        breaker: CircuitBreaker (None = không dùng)
+        deadline: Tổng số giây tối đa cho mọi lần thử (kể cả thời gian chờ)
+        timeout: Timeout mỗi lần gọi (mặc định = thời gian còn lại)
+        retries: Số lần thử lại tối đa
+        base_delay, max_delay: Thời gian chờ giữa các lần thử (nhân đôi, có jitter)
+
+    Returns:
+        Kết quả của fn. Ném CircuitOpenError nếu breaker đang mở,
+        hoặc lỗi cuối cùng nếu hết lượt thử / hết thời hạn.
+        AdmissionError từ fn (hàng đợi đầy) được ném lại ngay, không ghi vào breaker.
+    """
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} tạm ngưng do lỗi liên tiếp")
+        remaining = give_up_at - time.monotonic()
+        try:
+            result = fn(min(timeout or remaining, remaining))
+        except (AdmissionError, CircuitOpenError):
+            # Service chưa hề được gọi: không tính là thành công hay thất bại
+            if breaker is not None:
+                breaker.release_probe()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                # Lỗi do request (sai tham số, bị chặn nội dung...) nghĩa là service vẫn sống
+                breaker.record_failure() if retryable else breaker.record_success()
+            # "Full jitter": chờ ngẫu nhiên trong [0, base * 2^attempt] để các session không dồn cùng lúc
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if not retryable or attempt >= retries or time.monotonic() + delay >= give_up_at:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
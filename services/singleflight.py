@@ -0,0 +1,86 @@
+import functools
+import threading
+
+
+class _Call:
+    """Một lời gọi đang chạy, các luồng khác cùng key sẽ chờ trên nó."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi trùng nhau đang chạy đồng thời thành 1 lời gọi upstream.
+
+    Luồng đầu tiên với một key sẽ thực thi hàm, các luồng đến sau cùng key
+    chỉ chờ và nhận chung kết quả. Nếu lời gọi đó lỗi, lỗi chỉ trả về cho
+    luồng đã thực thi; các luồng đang chờ sẽ tự mở một lượt gọi mới
+    (tối đa `retries` lần) thay vì cùng nhận lỗi.
+    """
+
+    def __init__(self, retries=1):
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Chạy fn(*args, **kwargs) hoặc chờ lời gọi cùng key đang chạy."""
+        attempts = 0
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                else:
+                    call.waiters += 1
+
+            if leader:
+                try:
+                    call.result = fn(*args, **kwargs)
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.done.set()
+                return call.result
+
+            call.done.wait()
+            if call.error is None:
+                return call.result
+            if attempts >= self.retries:
+                raise call.error
+            attempts += 1
+
+    def in_flight(self):
+        """Số key đang có lời gọi chạy."""
+        with self._lock:
+            return len(self._calls)
+
+
+def single_flight(key_func, group=None):
+    """
+    Decorator: gộp các lời gọi đồng thời có cùng key_func(*args, **kwargs).
+
+    Args:
+        key_func: Hàm tính key từ tham số của hàm được bọc
+        group: SingleFlight dùng chung (mặc định tạo mới cho mỗi hàm)
+    """
+    def decorator(fn):
+        flight = group or SingleFlight()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flight.do(key_func(*args, **kwargs), fn, *args, **kwargs)
+
+        wrapper.flight = flight
+        return wrapper
+
+    return decorator
@@ -0,0 +1,114 @@
+"""
+Chuẩn bị asset tĩnh (ảnh nền, favicon, CSS) 1 lần rồi để Streamlit phục vụ
+qua static file serving (`server.enableStaticServing`, URL `app/static/...`).
+
+- Ảnh được thu nhỏ và nén lại 1 lần, không base64 vào CSS ở mỗi lần chạy script.
+- Tên file kèm hash nội dung (ví dụ `theme.3f2a9c1b0d.css`) nên trình duyệt
+  có thể giữ cache lâu; nội dung đổi thì tên file đổi theo.
+- Có thể build sẵn lúc deploy:
+    python -m services.static_assets
+"""
+import hashlib
+import io
+import os
+
+from PIL import Image
+
+# Streamlit chỉ phục vụ thư mục `static/` nằm cạnh main.py
+STATIC_DIR = "static"
+STATIC_URL = "app/static"
+
+BACKGROUND_MAX_WIDTH = int(os.getenv("BACKGROUND_MAX_WIDTH", "1600"))
+WEBP_QUALITY = 80
+FAVICON_SIZE = 64
+
+
+def _publish(name, ext, data):
+    """
+    Ghi `data` vào static/<name>.<hash>.<ext> (bỏ qua nếu đã có) và xóa các
+    bản cũ cùng tên.
+
+    Returns:
+        Tên file (không kèm thư mục)
+    """
+    digest = hashlib.sha1(data).hexdigest()[:10]
+    filename = f"{name}.{digest}.{ext}"
+    path = os.path.join(STATIC_DIR, filename)
+    os.makedirs(STATIC_DIR, exist_ok=True)
+
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)   # ghi xong mới đổi tên: không ai đọc được file dở
+
+    for old in os.listdir(STATIC_DIR):
+        parts = old.split(".")
+        if old != filename and len(parts) == 3 and parts[0] == name and parts[2] == ext:
+            try:
+                os.remove(os.path.join(STATIC_DIR, old))
+            except OSError:
+                pass
+    return filename
+
+
+def static_url(filename):
+    """URL tương đối mà trình duyệt dùng để tải file trong static/."""
+    return f"{STATIC_URL}/{filename}"
+
+
+def publish_image(path, name, max_width=BACKGROUND_MAX_WIDTH, quality=WEBP_QUALITY):
+    """
+    Thu nhỏ ảnh về tối đa `max_width` px chiều ngang, nén WebP và đưa vào static/.
+    Nếu bản nén lại lớn hơn file gốc (và file gốc đã là WebP) thì giữ file gốc.
+
+    Returns:
+        Tên file trong static/, hoặc None nếu không đọc được ảnh
+    """
+    try:
+        with open(path, "rb") as f:
+            original = f.read()
+        image = Image.open(io.BytesIO(original))
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality, method=6)
+    except (OSError, ValueError) as e:
+        print(f"Không xử lý được ảnh {path}: {e}")
+        return None
+
+    data = buffer.getvalue()
+    if path.lower().endswith(".webp") and len(original) <= len(data):
+        data = original
+    return _publish(name, "webp", data)
+
+
+def publish_favicon(path, name="favicon", size=FAVICON_SIZE):
+    """
+    Tạo favicon PNG nhỏ (`size` x `size`) từ ảnh logo.
+
+    Returns:
+        Đường dẫn file favicon trong static/, hoặc None nếu lỗi
+    """
+    try:
+        image = Image.open(path)
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", optimize=True)
+    except (OSError, ValueError) as e:
+        print(f"Không tạo được favicon từ {path}: {e}")
+        return None
+    return os.path.join(STATIC_DIR, _publish(name, "png", buffer.getvalue()))
+
+
+def publish_text(name, ext, text):
+    """Đưa 1 file text (CSS...) vào static/, trả về tên file."""
+    return _publish(name, ext, text.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    import styles_css
+
+    print(f"Theme CSS: {styles_css.build_theme_assets()}")
+    print(f"Theme CSS (lite): {styles_css.build_theme_assets(lite=True)}")
+    print(f"Favicon: {publish_favicon(styles_css.LOGO_FILE)}")
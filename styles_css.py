@@ -2,12 +2,100 @@ import streamlit as st
 import base64
 import os
 
+from services.static_assets import publish_image, publish_text, static_url
+
 # cấu hình của web
 LOCAL_WEBP_FILE = "utsuro.webp" 
+LOGO_FILE = "itooklogo.jpg"
 
 # ảnh nền Anime mẫu (fallback nếu không tìm thấy file local)
 DEFAULT_ANIME_BG_URL = "https://images.unsplash.com/photo-1626245648558-f542a2592790?q=80&w=2574&auto=format&fit=crop&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D"
 
+# Bố cục chung + nút mua hàng (trước đây nằm trong khối CSS overlay của main.py)
+LAYOUT_CSS = """
+    [data-testid="column"] {
+        padding: 0 15px !important;
+    }
+    
+    [data-testid="stImage"] {
+        margin-bottom: 15px !important;
+    }
+    
+    .purchase-button {
+        position: fixed;
+        bottom: 30px;
+        right: 30px;
+        z-index: 9998;
+        animation: pulse 2s infinite;
+    }
+    
+    @keyframes pulse {
+        0%, 100% {
+            transform: scale(1);
+        }
+        50% {
+            transform: scale(1.05);
+        }
+    }
+    
+    .purchase-button a {
+        display: inline-block;
+        padding: 15px 30px;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white !important;
+        text-decoration: none;
+        border-radius: 50px;
+        font-size: 1.1rem;
+        font-weight: bold;
+        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.4);
+        transition: all 0.3s ease;
+    }
+    
+    .purchase-button a:hover {
+        transform: translateY(-3px);
+        box-shadow: 0 8px 25px rgba(102, 126, 234, 0.6);
+        background: linear-gradient(135deg, #764ba2 0%, #667eea 100%);
+    }
+"""
+
+# Sticker ở góc phải trên
+CORNER_GIF_CSS = """
+    .corner-gif {
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        width: 100px;
+        height: 100px;
+        z-index: 9999;
+        border-radius: 50%;
+        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.2);
+        transition: transform 0.3s ease;
+        pointer-events: auto;
+    }
+    .corner-gif:hover {
+        transform: scale(1.15) rotate(5deg);
+    }
+"""
+
+# Chế độ lite: nền màu trơn, tắt mọi animation / transition / blur (nặng trên máy yếu)
+LITE_CSS = """
+    [data-testid="stAppViewContainer"] {
+        background-color: #AEE0D7;
+    }
+
+    *, *::before, *::after {
+        animation: none !important;
+        transition: none !important;
+        backdrop-filter: none !important;
+    }
+"""
+
+# Ẩn Streamlit footer
+HIDE_ST_STYLE_CSS = """
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+"""
+
 def get_base64_of_file(path):
     """Đọc file và mã hóa thành chuỗi Base64"""
     try:
@@ -18,21 +106,17 @@ def get_base64_of_file(path):
         st.error(f"Lỗi: Không tìm thấy file ảnh nền tại đường dẫn: {path}. Đang sử dụng ảnh mặc định từ web.")
         return None
 
-def set_background_image(image_file_path: str = LOCAL_WEBP_FILE):
-    """
-    Hàm chèn CSS tùy chỉnh để đặt ảnh nền cho ứng dụng Streamlit.
-    Ưu tiên sử dụng file local Base64, nếu không có sẽ dùng URL mặc định.
+def build_theme_css(background_url, lite=False):
     """
-    
-    # xác định nguồn ảnh
-    final_image_source = None
-    
-    if os.path.exists(image_file_path):
-        final_image_source = get_base64_of_file(image_file_path)
-    
-    if not final_image_source:
-        final_image_source = DEFAULT_ANIME_BG_URL
+    Tạo toàn bộ CSS của giao diện (ảnh nền, sidebar, widget, nút mua hàng, sticker...).
+
+    Args:
+        background_url: URL ảnh nền (tương đối so với file CSS, URL web hoặc data URI)
+        lite: True = không ảnh nền, không font từ xa, không animation
 
+    Returns:
+        Chuỗi CSS (không có thẻ <style>)
+    """
     # CSS cho toàn bộ trang+ Shine Sweep + Glow Pulse
     page_container_css = f"""
     @keyframes shine {{
@@ -72,7 +156,7 @@ def set_background_image(image_file_path: str = LOCAL_WEBP_FILE):
                 rgba(255, 255, 255, 0) 60%,
                 transparent 70%
             ),
-            url("{final_image_source}");
+            url("{background_url}");
         background-size: 200% 100%, contain;
         background-color: #AEE0D7;
         background-position: -200% center, center;
@@ -84,9 +168,6 @@ def set_background_image(image_file_path: str = LOCAL_WEBP_FILE):
     
     # CSS cho các thành phần khác (để tăng độ tương phản)
     component_css = """
-    /* Import font anime style */
-    @import url('https://fonts.googleapis.com/css2?family=M+PLUS+Rounded+1c:wght@400;500;700;800&display=swap');
-    
     /* Làm cho Sidebar trong suốt và tối màu nhẹ */
     [data-testid="stSidebar"] {
         background: linear-gradient(180deg, rgba(255, 250, 245, 0.95) 0%, rgba(244, 239, 234, 0.95) 100%);
@@ -319,39 +400,61 @@ def set_background_image(image_file_path: str = LOCAL_WEBP_FILE):
 
     """
     
-    full_css = f"<style>{page_container_css}{component_css}</style>"
-    st.markdown(full_css, unsafe_allow_html=True)
-    
-    # Ẩn Streamlit footer
-    hide_st_style = """
-    <style>
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    </style>
+    if lite:
+        return component_css + LAYOUT_CSS + HIDE_ST_STYLE_CSS + LITE_CSS
+
+    # @import phải nằm đầu file CSS thì trình duyệt mới áp dụng
+    font_css = "@import url('https://fonts.googleapis.com/css2?family=M+PLUS+Rounded+1c:wght@400;500;700;800&display=swap');\n"
+    return font_css + page_container_css + component_css + LAYOUT_CSS + CORNER_GIF_CSS + HIDE_ST_STYLE_CSS
+
+
+def build_theme_assets(image_file_path=LOCAL_WEBP_FILE, lite=False):
+    """
+    Nén ảnh nền và ghi file CSS giao diện vào static/ (tên file kèm hash).
+
+    Returns:
+        URL của file CSS (dạng app/static/theme.<hash>.css hoặc theme-lite.<hash>.css)
+    """
+    if lite:
+        return static_url(publish_text("theme-lite", "css", build_theme_css(None, lite=True)))
+
+    background = publish_image(image_file_path, "background")
+    # File CSS nằm cùng thư mục static/ với ảnh nền nên chỉ cần tên file
+    css = build_theme_css(background or DEFAULT_ANIME_BG_URL)
+    return static_url(publish_text("theme", "css", css))
+
+
+@st.cache_resource(show_spinner=False)
+def _theme_markup(image_file_path, lite=False):
     """
-    st.markdown(hide_st_style, unsafe_allow_html=True)
+    Phần HTML gửi xuống trình duyệt ở mỗi lần chạy script (chỉ tính 1 lần mỗi process).
+    - Bật static serving: chỉ 1 dòng @import tới file CSS đã build, trình duyệt tự cache.
+    - Không bật: nhúng thẳng CSS và ảnh nền base64 như cũ.
+    """
+    if st.get_option("server.enableStaticServing"):
+        return f'<style>@import url("{build_theme_assets(image_file_path, lite)}");</style>'
+    if lite:
+        return f"<style>{build_theme_css(None, lite=True)}</style>"
+
+    background = None
+    if os.path.exists(image_file_path):
+        background = get_base64_of_file(image_file_path)
+    return f"<style>{build_theme_css(background or DEFAULT_ANIME_BG_URL)}</style>"
+
+
+def set_background_image(image_file_path: str = LOCAL_WEBP_FILE, lite: bool = False):
+    """
+    Chèn CSS giao diện (ảnh nền + style các thành phần) cho ứng dụng Streamlit.
+    CSS và ảnh nền được build sẵn vào static/, mỗi lần chạy script chỉ gửi
+    1 thẻ <style> nhỏ trỏ tới file CSS đó.
+    lite=True: bản CSS không ảnh nền, không animation (xem services/lite_mode.py).
+    """
+    st.markdown(_theme_markup(image_file_path, lite), unsafe_allow_html=True)
 
 # thêm gif
 def add_corner_gif():
-    """Thêm GIF nhỏ ở góc phải trên"""
+    """Thêm GIF nhỏ ở góc phải trên (CSS nằm trong file CSS giao diện)"""
     gif_html = """
-    <style>
-    .corner-gif {
-        position: fixed;
-        top: 20px;
-        right: 20px;
-        width: 100px;
-        height: 100px;
-        z-index: 9999;
-        border-radius: 50%;
-        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.2);
-        transition: transform 0.3s ease;
-        pointer-events: auto;
-    }
-    .corner-gif:hover {
-        transform: scale(1.15) rotate(5deg);
-    }
-    </style>
     <img src="https://s3.getstickerpack.com/storage/uploads/sticker-pack/genshin-stickers-set-44/sticker_1.png?9fea17fd7eb9063146bb3e6c6cc33beb" class="corner-gif" alt="cute gif">
     """
     st.markdown(gif_html, unsafe_allow_html=True)
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# Các service tạo file cache (SQLite, ảnh...) ngay lúc import: dùng thư mục tạm
+os.environ.setdefault("ITOOK_CACHE_DIR", tempfile.mkdtemp(prefix="itook-test-cache-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer:
+    """
+    Server HTTP giả lập chạy trong thread nền.
+    `handler(path, query)` trả về (status, body) hoặc (status, body, headers);
+    body là dict/list (gửi dạng JSON) hoặc bytes. Mọi request được ghi vào
+    `requests` dạng (thời điểm, path, query), header của request ghi vào
+    `request_headers` (cùng thứ tự).
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.request_headers = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), parsed.path, query))
+                    stub.request_headers.append(dict(self.headers))
+                status, body, *rest = stub.handler(parsed.path, query)
+                headers = rest[0] if rest else {}
+                if isinstance(body, bytes):
+                    data = body
+                else:
+                    data = json.dumps(body).encode("utf-8")
+                    headers.setdefault("Content-Type", "application/json")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def paths(self):
+        with self._lock:
+            return [path for _, path, _ in self.requests]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    """Tạo server giả lập: stub_server(handler) -> StubServer (tự tắt sau test)."""
+    servers = []
+
+    def start(handler):
+        server = StubServer(handler)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
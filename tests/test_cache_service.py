@@ -0,0 +1,58 @@
+from services import cache_service
+from services.cache_service import SQLiteCache
+
+
+def _trace(cache):
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    return statements
+
+
+def test_hit_does_not_write_until_access_is_stale(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "c.sqlite3"), ttl=3600, max_entries=10, access_write_interval=60)
+    cache.set("k", {"v": 1})
+
+    statements = _trace(cache)
+    now[0] += 30
+    assert cache.get("k") == {"v": 1}
+    assert not any(sql.startswith("UPDATE") for sql in statements)
+
+    now[0] += 31
+    assert cache.get("k") == {"v": 1}
+    assert any(sql.startswith("UPDATE") for sql in statements)
+    assert cache.stats()["hits"] == 2
+
+
+def test_set_keeps_count_without_counting_rows(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    cache = SQLiteCache(path, ttl=3600, max_entries=3, access_write_interval=0)
+    statements = _trace(cache)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    cache.set("b", "B")          # ghi đè: không tăng số entry
+    assert len(cache) == 3
+    cache.get("a")               # a vừa dùng, b vừa ghi đè: c lâu không dùng nhất
+    cache.set("d", "d")          # vượt 3: bỏ c
+    assert len(cache) == 3
+    assert not any("COUNT(*)" in sql for sql in statements)
+    assert cache.get("c") is None and cache.get("a") == "a"
+
+    cache.delete("d")
+    cache.delete("missing")
+    assert len(cache) == 2
+    # Mở lại: đếm lại từ file, khớp với số dòng thật
+    assert len(SQLiteCache(path, ttl=3600, max_entries=3)) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_expired_entry_is_removed_from_count(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "c.sqlite3"), ttl=10, max_entries=10)
+    cache.set("k", 1)
+    now[0] += 11
+    assert cache.get("k") is None
+    assert len(cache) == 0
@@ -0,0 +1,102 @@
+import pytest
+
+from services import catalog_import
+from services.cache_service import SQLiteCache
+from services.name_index import NameIndex
+
+TOTAL_PAGES = 4
+PAGE_SIZE = 3
+
+
+def _fixture_page(page):
+    """Trang `page` của danh mục giả: PAGE_SIZE nhân vật, id liên tiếp."""
+    first = (page - 1) * PAGE_SIZE + 1
+    return {
+        "data": [
+            {"mal_id": mal_id, "name": f"Character {mal_id}", "favorites": 10000 - mal_id, "nicknames": []}
+            for mal_id in range(first, first + PAGE_SIZE)
+        ],
+        "pagination": {"has_next_page": page < TOTAL_PAGES, "last_visible_page": TOTAL_PAGES},
+    }
+
+
+def _catalog_handler(fail_once=()):
+    """Phục vụ các trang fixture; trang trong `fail_once` trả 429 ở lần đầu."""
+    failed = set()
+
+    def handler(path, query):
+        page = int(query["page"])
+        if page in fail_once and page not in failed:
+            failed.add(page)
+            return 429, {"status": 429, "message": "Too Many Requests"}, {"Retry-After": "0"}
+        return 200, _fixture_page(page)
+    return handler
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    index = NameIndex(str(tmp_path / "index.sqlite3"))
+    checkpoints = SQLiteCache(str(tmp_path / "checkpoints.sqlite3"), ttl=3600, max_entries=10)
+    return index, checkpoints
+
+
+def _fetched_pages(server):
+    return [int(query["page"]) for _, path, query in server.requests if path == "/v4/characters"]
+
+
+def test_resume_after_stop_continues_from_checkpoint(stub_server, workspace):
+    index, checkpoints = workspace
+    server = stub_server(_catalog_handler())
+    base_url = f"{server.url}/v4"
+
+    # Lần 1 dừng giữa chừng sau trang 2
+    state = catalog_import.import_catalog(base_url, max_pages=2, page_size=PAGE_SIZE,
+                                          index=index, checkpoints=checkpoints, retry_delay=0)
+    assert state == {"next_page": 3, "imported": 2 * PAGE_SIZE, "done": False}
+
+    # Lần 2 chạy tiếp từ checkpoint tới hết danh mục
+    state = catalog_import.import_catalog(base_url, page_size=PAGE_SIZE,
+                                          index=index, checkpoints=checkpoints, retry_delay=0)
+    assert state == {"next_page": TOTAL_PAGES + 1, "imported": TOTAL_PAGES * PAGE_SIZE, "done": True}
+    assert _fetched_pages(server) == [1, 2, 3, 4]   # không trang nào bị tải 2 lần
+    assert len(index) == TOTAL_PAGES * PAGE_SIZE
+
+    # Đã xong: chạy lại không gửi request nào
+    catalog_import.import_catalog(base_url, page_size=PAGE_SIZE, index=index, checkpoints=checkpoints)
+    assert _fetched_pages(server) == [1, 2, 3, 4]
+
+
+def test_failed_page_keeps_checkpoint(stub_server, workspace):
+    index, checkpoints = workspace
+    server = stub_server(lambda path, query: (500, {}) if query["page"] == "2" else (200, _fixture_page(1)))
+
+    with pytest.raises(RuntimeError):
+        catalog_import.import_catalog(f"{server.url}/v4", page_size=PAGE_SIZE, index=index,
+                                      checkpoints=checkpoints, retries=1, retry_delay=0)
+    assert checkpoints.get(catalog_import._checkpoint_key(f"{server.url}/v4"))["next_page"] == 2
+    assert _fetched_pages(server) == [1, 2, 2]
+
+
+def test_page_is_retried_after_429(stub_server, workspace):
+    index, checkpoints = workspace
+    server = stub_server(_catalog_handler(fail_once={2}))
+
+    state = catalog_import.import_catalog(f"{server.url}/v4", page_size=PAGE_SIZE, index=index,
+                                          checkpoints=checkpoints, retry_delay=0)
+    assert state["done"] and state["imported"] == TOTAL_PAGES * PAGE_SIZE
+    assert _fetched_pages(server) == [1, 2, 2, 3, 4]
+
+
+def test_reimport_does_not_rebuild_index(stub_server, workspace, monkeypatch):
+    index, checkpoints = workspace
+    server = stub_server(_catalog_handler())
+    base_url = f"{server.url}/v4"
+    catalog_import.import_catalog(base_url, page_size=PAGE_SIZE, index=index, checkpoints=checkpoints)
+
+    # Nhập lại từ đầu: chỉ favorites thay đổi, không được dựng lại cả chỉ mục
+    def fail(*args):
+        raise AssertionError("không được dựng lại toàn bộ chỉ mục")
+    monkeypatch.setattr(index, "reload", fail)
+    monkeypatch.setattr(index, "_rebuild", fail)
+    catalog_import.import_catalog(base_url, page_size=PAGE_SIZE, restart=True, index=index, checkpoints=checkpoints)
+    assert len(index) == TOTAL_PAGES * PAGE_SIZE
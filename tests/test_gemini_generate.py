@@ -0,0 +1,41 @@
+import gc
+
+import pytest
+
+from services import gemini_service
+from services.dispatcher import PriorityLimiter
+
+
+class _StreamModel:
+    def generate_content(self, contents, stream=False, **kwargs):
+        return iter(["a", "b"])
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = PriorityLimiter("Gemini", max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(gemini_service, "gemini_limiter", limiter)
+    monkeypatch.setitem(gemini_service._models, gemini_service.GEMINI_MODEL, _StreamModel())
+    return limiter
+
+
+def test_stream_dropped_before_first_chunk_releases_slot(limiter):
+    stream = gemini_service.gemini_generate("prompt", stream=True)
+    assert limiter.stats()["active"] == 1
+    del stream
+    gc.collect()
+    assert limiter.stats()["active"] == 0
+
+
+def test_stream_releases_slot_once(limiter):
+    stream = gemini_service.gemini_generate("prompt", stream=True)
+    assert list(stream) == ["a", "b"]
+    assert limiter.stats()["active"] == 0
+    stream.close()   # đã trả lượt: không trả thêm lần nữa
+    assert limiter.stats()["active"] == 0
+
+    # Lượt duy nhất vẫn dùng được cho lời gọi tiếp theo
+    stream = gemini_service.gemini_generate("prompt", stream=True)
+    assert limiter.stats()["active"] == 1
+    stream.close()
+    assert limiter.stats()["active"] == 0
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from services import gemini_service
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _SlowModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+
+        def chunks():
+            for text in ["Hồ sơ ", "nhân ", "vật."]:
+                time.sleep(0.05)
+                yield _Chunk(text)
+        return chunks()
+
+
+def test_concurrent_sessions_share_one_gemini_stream(monkeypatch):
+    model = _SlowModel()
+    monkeypatch.setitem(gemini_service._models, gemini_service.GEMINI_MODEL, model)
+    char_info = {"mal_id": 987654, "name": "Test", "about": "A test character."}
+
+    results = []
+    start = threading.Barrier(5)
+
+    def session():
+        start.wait()
+        results.append("".join(gemini_service.ai_analyze_profile_stream(char_info)))
+
+    threads = [threading.Thread(target=session) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert model.calls == 1
+    assert results == ["Hồ sơ nhân vật."] * 5
+
+    # Người xem sau nhận ngay từ cache, không gọi Gemini nữa
+    assert "".join(gemini_service.ai_analyze_profile_stream(char_info)) == "Hồ sơ nhân vật."
+    assert model.calls == 1
+
+
+class _RacyCache:
+    """Lần get đầu trả None, các lần sau trả bài đã có (stream khác vừa lưu xong giữa 2 lần kiểm tra)."""
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        return None if self.calls == 1 else self.text
+
+
+def test_suspended_reader_does_not_hold_the_stream_lock(monkeypatch):
+    monkeypatch.setitem(gemini_service._models, gemini_service.GEMINI_MODEL, _SlowModel())
+    monkeypatch.setattr(gemini_service, "_analysis_cache", _RacyCache("Bài đã lưu."))
+    stream = gemini_service.ai_analyze_profile_stream({"mal_id": 987655, "name": "Racy"})
+
+    assert next(stream) == "Bài đã lưu."
+    # Generator đang dừng ở yield: lock dùng chung phải còn trống cho session khác
+    assert gemini_service._profile_streams_lock.acquire(blocking=False)
+    gemini_service._profile_streams_lock.release()
+    stream.close()
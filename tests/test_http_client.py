@@ -0,0 +1,186 @@
+import time
+from bisect import bisect_left
+
+import pytest
+
+from services import http_client
+from services.cache_service import SQLiteCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _jikan_limiter(clock):
+    return http_client.RateLimiter(
+        http_client.SlidingWindowLimit(http_client.JIKAN_PER_SECOND, 1.0),
+        http_client.SlidingWindowLimit(http_client.JIKAN_PER_MINUTE, 60.0),
+        clock=clock,
+    )
+
+
+def _max_in_window(sent, window):
+    """Số request nhiều nhất trong 1 khoảng `window` giây bất kỳ."""
+    sent = sorted(sent)
+    return max(i - bisect_left(sent, t - window + 1e-9) + 1 for i, t in enumerate(sent))
+
+
+def test_burst_never_exceeds_jikan_limits():
+    clock = FakeClock()
+    limiter = _jikan_limiter(clock)
+    # 150 request đổ tới cùng lúc: xếp hàng, không cửa sổ 60s nào quá 60 request
+    sent = [clock.now + limiter.reserve() for _ in range(150)]
+    assert _max_in_window(sent, 60.0) == http_client.JIKAN_PER_MINUTE
+    assert _max_in_window(sent, 1.0) == http_client.JIKAN_PER_SECOND
+    assert sent == sorted(sent)   # thứ tự đến được giữ nguyên
+
+
+def test_steady_traffic_after_idle_stays_under_minute_limit():
+    clock = FakeClock()
+    limiter = _jikan_limiter(clock)
+    sent = []
+    # Nhàn rỗi lâu rồi 2 request/giây trong 3 phút (token bucket cũ cho ~119 request/phút)
+    clock.now = 1000.0
+    for step in range(360):
+        clock.now = max(clock.now, 1000.0 + step * 0.5)
+        delay = limiter.reserve()
+        clock.now += delay          # acquire(): luồng gọi chờ tới lượt rồi mới gửi
+        sent.append(clock.now)
+    assert _max_in_window(sent, 60.0) <= http_client.JIKAN_PER_MINUTE
+    assert _max_in_window(sent, 1.0) <= http_client.JIKAN_PER_SECOND
+
+
+def test_free_reports_remaining_budget():
+    clock = FakeClock()
+    limiter = _jikan_limiter(clock)
+    assert limiter.free() == http_client.JIKAN_PER_SECOND
+    limiter.reserve()
+    limiter.reserve()
+    assert limiter.free() == 1
+    clock.now = 1.5
+    assert limiter.free() == http_client.JIKAN_PER_SECOND
+
+
+def test_try_reserve_keeps_headroom_for_interactive_requests():
+    clock = FakeClock()
+    limiter = _jikan_limiter(clock)
+    # Việc chạy nền chỉ được dùng 2/3 mỗi giới hạn
+    assert limiter.try_reserve(1 / 3) and limiter.try_reserve(1 / 3)
+    assert not limiter.try_reserve(1 / 3)
+    # ... nên request của người dùng vẫn gửi được ngay
+    assert limiter.reserve() == 0
+    clock.now = 1.0
+    assert limiter.try_reserve(1 / 3)
+
+
+# ===== HttpCache =====
+FRESH_TTL = 60
+STALE_WINDOW = 600
+
+
+class _Origin:
+    """Server giả có ETag: trả 304 khi If-None-Match khớp, `status` ép mã lỗi."""
+
+    def __init__(self):
+        self.body = {"version": 1}
+        self.etag = '"v1"'
+        self.status = 200
+        self.server = None
+
+    def __call__(self, path, query):
+        if self.status != 200:
+            return self.status, {"error": "down"}
+        if self.server.request_headers[-1].get("If-None-Match") == self.etag:
+            return 304, b""
+        return 200, self.body, {"ETag": self.etag}
+
+
+@pytest.fixture
+def cached(tmp_path, stub_server):
+    origin = _Origin()
+    server = stub_server(origin)
+    server.origin = origin
+    origin.server = server
+    cache = http_client.HttpCache(
+        SQLiteCache(str(tmp_path / "http.sqlite3"), ttl=30 * 24 * 3600, max_entries=100),
+        default_ttl=FRESH_TTL, stale_while_revalidate=STALE_WINDOW,
+    )
+    return cache, server, f"{server.url}/anime"
+
+
+def _age(cache, url, seconds):
+    """Lùi thời điểm lưu của entry `seconds` giây (giả lập thời gian trôi)."""
+    key = cache.key(url, None)
+    entry = cache.store.get(key)
+    cache.store.set(key, {**entry, "stored_at": entry["stored_at"] - seconds})
+
+
+def _wait_background(cache):
+    deadline = time.monotonic() + 5
+    while cache._revalidating and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fresh_entry_is_served_without_request(cached):
+    cache, server, url = cached
+    assert cache.get(url).json() == {"version": 1}
+    response = cache.get(url)
+    assert response.json() == {"version": 1} and response.from_cache
+    assert len(server.requests) == 1
+    assert cache.stats() == {"fresh": 1, "stale": 0, "revalidated": 0, "miss": 1}
+
+
+def test_stale_entry_is_served_then_refreshed_in_background(cached):
+    cache, server, url = cached
+    cache.get(url)
+    server.origin.body, server.origin.etag = {"version": 2}, '"v2"'
+    _age(cache, url, FRESH_TTL + 1)
+
+    # Trả ngay bản cũ, làm mới ở nền bằng request có điều kiện
+    assert cache.get(url).json() == {"version": 1}
+    _wait_background(cache)
+    assert len(server.requests) == 2
+    assert server.request_headers[1]["If-None-Match"] == '"v1"'
+    assert cache.get(url).json() == {"version": 2}
+    assert cache.stats()["stale"] == 1 and cache.stats()["fresh"] == 1
+
+
+def test_304_extends_ttl_without_replacing_body(cached):
+    cache, server, url = cached
+    cache.get(url)
+    key = cache.key(url, None)
+    before = cache.store.get(key)
+    _age(cache, url, FRESH_TTL + STALE_WINDOW + 1)   # quá cửa sổ stale: hỏi lại ngay
+
+    response = cache.get(url)
+    assert response.status_code == 200 and response.json() == {"version": 1}
+    assert server.request_headers[1]["If-None-Match"] == '"v1"'
+    after = cache.store.get(key)
+    assert after["body"] == before["body"]
+    assert after["stored_at"] >= before["stored_at"]     # được gia hạn
+    assert cache.stats()["revalidated"] == 1
+
+    # Đã gia hạn: lần sau dùng luôn cache
+    cache.get(url)
+    assert len(server.requests) == 2
+    assert cache.stats()["fresh"] == 1
+
+
+def test_server_error_falls_back_to_stale_entry(cached):
+    cache, server, url = cached
+    cache.get(url)
+    _age(cache, url, FRESH_TTL + STALE_WINDOW + 1)
+    server.origin.status = 503
+
+    response = cache.get(url)
+    assert response.status_code == 200 and response.json() == {"version": 1}
+    assert response.from_cache
+    assert len(server.requests) == 2
+
+    # Lỗi 4xx thì không che đi
+    server.origin.status = 404
+    assert cache.get(url).status_code == 404
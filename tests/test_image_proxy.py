@@ -0,0 +1,103 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from services import image_proxy
+from services.cache_service import MemoryTTLCache
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 90)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def proxy(tmp_path, monkeypatch, stub_server):
+    """Image proxy dùng cache đĩa riêng, ảnh lấy từ server giả (/missing.png trả 404)."""
+    cache = image_proxy.DiskImageCache(str(tmp_path / "images"), str(tmp_path / "images.sqlite3"), 50 * 1024 * 1024)
+    monkeypatch.setattr(image_proxy, "_image_cache", cache)
+    monkeypatch.setattr(image_proxy, "_failed_downloads", MemoryTTLCache(ttl=60, max_entries=100))
+    image = _png(1200, 1800)
+    server = stub_server(lambda path, query: (404, b"not found") if path == "/missing.png"
+                         else (200, image, {"Content-Type": "image/png"}))
+    return server, cache
+
+
+def test_only_requested_variant_is_encoded(proxy):
+    server, cache = proxy
+    url = f"{server.url}/a.png"
+
+    path = image_proxy.get_thumbnail(url, "grid", timeout=10)
+    assert path == cache.path_for(image_proxy._cache_key(url, "grid"))
+    assert Image.open(path).width == image_proxy.IMAGE_VARIANTS["grid"]
+    # Chỉ có bản gốc đã chuẩn hóa + kích thước được hỏi
+    assert len(cache) == 2
+    assert cache.get(image_proxy._cache_key(url, "large"), record=False) is None
+
+    # Kích thước khác được tạo từ bản gốc đã lưu, không tải lại
+    large = image_proxy.get_thumbnail(url, "large", timeout=10)
+    assert Image.open(large).width == image_proxy.IMAGE_VARIANTS["large"]
+    assert len(cache) == 3
+    assert server.paths() == ["/a.png"]
+
+
+def test_failed_download_is_negative_cached(proxy):
+    server, cache = proxy
+    url = f"{server.url}/missing.png"
+
+    assert image_proxy.get_thumbnail(url, "grid", timeout=10) == url
+    assert image_proxy.get_thumbnail(url, "card", timeout=10) == url
+    image_proxy.prefetch_thumbnails([url], "large")
+    assert server.paths() == ["/missing.png"]
+    assert len(cache) == 0
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = image_proxy.DiskImageCache(str(tmp_path / "images"), str(tmp_path / "images.sqlite3"), 250,
+                                       access_write_interval=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+        time.sleep(0.01)
+    # 300 bytes > 250: bỏ ảnh lâu không dùng nhất (a)
+    assert cache.get("a") is None and not os.path.exists(cache.path_for("a"))
+    cache.get("b")          # b vừa được dùng, c thành ảnh lâu không dùng nhất
+    time.sleep(0.01)
+    cache.put("d", b"x" * 100)
+    assert cache.get("c", record=False) is None
+    assert cache.get("b", record=False) and cache.get("d", record=False)
+    assert cache.stats()["evictions"] == 2 and cache.stats()["bytes"] == 200
+
+
+def test_cold_images_do_not_block_render(proxy):
+    server, cache = proxy
+    url = f"{server.url}/cold.png"
+
+    # Chưa có trong cache: trả ngay URL gốc, ảnh được tải ở nền
+    assert image_proxy.get_thumbnail(url, "grid") == url
+    future = image_proxy._pending.get(image_proxy._cache_key(url, "grid"))
+    if future is not None:
+        future.result(timeout=10)
+    assert image_proxy.get_thumbnail(url, "grid") == cache.path_for(image_proxy._cache_key(url, "grid"))
+
+
+def test_access_time_writes_are_throttled(tmp_path, monkeypatch):
+    cache = image_proxy.DiskImageCache(str(tmp_path / "images"), str(tmp_path / "images.sqlite3"), 1000,
+                                       access_write_interval=60)
+    now = [1000.0]
+    monkeypatch.setattr(image_proxy.time, "time", lambda: now[0])
+    cache.put("a", b"x" * 10)
+
+    def accessed():
+        return cache._conn.execute("SELECT accessed FROM images WHERE key = 'a'").fetchone()[0]
+
+    now[0] += 30
+    assert cache.get("a")
+    assert accessed() == 1000.0    # mới dùng cách đây < 60s: không ghi lại
+    now[0] += 31
+    assert cache.get("a")
+    assert accessed() == 1061.0
+    assert cache.stats()["hits"] == 2
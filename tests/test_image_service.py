@@ -0,0 +1,40 @@
+import sqlite3
+
+from services.image_service import PerceptualHashIndex
+
+# Các hash cách nhau rất xa (> PHASH_MAX_DISTANCE bit) để không khớp nhầm
+HASHES = [0x0, 0xFFFF, 0xFFFF0000, 0xFFFF00000000, 0xFFFF000000000000]
+
+
+def test_index_is_bounded_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "phash.sqlite3")
+    index = PerceptualHashIndex(path, max_entries=3)
+    for i, image_hash in enumerate(HASHES[:3]):
+        index.add(image_hash, f"char{i}")
+    assert index.lookup(HASHES[0] | 0b1) == "char0"   # gần giống: dùng lại char0
+
+    index.add(HASHES[3], "char3")   # vượt 3: bỏ char1 (lâu không dùng nhất)
+    assert len(index) == 3
+    assert index.lookup(HASHES[1]) is None
+    assert index.lookup(HASHES[0]) == "char0"
+    assert index.stats()["evictions"] == 1
+
+    # SQLite cũng bị giới hạn, mở lại vẫn giữ đúng thứ tự LRU
+    reopened = PerceptualHashIndex(path, max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.lookup(HASHES[2]) is None
+    assert reopened.lookup(HASHES[3]) == "char3" and reopened.lookup(HASHES[0]) == "char0"
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM phash").fetchone()[0] == 2
+
+
+def test_opens_table_without_accessed_column(tmp_path):
+    path = str(tmp_path / "phash.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE phash (hash TEXT PRIMARY KEY, name TEXT NOT NULL, created REAL NOT NULL)")
+        conn.executemany("INSERT INTO phash VALUES (?, ?, ?)",
+                         [(format(h, "016x"), f"char{i}", float(i)) for i, h in enumerate(HASHES)])
+
+    index = PerceptualHashIndex(path, max_entries=3)
+    # Bỏ 2 hash tạo sớm nhất
+    assert [index.lookup(h) for h in HASHES] == [None, None, "char2", "char3", "char4"]
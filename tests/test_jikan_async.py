@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import http_client, jikan_async
+
+RESPONSE_DELAY = 0.2   # giây server giả "xử lý" mỗi request
+
+
+@pytest.fixture
+def jikan_stub(stub_server, monkeypatch):
+    """Server Jikan giả: /characters/{id}/full, id 429xx trả 429, id 500xx trả 500."""
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def handler(path, query):
+        mal_id = int(path.split("/")[-2])
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(RESPONSE_DELAY)
+        with lock:
+            in_flight["now"] -= 1
+        if 42900 <= mal_id < 43000:
+            return 429, {"status": 429}, {"Retry-After": "0"}
+        if 50000 <= mal_id < 50100:
+            return 500, {"status": 500}
+        return 200, {"data": {"mal_id": mal_id, "name": f"Stub {mal_id}", "about": "..."}}
+
+    server = stub_server(handler)
+    server.in_flight = in_flight
+    # Client prefetch riêng trỏ vào server giả, rate limiter mới (không dính lượt đã dùng ở test khác)
+    limiter = http_client.RateLimiter(
+        http_client.SlidingWindowLimit(http_client.JIKAN_PER_SECOND, 1.0),
+        http_client.SlidingWindowLimit(http_client.JIKAN_PER_MINUTE, 60.0),
+    )
+    client = jikan_async.AsyncJikanClient(f"{server.url}/v4", limiter=limiter, background=True)
+    server.limiter = limiter
+    asyncio.run_coroutine_threadsafe(client.open(), jikan_async._get_loop()).result()
+    monkeypatch.setattr(jikan_async, "_client", client)
+    yield server
+    asyncio.run_coroutine_threadsafe(client.aclose(), jikan_async._get_loop()).result()
+
+
+def test_prefetch_is_concurrent_and_leaves_budget_for_users(jikan_stub):
+    mal_ids = list(range(10001, 10001 + jikan_async.PREFETCH_TOP_N))
+    future = jikan_async.prefetch_character_details(mal_ids)
+    time.sleep(0.1)
+    # Người dùng bấm tìm kiếm giữa lúc prefetch: được gửi ngay, không xếp sau prefetch
+    assert jikan_stub.limiter.reserve() == 0
+    future.result(timeout=30)
+
+    assert len(jikan_stub.requests) == len(mal_ids)
+    # Đồng thời: nhiều request cùng đang chờ server
+    assert jikan_stub.in_flight["max"] > 1
+    # Prefetch chỉ dùng 2/3 giới hạn 3/s: không có 3 request prefetch nào trong cùng 1 giây
+    sent = sorted(t for t, _, _ in jikan_stub.requests)
+    assert all(later - earlier >= 0.95 for earlier, later in zip(sent, sent[2:]))
+
+    for mal_id in mal_ids:
+        assert jikan_async.get_character_details(mal_id)["name"] == f"Stub {mal_id}"
+
+
+def test_prefetch_gives_up_when_budget_is_low(jikan_stub, monkeypatch):
+    monkeypatch.setattr(jikan_async, "PREFETCH_MAX_WAIT", 0.5)
+    # Người dùng đã dùng gần hết 60 request/phút: prefetch không gửi gì
+    for _ in range(http_client.JIKAN_PER_MINUTE - 15):
+        jikan_stub.limiter.limits[1].commit(time.monotonic())
+    jikan_async.prefetch_character_details([13001, 13002]).result(timeout=30)
+    assert jikan_stub.requests == []
+    assert jikan_async.get_character_details(13001) is None
+
+
+def test_prefetch_skips_cached_and_pending_ids(jikan_stub):
+    jikan_async.prefetch_character_details([11001, 11002]).result(timeout=30)
+    assert jikan_async.prefetch_character_details([11001, 11002]) is None
+    assert len(jikan_stub.requests) == 2
+
+
+@pytest.mark.parametrize("mal_id", [42901, 50001])
+def test_get_details_falls_back_on_error(jikan_stub, mal_id):
+    jikan_async.prefetch_character_details([mal_id, 12001])
+    # Lỗi (429 / 500): trả None để giao diện dùng dữ liệu của lưới
+    assert jikan_async.get_character_details(mal_id, wait=10) is None
+    assert jikan_async.get_character_details(12001, wait=10)["name"] == "Stub 12001"
+
+    requested = [path for path in jikan_stub.paths() if path == f"/v4/characters/{mal_id}/full"]
+    assert len(requested) == 1   # prefetch không thử lại khi bị 429
+    # Lỗi không được cache: lần sau prefetch lại
+    assert jikan_async.get_character_details(mal_id) is None
+    retry = jikan_async.prefetch_character_details([mal_id])
+    assert retry is not None
+    retry.result(timeout=30)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from services.json_stream import iter_json_array_objects
+
+RECOMMENDATIONS = [
+    {"title": "Dune", "reason": "Epic {sci-fi} with \"spice\"", "genre": "Sci-Fi", "search_keyword": "Dune"},
+    {"title": "Monster", "reason": "C:\\path\\ and [brackets] } ]", "genre": "Thriller", "search_keyword": "Monster"},
+    {"title": "Mushishi", "tags": ["calm", {"nested": [1, 2]}], "genre": "Slice of Life", "search_keyword": "Mushishi"},
+]
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_objects_split_across_chunks(size):
+    text = "```json\n" + json.dumps(RECOMMENDATIONS, indent=2) + "\n```"
+    assert list(iter_json_array_objects(_chunks(text, size))) == RECOMMENDATIONS
+
+
+def test_escapes_split_at_chunk_boundary():
+    # Dấu \ ở cuối 1 chunk, ký tự được escape (", }) ở đầu chunk sau
+    chunks = ['[{"a": "x\\', '"}', '", "b": "{\\', '\\', '}"}', "]"]
+    assert list(iter_json_array_objects(chunks)) == [{"a": 'x"}', "b": "{\\}"}]
+
+
+def test_objects_are_yielded_before_array_ends():
+    def stream():
+        yield '[{"title": "A"}, '
+        yield '{"title": "B"'
+        raise AssertionError("không được đọc thêm trước khi trả object đầu tiên")
+
+    objects = iter_json_array_objects(stream())
+    assert next(objects) == {"title": "A"}
+
+
+def test_malformed_object_is_skipped(capsys):
+    chunks = ['[{"title": "A"}, {"title": "B",}, {"title": oops}, {"title": "C"}]']
+    assert list(iter_json_array_objects(chunks)) == [{"title": "A"}, {"title": "C"}]
+    assert "Bỏ qua object JSON lỗi" in capsys.readouterr().out
+
+
+def test_non_object_elements_are_ignored():
+    assert list(iter_json_array_objects(['[1, "two", [3], {"x": 4}, null]'])) == [{"x": 4}]
+
+
+@pytest.mark.parametrize("text", [
+    '[{"title": "A"}, {"title": "B", "reason": "cut off',
+    '[{"title": "A"}, {"title": "B"',
+    '[{"title": "A"},',
+])
+def test_truncated_input_yields_complete_objects_only(text):
+    assert list(iter_json_array_objects(_chunks(text, 4))) == [{"title": "A"}]
+
+
+@pytest.mark.parametrize("text", ["", "Sorry, I can't help with that.", "{\"title\": \"not in array\"}"])
+def test_input_without_array_yields_nothing(text):
+    assert list(iter_json_array_objects([text])) == []
+
+
+def test_stops_at_end_of_outer_array():
+    chunks = ['[{"title": "A"}] trailing text [{"title": "ignored"}]']
+    assert list(iter_json_array_objects(chunks)) == [{"title": "A"}]
@@ -0,0 +1,42 @@
+from services import books_service, media_service
+
+
+def test_books_api_error_is_not_cached_as_miss(stub_server, monkeypatch):
+    responses = [(503, {"error": "backend unavailable"})]
+
+    def handler(path, query):
+        if responses:
+            return responses.pop()
+        return 200, {"items": [{"id": "vol1", "volumeInfo": {"title": "Dune", "authors": ["Frank Herbert"]}}]}
+
+    server = stub_server(handler)
+    monkeypatch.setattr(books_service, "GOOGLE_BOOKS_URL", f"{server.url}/books/v1/volumes")
+
+    # Lần 1 Google Books lỗi: không có kết quả nhưng cũng không được ghi vào _miss_cache
+    assert media_service.search_content_by_keyword("Dune miss test", "books") is None
+    # Lần 2 API đã ổn: phải gọi lại và tìm thấy sách
+    book = media_service.search_content_by_keyword("Dune miss test", "books")
+    assert book is not None and book.title == "Dune"
+    assert len(server.requests) == 2
+
+
+def _anime(mal_id, score, start):
+    return {"mal_id": mal_id, "score": score, "aired": {"from": start}}
+
+
+def test_match_any_keeps_requested_order(monkeypatch):
+    by_genre = {
+        1: [_anime(1, 9.1, "2020-01-01"), _anime(2, 8.0, "2015-01-01"), _anime(3, 7.0, None)],
+        2: [_anime(4, 8.5, "2023-04-01"), _anime(2, 8.0, "2015-01-01"), _anime(5, 8.0, "2010-01-01")],
+    }
+    monkeypatch.setattr(media_service, "_fetch_media_by_genres",
+                        lambda content_type, genre_ids, order_by, sort, limit: by_genre[genre_ids[0]])
+
+    def ids(order_by, sort, limit=10):
+        results = media_service.search_media_by_genres("anime", [1, 2], order_by, sort, limit=limit, match_any=True)
+        return [item["mal_id"] for item in results]
+
+    # Điểm bằng nhau (2 và 5): 2 có trong cả 2 thể loại nên RRF xếp trước
+    assert ids("score", "desc") == [1, 4, 2, 5, 3]
+    assert ids("start_date", "desc") == [4, 1, 2, 5, 3]
+    assert ids("start_date", "asc", limit=3) == [5, 2, 1]
@@ -0,0 +1,92 @@
+import pytest
+
+from services.name_index import NameIndex
+
+
+def _char(mal_id, name, favorites=10, nicknames=()):
+    return {
+        "mal_id": mal_id,
+        "name": name,
+        "name_kanji": None,
+        "nicknames": list(nicknames),
+        "favorites": favorites,
+        "images": {"jpg": {"image_url": f"https://example.com/{mal_id}.jpg"}},
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NameIndex(str(tmp_path / "index.sqlite3"))
+
+
+def test_favorites_change_updates_in_place_without_reload(index, monkeypatch):
+    index.add_many([_char(1, "Naruto Uzumaki"), _char(2, "Hinata Hyuga")])
+    monkeypatch.setattr(index, "reload", lambda: pytest.fail("reload() trên đường tìm kiếm"))
+    monkeypatch.setattr(index, "_rebuild", lambda records: pytest.fail("_rebuild() trên đường tìm kiếm"))
+
+    index.add_many([_char(1, "Naruto Uzumaki", favorites=999)])
+
+    assert index.resolve("Naruto Uzumaki")["favorites"] == 999
+
+
+def test_rename_reindexes_only_that_character(index, monkeypatch):
+    index.add_many([_char(1, "Naruto Uzumaki"), _char(2, "Hinata Hyuga")])
+    monkeypatch.setattr(index, "reload", lambda: pytest.fail("reload() khi chỉ 1 nhân vật đổi tên"))
+
+    index.add_many([_char(2, "Hinata Uzumaki", nicknames=["Byakugan Princess"])])
+
+    assert index.resolve("Hinata Uzumaki")["mal_id"] == 2
+    assert index.resolve("Hinata Hyuga") is None
+    assert [r["mal_id"] for _, r in index.search("Byak")] == [2]
+    assert index.resolve("Naruto Uzumaki")["mal_id"] == 1
+
+
+def test_updates_are_persisted(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    index = NameIndex(path)
+    index.add_many([_char(1, "Naruto Uzumaki")])
+    index.add_many([_char(1, "Naruto Uzumaki", favorites=500)])
+
+    reopened = NameIndex(path)
+    assert reopened.resolve("Naruto Uzumaki")["favorites"] == 500
+
+
+@pytest.fixture
+def popular_index(index):
+    index.add_many([
+        _char(17, "Naruto Uzumaki", favorites=80000),
+        _char(417, "Lelouch Lamperouge", favorites=160000, nicknames=["Lelouch vi Britannia", "Zero"]),
+        _char(2671, "Sakura Kinomoto", favorites=20000),
+        _char(145, "Sakura Haruno", favorites=15000),
+    ])
+    return index
+
+
+@pytest.mark.parametrize("name", [
+    "Kushina Uzumaki", "Himawari Uzumaki", "Boruto Uzumaki",
+    "Sakura Matou", "Nunnally Lamperouge", "Rolo Lamperouge",
+])
+def test_same_surname_does_not_resolve_to_another_character(popular_index, name):
+    assert popular_index.resolve(name) is None
+
+
+def test_resolve_matches_the_right_family_member(popular_index):
+    popular_index.add_many([_char(1271, "Kushina Uzumaki", favorites=9000)])
+    assert popular_index.resolve("Kushina Uzumaki")["mal_id"] == 1271
+    assert popular_index.resolve("Naruto Uzumaki")["mal_id"] == 17
+    assert popular_index.resolve("Sakura Haruno")["mal_id"] == 145
+
+
+@pytest.mark.parametrize("name, mal_id", [
+    ("Uzumaki Naruto", 17),           # họ trước tên
+    ("Naruto-kun Uzumaki", 17),       # kính ngữ
+    ("Lelouch vi Britannia", 417),    # biệt danh
+    ("Sakura Kinomotoo", 2671),       # cách viết romaji khác
+])
+def test_resolve_accepts_spelling_variants(popular_index, name, mal_id):
+    assert popular_index.resolve(name)["mal_id"] == mal_id
+
+
+def test_resolve_ambiguous_first_name_falls_back(popular_index):
+    # "Sakura" trùng 2 nhân vật, không khớp hoàn toàn key nào: để Jikan tìm
+    assert popular_index.resolve("Sakura") is None
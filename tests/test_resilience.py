@@ -0,0 +1,94 @@
+import pytest
+
+from services.dispatcher import AdmissionError
+from services.resilience import CircuitBreaker, call_with_retry
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+def _fail(timeout):
+    raise Unavailable("down")
+
+
+def _reject(timeout):
+    raise AdmissionError("queue full")
+
+
+def test_queue_rejection_does_not_reset_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    with pytest.raises(Unavailable):
+        call_with_retry(_fail, breaker=breaker, retries=0)
+    with pytest.raises(Unavailable):
+        call_with_retry(_fail, breaker=breaker, retries=0)
+
+    with pytest.raises(AdmissionError):
+        call_with_retry(_reject, breaker=breaker, retries=2)
+
+    assert breaker.snapshot()["consecutive_failures"] == 2
+    assert breaker.snapshot()["state"] == "closed"
+
+
+def test_queue_rejection_does_not_close_half_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    with pytest.raises(Unavailable):
+        call_with_retry(_fail, breaker=breaker, retries=0)
+    assert breaker.snapshot()["state"] == "open"
+
+    # reset_timeout=0: lời gọi kế tiếp là lời gọi thử (half_open) nhưng bị hàng đợi từ chối
+    with pytest.raises(AdmissionError):
+        call_with_retry(_reject, breaker=breaker, retries=0)
+    assert breaker.snapshot()["state"] == "half_open"
+    assert breaker.snapshot()["consecutive_failures"] == 1
+
+    # Lượt thử được trả lại: lời gọi thật tiếp theo vẫn được đi qua
+    assert call_with_retry(lambda timeout: "ok", breaker=breaker, retries=0) == "ok"
+    assert breaker.snapshot()["state"] == "closed"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_open_half_open_closed(capsys):
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.snapshot()["state"] == "closed"
+    breaker.record_failure()
+    assert breaker.snapshot()["state"] == "open"
+
+    clock.now += 29
+    assert not breaker.allow()
+    assert breaker.snapshot()["retry_in"] == 1.0
+
+    clock.now += 1
+    assert breaker.allow()                 # lời gọi thử
+    assert breaker.snapshot()["state"] == "half_open"
+    assert not breaker.allow()             # chỉ 1 lời gọi thử cùng lúc
+
+    breaker.record_success()
+    assert breaker.snapshot() == {
+        "name": "test", "state": "closed", "consecutive_failures": 0, "retry_in": 0.0, "rejected": 2,
+    }
+    log = capsys.readouterr().out
+    assert "test: closed -> open" in log
+    assert "test: open -> half_open" in log
+    assert "test: half_open -> closed" in log
+
+
+def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.snapshot()["state"] == "open"
+    assert breaker.snapshot()["retry_in"] == 30.0
+    assert not breaker.allow()
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from services.singleflight import SingleFlight, single_flight
+
+WAITERS = 4
+
+
+class Upstream:
+    """Hàm upstream giả: chặn tới khi `release` được set (rồi chạy thêm `duration` giây), đếm số lần bị gọi."""
+
+    def __init__(self, errors=(), duration=0.0):
+        self.calls = 0
+        self.duration = duration
+        self.release = threading.Event()
+        self.errors = list(errors)   # lỗi ném ra ở các lần gọi đầu
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        self.release.wait(5)
+        time.sleep(self.duration)
+        if error is not None:
+            raise error
+        return f"result:{value}"
+
+
+def _run_concurrently(flight, upstream, count):
+    """Gọi flight.do từ `count` luồng; luồng đầu là leader, chờ cả nhóm vào hàng rồi mới cho upstream chạy."""
+    outcomes = [None] * count
+
+    def caller(i):
+        try:
+            outcomes[i] = ("ok", flight.do("key", upstream, "x"))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(count)]
+    threads[0].start()
+    while flight.in_flight() == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight._calls["key"].waiters < count - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    upstream.release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    flight, upstream = SingleFlight(), Upstream()
+    outcomes = _run_concurrently(flight, upstream, WAITERS + 1)
+    assert upstream.calls == 1
+    assert outcomes == [("ok", "result:x")] * (WAITERS + 1)
+    assert flight.in_flight() == 0
+
+
+def test_leader_error_reaches_waiters_without_retry():
+    error = RuntimeError("upstream down")
+    flight, upstream = SingleFlight(retries=0), Upstream(errors=[error])
+    outcomes = _run_concurrently(flight, upstream, WAITERS + 1)
+    assert upstream.calls == 1
+    assert outcomes == [("error", error)] * (WAITERS + 1)
+
+
+def test_waiters_retry_once_after_leader_error():
+    error = RuntimeError("transient")
+    # duration: lượt gọi lại kéo dài đủ để mọi luồng chờ cùng nhập vào
+    flight, upstream = SingleFlight(retries=1), Upstream(errors=[error], duration=0.2)
+    outcomes = _run_concurrently(flight, upstream, WAITERS + 1)
+    # Leader nhận lỗi; các luồng chờ mở đúng 1 lượt gọi mới (cũng gộp chung) và nhận kết quả
+    assert outcomes[0] == ("error", error)
+    assert outcomes[1:] == [("ok", "result:x")] * WAITERS
+    assert upstream.calls == 2
+
+
+def test_waiters_get_error_when_retry_also_fails():
+    errors = [RuntimeError("first"), RuntimeError("second")]
+    flight, upstream = SingleFlight(retries=1), Upstream(errors=list(errors), duration=0.2)
+    outcomes = _run_concurrently(flight, upstream, WAITERS + 1)
+    assert outcomes[0] == ("error", errors[0])
+    assert outcomes[1:] == [("error", errors[1])] * WAITERS
+    assert upstream.calls == 2
+
+
+def test_failed_key_does_not_stay_stuck():
+    flight = SingleFlight()
+    upstream = Upstream(errors=[ValueError("bad")])
+    upstream.release.set()
+    with pytest.raises(ValueError):
+        flight.do("key", upstream, "x")
+    assert flight.in_flight() == 0
+    # Lời gọi sau chạy lại upstream, không nhận lại lỗi cũ
+    assert flight.do("key", upstream, "x") == "result:x"
+    assert upstream.calls == 2
+
+
+def test_decorator_groups_by_key():
+    upstream = Upstream()
+    upstream.release.set()
+    fetch = single_flight(lambda value: f"k:{value}")(upstream)
+    assert fetch("a") == "result:a" and fetch("b") == "result:b"
+    assert fetch.flight.in_flight() == 0
+    assert upstream.calls == 2